@@ -1,33 +1,53 @@
 """Appium tools for LangChain integration."""
 
 import logging
+from typing import Optional
 
 # Create logger for appium_tools package
 logger = logging.getLogger(__name__)
 
-from .session import appium_driver, get_driver_status
-from .interaction import find_element, click_element, get_text, press_keycode, double_tap, send_keys
-from .navigation import take_screenshot, scroll_element, get_page_source, scroll_to_element, wait_short_loading
+from .session import appium_driver, get_driver_status, SessionPool, attach_session, apply_fast_start_profile, use_driver
+from .transport import PooledTransport
+from .interaction import find_element, find_elements, click_element, get_text, press_keycode, double_tap, long_press, pinch, drag_and_drop, send_keys
+from .navigation import take_screenshot, scroll_element, get_page_source, scroll_to_element, wait_short_loading, wait_for_element, check_screen_changed, get_page_changes
 from .app_management import get_current_app, activate_app, terminate_app, list_apps
 from .device_info import get_device_info, is_locked, get_orientation, set_orientation
+from .fleet import fleet_sweep, format_fleet_table
+from .scheduler import AgentTask, Device, DeviceScheduler
+from .governor import OutputGovernor
+from .router import ToolRouter
+from .model_router import ModelRouter
+from .loop_guard import LoopGuard
 
 __all__ = [
     # Session
     "appium_driver",
     "get_driver_status",
+    "SessionPool",
+    "attach_session",
+    "apply_fast_start_profile",
+    "use_driver",
+    "PooledTransport",
     # Interaction
     "find_element",
+    "find_elements",
     "click_element",
     "get_text",
     "press_keycode",
     "double_tap",
+    "long_press",
+    "pinch",
+    "drag_and_drop",
     "send_keys",
     # Navigation
     "take_screenshot",
     "scroll_element",
     "get_page_source",
+    "get_page_changes",
     "scroll_to_element",
     "wait_short_loading",
+    "wait_for_element",
+    "check_screen_changed",
     # App Management
     "get_current_app",
     "activate_app",
@@ -38,29 +58,48 @@ __all__ = [
     "is_locked",
     "get_orientation",
     "set_orientation",
+    # Fleet
+    "fleet_sweep",
+    "format_fleet_table",
+    "AgentTask",
+    "Device",
+    "DeviceScheduler",
+    "OutputGovernor",
+    "ToolRouter",
+    "ModelRouter",
+    "LoopGuard",
     # Main function
     "appium_tools",
 ]
 
 
-def appium_tools():
+def appium_tools(output_governor: Optional[OutputGovernor] = None):
     """LangChain エージェント用の全Appiumツールリストを返す。
     
+    Args:
+        output_governor: 指定した場合、各ツールの出力をトークン予算内に収めてからLLMに返す
+    
     Returns:
-        list: LangChain BaseTool のリスト（19個のAppium自動化ツール）
+        list: LangChain BaseTool のリスト（27個のAppium自動化ツール）
     """
-    return [
+    tools = [
         get_driver_status,
         find_element,
+        find_elements,
         click_element,
         get_text,
         press_keycode,
         double_tap,
+        long_press,
+        pinch,
+        drag_and_drop,
         send_keys,
         take_screenshot,
         scroll_element,
         get_page_source,
+        get_page_changes,
         scroll_to_element,
+        check_screen_changed,
         get_current_app,
         activate_app,
         terminate_app,
@@ -70,4 +109,8 @@ def appium_tools():
         get_orientation,
         set_orientation,
         wait_short_loading,
+        wait_for_element,
     ]
+    if output_governor is not None:
+        return output_governor.wrap_all(tools)
+    return tools
@@ -1,13 +1,28 @@
 """App management tools for Appium."""
 
 import logging
+import re
+from typing import Dict, List, Optional, Tuple
 from langchain.tools import tool
 from selenium.common.exceptions import InvalidSessionIdException
+from .session import with_session_recovery, note_foreground_app, note_app_terminated
+from .hierarchy import invalidate_screen
 
 logger = logging.getLogger(__name__)
 
+# list_apps の出力上限（LLMコンテキストに流し込む文字数の上限）
+MAX_LIST_APPS_CHARS = 4000
+
+# セッションごとのパッケージ一覧キャッシュ
+# {session_id: {(third_party_only, state): [(package, version_code), ...]}}
+_package_cache: Dict[str, Dict[Tuple[bool, str], List[Tuple[str, str]]]] = {}
+
+# セッションごとのversionNameキャッシュ {session_id: {package: version_name}}
+_version_name_cache: Dict[str, Dict[str, str]] = {}
+
 
 @tool
+@with_session_recovery
 def get_current_app() -> str:
     """Get the package name and activity of the currently running app.
     
@@ -25,6 +40,7 @@ def get_current_app() -> str:
     try:
         current_package = driver.current_package
         current_activity = driver.current_activity
+        note_foreground_app(current_package)
         logger.info(f"🔧 Current app: {current_package}/{current_activity}")
         return f"Current app package: {current_package}\nCurrent activity: {current_activity}"
     except InvalidSessionIdException:
@@ -33,6 +49,7 @@ def get_current_app() -> str:
 
 
 @tool
+@with_session_recovery
 def activate_app(app_id: str) -> str:
     """Activate (launch) an app by its package name.
     
@@ -52,6 +69,8 @@ def activate_app(app_id: str) -> str:
     
     try:
         driver.activate_app(app_id)
+        invalidate_screen(driver)
+        note_foreground_app(app_id)
         logger.info(f"🔧 Activated app: {app_id}")
         return f"Successfully activated app: {app_id}"
     except InvalidSessionIdException:
@@ -60,6 +79,7 @@ def activate_app(app_id: str) -> str:
 
 
 @tool
+@with_session_recovery
 def terminate_app(app_id: str) -> str:
     """Terminate (force stop) an app by its package name.
     
@@ -79,6 +99,8 @@ def terminate_app(app_id: str) -> str:
     
     try:
         result = driver.terminate_app(app_id)
+        invalidate_screen(driver)
+        note_app_terminated(app_id)
         logger.info(f"🔧 Terminated app: {app_id}, result: {result}")
         return f"Successfully terminated app: {app_id} (result: {result})"
     except InvalidSessionIdException:
@@ -86,12 +108,108 @@ def terminate_app(app_id: str) -> str:
         raise
 
 
+def invalidate_app_cache(session_id: Optional[str] = None) -> None:
+    """Drop cached package lists (call after installing or uninstalling apps).
+
+    Args:
+        session_id: Session to invalidate. If omitted, all sessions are cleared.
+    """
+    if session_id is None:
+        _package_cache.clear()
+        _version_name_cache.clear()
+    else:
+        _package_cache.pop(session_id, None)
+        _version_name_cache.pop(session_id, None)
+
+
+def _shell_stdout(driver, command: str, args: List[str]) -> str:
+    """Run `mobile: shell` and return stdout as a string."""
+    result = driver.execute_script("mobile: shell", {
+        "command": command,
+        "args": args
+    })
+    # Handle both dict and string responses
+    if isinstance(result, dict):
+        return result.get("stdout", "").strip()
+    return str(result).strip()
+
+
+def _fetch_packages(driver, third_party_only: bool, state: str) -> List[Tuple[str, str]]:
+    """Fetch (package, versionCode) pairs using device-side pm filters, with per-session caching."""
+    session_cache = _package_cache.setdefault(driver.session_id, {})
+    key = (third_party_only, state)
+    if key in session_cache:
+        logger.debug("🔧 Using cached package list for %s", key)
+        return session_cache[key]
+
+    args = ["list", "packages", "--show-versioncode"]
+    if third_party_only:
+        args.append("-3")
+    if state == "enabled":
+        args.append("-e")
+    elif state == "disabled":
+        args.append("-d")
+    output = _shell_stdout(driver, "pm", args)
+
+    # Parse lines (format: "package:com.example.app versionCode:123")
+    packages = []
+    for line in output.split("\n"):
+        if not line.startswith("package:"):
+            continue
+        name, _, version_code = line[len("package:"):].strip().partition(" versionCode:")
+        packages.append((name, version_code.strip()))
+    packages.sort()
+    session_cache[key] = packages
+    return packages
+
+
+def _fetch_version_names(driver, package_names: List[str]) -> Dict[str, str]:
+    """Fetch versionName for the given packages in a single bulk shell call."""
+    session_cache = _version_name_cache.setdefault(driver.session_id, {})
+    missing = [name for name in package_names if name not in session_cache]
+    if missing:
+        script = (
+            f"for p in {' '.join(missing)}; do "
+            "echo \"@$p\"; dumpsys package $p | grep -m1 versionName=; done"
+        )
+        output = _shell_stdout(driver, script, [])
+        current = None
+        for line in output.split("\n"):
+            line = line.strip()
+            if line.startswith("@"):
+                current = line[1:]
+                session_cache[current] = ""
+            elif current and line.startswith("versionName="):
+                session_cache[current] = line[len("versionName="):]
+    return {name: session_cache.get(name, "") for name in package_names}
+
+
 @tool
-def list_apps() -> str:
-    """List all installed apps on the device.
+@with_session_recovery
+def list_apps(
+    third_party_only: bool = False,
+    state: str = "all",
+    name_filter: str = "",
+    use_regex: bool = False,
+    include_versions: bool = False,
+    offset: int = 0,
+    limit: int = 50,
+    refresh: bool = False,
+) -> str:
+    """List installed apps on the device with filtering and pagination.
     
+    Args:
+        third_party_only: Only list user-installed (non-system) apps (default: False)
+        state: "all", "enabled", or "disabled" (default: "all")
+        name_filter: Only list packages whose name contains this text (case-insensitive)
+        use_regex: Treat name_filter as a regular expression (default: False)
+        include_versions: Include versionName/versionCode for the listed page (default: False)
+        offset: Index of the first package to return (default: 0)
+        limit: Maximum number of packages to return (default: 50)
+        refresh: Ignore the cached package list and query the device again (default: False)
+        
     Returns:
-        A list of installed app package names, or an error message
+        A page of installed app package names, or an error message
         
     Raises:
         ValueError: If driver is not initialized
@@ -101,23 +219,50 @@ def list_apps() -> str:
     if not driver:
         raise ValueError("Driver is not initialized")
     
+    if state not in ("all", "enabled", "disabled"):
+        return f"❌ Invalid state: '{state}'. Use 'all', 'enabled', or 'disabled'."
+    
+    if name_filter and use_regex:
+        try:
+            pattern = re.compile(name_filter, re.IGNORECASE)
+        except re.error as e:
+            return f"❌ Invalid regex '{name_filter}': {e}"
+        matches = pattern.search
+    else:
+        needle = name_filter.lower()
+        matches = lambda name: needle in name.lower()
+    
     try:
-        # Get list of installed packages using adb shell
-        result = driver.execute_script("mobile: shell", {
-            "command": "pm",
-            "args": ["list", "packages"]
-        })
-        # Handle both dict and string responses
-        if isinstance(result, dict):
-            packages = result.get("stdout", "").strip()
-        else:
-            packages = str(result).strip()
+        if refresh:
+            invalidate_app_cache(driver.session_id)
+        packages = _fetch_packages(driver, third_party_only, state)
+        if name_filter:
+            packages = [p for p in packages if matches(p[0])]
+        
+        offset = max(0, offset)
+        limit = max(1, limit)
+        page = packages[offset:offset + limit]
+        version_names = _fetch_version_names(driver, [name for name, _ in page]) if include_versions else {}
+        
+        lines = []
+        used_chars = 0
+        for name, version_code in page:
+            if include_versions:
+                line = f"{name} (versionName={version_names.get(name) or '?'}, versionCode={version_code or '?'})"
+            else:
+                line = name
+            if used_chars + len(line) + 1 > MAX_LIST_APPS_CHARS:
+                break
+            lines.append(line)
+            used_chars += len(line) + 1
         
-        # Parse package names (format: "package:com.example.app")
-        package_list = [line.replace("package:", "") for line in packages.split("\n") if line.startswith("package:")]
-        logger.info(f"🔧 Found {len(package_list)} installed apps")
-        logger.debug(f"🔧 Installed apps: {package_list}")
-        return f"Installed apps ({len(package_list)}):\n" + "\n".join(package_list)
+        shown_end = offset + len(lines)
+        logger.info(f"🔧 Found {len(packages)} installed apps, returning {offset}-{shown_end}")
+        header = f"Installed apps ({len(packages)} matching, showing {offset + 1 if lines else 0}-{shown_end}):"
+        footer = ""
+        if shown_end < len(packages):
+            footer = f"\n... {len(packages) - shown_end} more. Call list_apps with offset={shown_end} to see more."
+        return header + "\n" + "\n".join(lines) + footer
     except InvalidSessionIdException:
         # Session expired - re-raise to caller
         raise
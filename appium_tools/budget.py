@@ -0,0 +1,215 @@
+"""Per-query and per-session token, cost, time and tool-call budgets enforced from callbacks."""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from langchain_core.callbacks.base import BaseCallbackHandler
+from .token_counter import OpenAIPricingCalculator, TiktokenCountCallback, count_messages_tokens, count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetExceededError(RuntimeError):
+    """Raised from a callback to abort the agent when a budget is exceeded.
+
+    Attributes:
+        scope: "query" or "session"
+        limit: Name of the exceeded limit (max_tokens, max_cost_usd, max_seconds, max_tool_calls)
+        usage: {"query": {...}, "session": {...}} at the time of the breach (partial report)
+    """
+
+    def __init__(self, scope: str, limit: str, value: float, maximum: float, usage: Dict[str, Dict[str, Any]]) -> None:
+        self.scope = scope
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+        self.usage = usage
+        super().__init__(f"{scope} budget exceeded: {limit} {value} > {maximum}")
+
+
+class Budget:
+    """Limits for one scope (a query or a whole session); None means unlimited."""
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        max_cost_usd: Optional[float] = None,
+        max_seconds: Optional[float] = None,
+        max_tool_calls: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            max_tokens: Input + output tokens
+            max_cost_usd: Cost in USD (OpenAIPricingCalculator prices)
+            max_seconds: Wall time since the scope started
+            max_tool_calls: Number of tool calls
+        """
+        self.max_tokens = max_tokens
+        self.max_cost_usd = max_cost_usd
+        self.max_seconds = max_seconds
+        self.max_tool_calls = max_tool_calls
+
+    def first_breach(self, usage: Dict[str, Any]) -> Optional[Tuple[str, float, float]]:
+        """(limit, value, maximum) of the first exceeded limit, or None."""
+        for limit, key in (
+            ("max_tokens", "tokens"),
+            ("max_cost_usd", "cost_usd"),
+            ("max_seconds", "seconds"),
+            ("max_tool_calls", "tool_calls"),
+        ):
+            maximum = getattr(self, limit)
+            if maximum is not None and usage[key] > maximum:
+                return limit, usage[key], maximum
+        return None
+
+
+class BudgetGuard(BaseCallbackHandler):
+    """Callback that aborts the agent when a query or session budget is exceeded.
+
+    - on_llm_start: estimates the prompt with tiktoken and refuses the call if the
+      estimate would exceed max_tokens / max_cost_usd (the call is never sent)
+    - on_llm_end: adds the actual usage from the response
+    - on_tool_start: counts tool calls
+    - every event: checks the wall time
+
+    A breach raises BudgetExceededError (raise_error=True makes LangChain propagate it),
+    which carries the usage so far as a partial report.
+
+    Example:
+        guard = BudgetGuard(query=Budget(max_cost_usd=0.05, max_tool_calls=30),
+                            session=Budget(max_cost_usd=1.0))
+        with guard.track_query():
+            try:
+                await agent.ainvoke(..., config=RunnableConfig(callbacks=[token_counter, guard]))
+            except BudgetExceededError as e:
+                print(guard.format_usage())
+    """
+
+    raise_error = True
+
+    def __init__(
+        self,
+        query: Optional[Budget] = None,
+        session: Optional[Budget] = None,
+        model: str = "gpt-4.1",
+    ) -> None:
+        """
+        Args:
+            query: Budget per track_query() block
+            session: Budget for the lifetime of the guard (until reset())
+            model: Model used for the pre-call estimate when the request does not name one
+        """
+        self.budgets = {"query": query, "session": session}
+        self.model = model
+        self.breaches: List[Dict[str, Any]] = []
+        self._usage = {"query": self._new_usage(), "session": self._new_usage()}
+
+    @staticmethod
+    def _new_usage() -> Dict[str, Any]:
+        return {"tokens": 0, "cost_usd": 0.0, "tool_calls": 0, "llm_calls": 0, "start": time.time()}
+
+    @contextmanager
+    def track_query(self):
+        """Start a new query scope (usage of the previous query is discarded)."""
+        self._usage["query"] = self._new_usage()
+        yield self
+
+    def reset(self) -> None:
+        """Start a new session (and query) scope."""
+        self._usage = {"query": self._new_usage(), "session": self._new_usage()}
+        self.breaches.clear()
+
+    def get_usage(self) -> Dict[str, Dict[str, Any]]:
+        """Usage of each scope: tokens, cost_usd, seconds, tool_calls, llm_calls."""
+        now = time.time()
+        return {
+            scope: {
+                "tokens": usage["tokens"],
+                "cost_usd": round(usage["cost_usd"], 6),
+                "seconds": round(now - usage["start"], 2),
+                "tool_calls": usage["tool_calls"],
+                "llm_calls": usage["llm_calls"],
+            }
+            for scope, usage in self._usage.items()
+        }
+
+    def _check(self, extra_tokens: int = 0, extra_cost: float = 0.0) -> None:
+        usage = self.get_usage()
+        for scope, budget in self.budgets.items():
+            if budget is None:
+                continue
+            projected = dict(usage[scope], tokens=usage[scope]["tokens"] + extra_tokens,
+                             cost_usd=round(usage[scope]["cost_usd"] + extra_cost, 6))
+            breach = budget.first_breach(projected)
+            if breach:
+                limit, value, maximum = breach
+                self.breaches.append({"scope": scope, "limit": limit, "value": value, "maximum": maximum})
+                logger.warning(f"🔧 {scope} budget exceeded: {limit} {value} > {maximum}")
+                raise BudgetExceededError(scope, limit, value, maximum, usage)
+
+    def _check_estimate(self, prompt_tokens: Callable[[str], int], invocation_params: Dict[str, Any]) -> None:
+        model = invocation_params.get("model_name") or invocation_params.get("model") or self.model
+        estimate = prompt_tokens(model)
+        if invocation_params.get("tools"):
+            estimate += count_tokens(json.dumps(invocation_params["tools"], ensure_ascii=False, default=str), model)
+        cost = OpenAIPricingCalculator.calculate_cost(model, estimate, 0)["total_cost"]
+        self._check(extra_tokens=estimate, extra_cost=cost)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        """Refuse the call if the estimated prompt would exceed a budget."""
+        self._check_estimate(
+            lambda model: sum(count_tokens(prompt, model) for prompt in prompts),
+            kwargs.get("invocation_params") or {},
+        )
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any) -> None:
+        """Same as on_llm_start, counting chat messages with the memoized per-message counts."""
+        self._check_estimate(
+            lambda model: sum(count_messages_tokens(batch, model) for batch in messages),
+            kwargs.get("invocation_params") or {},
+        )
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        """Add the actual usage of the call, then check the budgets."""
+        try:
+            input_tokens, output_tokens, cached_tokens = TiktokenCountCallback._extract_token_usage(response)
+        except ValueError:
+            # No usage in the response (e.g. some fake or local models): only count the call
+            input_tokens = output_tokens = cached_tokens = 0
+        model = TiktokenCountCallback._response_model_name(response) or self.model
+        cost = OpenAIPricingCalculator.calculate_cost(model, input_tokens, output_tokens, cached_tokens)["total_cost"]
+        for usage in self._usage.values():
+            usage["tokens"] += input_tokens + output_tokens
+            usage["cost_usd"] += cost
+            usage["llm_calls"] += 1
+        self._check()
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        """Count the tool call, then check the budgets (the tool does not run on a breach)."""
+        for usage in self._usage.values():
+            usage["tool_calls"] += 1
+        self._check()
+
+    def format_usage(self, width: int = 70) -> str:
+        """Usage against the limits of each scope."""
+        usage = self.get_usage()
+        lines = ["=" * width, "🧾 BUDGET:", "=" * width]
+        for scope, budget in self.budgets.items():
+            current = usage[scope]
+            limits = budget or Budget()
+
+            def show(value, maximum, fmt="{}"):
+                return fmt.format(value) + (f" / {fmt.format(maximum)}" if maximum is not None else "")
+
+            lines.append(
+                f"{scope}: tokens {show(current['tokens'], limits.max_tokens)}, "
+                f"cost {show(current['cost_usd'], limits.max_cost_usd, '${:.6f}')}, "
+                f"time {show(current['seconds'], limits.max_seconds, '{}s')}, "
+                f"tool calls {show(current['tool_calls'], limits.max_tool_calls)}"
+            )
+        for breach in self.breaches:
+            lines.append(f"⛔ {breach['scope']} {breach['limit']}: {breach['value']} > {breach['maximum']}")
+        lines.append("=" * width)
+        return "\n".join(lines)
@@ -3,11 +3,14 @@
 import logging
 from langchain.tools import tool
 from selenium.common.exceptions import InvalidSessionIdException
+from .session import with_session_recovery
+from .hierarchy import invalidate_screen
 
 logger = logging.getLogger(__name__)
 
 
 @tool
+@with_session_recovery
 def get_device_info() -> str:
     """Get comprehensive device information including model, Android version, display, battery, etc.
     
@@ -70,6 +73,7 @@ def get_device_info() -> str:
 
 
 @tool
+@with_session_recovery
 def is_locked() -> str:
     """Check if the device screen is locked.
     
@@ -94,6 +98,7 @@ def is_locked() -> str:
 
 
 @tool
+@with_session_recovery
 def get_orientation() -> str:
     """Get the current screen orientation.
     
@@ -118,6 +123,7 @@ def get_orientation() -> str:
 
 
 @tool
+@with_session_recovery
 def set_orientation(orientation: str) -> str:
     """Set the screen orientation.
     
@@ -140,6 +146,7 @@ def set_orientation(orientation: str) -> str:
     
     try:
         driver.orientation = orientation.upper()
+        invalidate_screen(driver)
         logger.info(f"🔧 Set orientation to: {orientation}")
         return f"Successfully set orientation to: {orientation}"
     except InvalidSessionIdException:
@@ -0,0 +1,134 @@
+"""Concurrent fan-out of read-only tools across a device fleet."""
+
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+from langchain.tools import BaseTool
+from selenium.common.exceptions import InvalidSessionIdException
+from .session import use_driver
+from .app_management import get_current_app
+from .device_info import get_device_info, is_locked, get_orientation
+
+logger = logging.getLogger(__name__)
+
+# Health-check tools run by fleet_sweep() by default; none of them change device state
+FLEET_READ_ONLY_TOOLS: Tuple[BaseTool, ...] = (get_device_info, is_locked, get_orientation, get_current_app)
+
+ToolCall = Union[BaseTool, Tuple[BaseTool, Dict[str, Any]]]
+
+
+def _run_device(driver_instance, calls: Sequence[Tuple[BaseTool, Dict[str, Any]]]) -> Tuple[Dict[str, str], Dict[str, float]]:
+    """Run the tools one after another on one device (UiAutomator2 serializes commands anyway)."""
+    results: Dict[str, str] = {}
+    latencies: Dict[str, float] = {}
+    with use_driver(driver_instance):
+        for tool, args in calls:
+            start = time.perf_counter()
+            try:
+                results[tool.name] = str(tool.invoke(args))
+            except InvalidSessionIdException:
+                results[tool.name] = "❌ Session expired"
+            except Exception as e:
+                results[tool.name] = f"❌ {type(e).__name__}: {e}"
+            latencies[tool.name] = round((time.perf_counter() - start) * 1000, 1)
+    return results, latencies
+
+
+async def fleet_sweep(
+    drivers: Union[Mapping[str, Any], Iterable[Any]],
+    tools: Optional[Sequence[ToolCall]] = None,
+    max_concurrency: int = 8,
+    timeout: float = 30.0,
+) -> List[Dict[str, Any]]:
+    """Run read-only tools on many devices concurrently.
+
+    Devices run in parallel (at most `max_concurrency` at a time), the tools of one
+    device run sequentially. A sweep therefore takes roughly as long as the slowest
+    device instead of the sum over all devices.
+
+    Args:
+        drivers: {label: driver} or an iterable of drivers (labelled by session id)
+        tools: Tools to run; a BaseTool or (BaseTool, args). Defaults to FLEET_READ_ONLY_TOOLS.
+            Only pass tools that do not change device state.
+        max_concurrency: Maximum number of devices queried at the same time
+        timeout: Per-device timeout in seconds. A timed-out device is reported as such;
+            its in-flight command is not interrupted, but it no longer holds a
+            concurrency slot, so the remaining devices are still queried.
+
+    Returns:
+        One row per device, in input order:
+        {"device", "session_id", "ok", "latency_ms", "results": {tool: output},
+         "tool_latency_ms": {tool: ms}, "error"}
+
+    Example:
+        rows = await fleet_sweep({"pixel-1": driver1, "pixel-2": driver2})
+        print(format_fleet_table(rows))
+    """
+    labelled = list(drivers.items()) if isinstance(drivers, Mapping) else [(d.session_id, d) for d in drivers]
+    calls = [(t, {}) if isinstance(t, BaseTool) else t for t in (tools or FLEET_READ_ONLY_TOOLS)]
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def sweep_one(executor: ThreadPoolExecutor, label: str, driver_instance) -> Dict[str, Any]:
+        row: Dict[str, Any] = {
+            "device": label,
+            "session_id": getattr(driver_instance, "session_id", None),
+            "ok": False,
+            "latency_ms": None,
+            "results": {},
+            "tool_latency_ms": {},
+            "error": None,
+        }
+        async with semaphore:
+            start = time.perf_counter()
+            context = contextvars.copy_context()
+            future = loop.run_in_executor(executor, context.run, _run_device, driver_instance, calls)
+            try:
+                row["results"], row["tool_latency_ms"] = await asyncio.wait_for(future, timeout)
+                row["ok"] = not any(output.startswith("❌") for output in row["results"].values())
+            except asyncio.TimeoutError:
+                row["error"] = f"Timed out after {timeout}s"
+            except Exception as e:
+                row["error"] = f"{type(e).__name__}: {e}"
+            row["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return row
+
+    start = time.perf_counter()
+    # One worker per device: a timed-out device keeps its thread busy until its command returns,
+    # so a pool sized to max_concurrency would queue the next devices behind it while their
+    # timeouts are already running. The semaphore still limits how many devices start at once.
+    executor = ThreadPoolExecutor(max_workers=max(1, len(labelled)), thread_name_prefix="fleet")
+    try:
+        rows = await asyncio.gather(*(sweep_one(executor, label, d) for label, d in labelled))
+    finally:
+        # Do not block on timed-out commands still running in the executor
+        executor.shutdown(wait=False, cancel_futures=True)
+    logger.info(
+        f"🔧 Fleet sweep: {sum(r['ok'] for r in rows)}/{len(rows)} devices ok "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return list(rows)
+
+
+def format_fleet_table(rows: List[Dict[str, Any]], width: int = 40) -> str:
+    """Render fleet_sweep() rows as a plain-text table (one line per device)."""
+    if not rows:
+        return "(no devices)"
+    tool_names: List[str] = []
+    for row in rows:
+        for name in row["results"]:
+            if name not in tool_names:
+                tool_names.append(name)
+    header = ["device", "ok", "latency_ms"] + tool_names
+    lines = [" | ".join(header)]
+    for row in rows:
+        cells = [row["device"], "✅" if row["ok"] else "❌", str(row["latency_ms"])]
+        for name in tool_names:
+            output = row["results"].get(name, row["error"] or "")
+            output = " ".join(output.split())
+            cells.append(output if len(output) <= width else output[:width - 1] + "…")
+        lines.append(" | ".join(cells))
+    return "\n".join(lines)
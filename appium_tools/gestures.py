@@ -0,0 +1,138 @@
+"""W3C Actions gesture engine.
+
+Every gesture is sent as a single W3C Actions request (or a single `mobile:` gesture
+command), so the device receives the whole pointer sequence at once with exact timing
+instead of one HTTP round-trip per tap.
+"""
+
+import logging
+import math
+from typing import Dict, List, Optional, Tuple
+from selenium.common.exceptions import InvalidSessionIdException, WebDriverException
+from selenium.webdriver.common.actions import interaction
+from selenium.webdriver.common.actions.action_builder import ActionBuilder
+from selenium.webdriver.common.actions.mouse_button import MouseButton
+from selenium.webdriver.common.actions.pointer_input import PointerInput
+
+logger = logging.getLogger(__name__)
+
+Point = Tuple[int, int]
+
+
+def rect_center(rect: Dict[str, int]) -> Point:
+    """Center point of a {"x", "y", "width", "height"} rect."""
+    return (rect["x"] + rect["width"] // 2, rect["y"] + rect["height"] // 2)
+
+
+def _perform(driver, fingers: List[List[Tuple[str, Optional[Point], int]]]) -> None:
+    """Send one W3C Actions request with one touch pointer per finger.
+
+    Each finger is a list of steps: ("move", (x, y), duration_ms), ("down", None, 0),
+    ("up", None, 0) or ("pause", None, duration_ms).
+    """
+    inputs = [PointerInput(interaction.POINTER_TOUCH, f"finger{i + 1}") for i in range(len(fingers))]
+    builder = ActionBuilder(driver, mouse=inputs[0])
+    for pointer in inputs[1:]:
+        builder.devices.append(pointer)
+
+    for pointer, steps in zip(inputs, fingers):
+        for kind, point, duration_ms in steps:
+            if kind == "move":
+                pointer.create_pointer_move(duration=duration_ms, x=int(point[0]), y=int(point[1]), origin="viewport")
+            elif kind == "down":
+                pointer.create_pointer_down(button=MouseButton.LEFT)
+            elif kind == "up":
+                pointer.create_pointer_up(MouseButton.LEFT)
+            elif kind == "pause":
+                pointer.create_pause(duration_ms / 1000)
+    builder.perform()
+
+
+def tap(driver, point: Point, hold_ms: int = 50) -> None:
+    """Single tap at a point."""
+    _perform(driver, [[("move", point, 0), ("down", None, 0), ("pause", None, hold_ms), ("up", None, 0)]])
+
+
+def double_tap(driver, point: Optional[Point] = None, element=None, interval_ms: int = 100) -> None:
+    """Double tap an element or a point in one command.
+
+    Uses `mobile: doubleClickGesture` (UiAutomator2) and falls back to a single W3C
+    Actions sequence with `interval_ms` between the taps if the command is unavailable.
+
+    Args:
+        driver: The Appium driver
+        point: (x, y) to tap; required if element is not given
+        element: WebElement to tap (its center is used)
+        interval_ms: Pause between the two taps in the W3C fallback
+    """
+    args = {"elementId": element.id} if element is not None else {"x": int(point[0]), "y": int(point[1])}
+    try:
+        driver.execute_script("mobile: doubleClickGesture", args)
+        return
+    except InvalidSessionIdException:
+        raise
+    except WebDriverException as e:
+        logger.debug("🔧 mobile: doubleClickGesture unavailable, using W3C actions: %s", e)
+    if point is None:
+        point = rect_center(element.rect)
+    _perform(driver, [[
+        ("move", point, 0), ("down", None, 0), ("pause", None, 50), ("up", None, 0),
+        ("pause", None, interval_ms),
+        ("down", None, 0), ("pause", None, 50), ("up", None, 0),
+    ]])
+
+
+def long_press(driver, point: Point, duration_ms: int = 1000) -> None:
+    """Press and hold at a point for duration_ms."""
+    _perform(driver, [[("move", point, 0), ("down", None, 0), ("pause", None, duration_ms), ("up", None, 0)]])
+
+
+def swipe(driver, start: Point, end: Point, duration_ms: int = 300, fingers: int = 1, finger_spacing: int = 80) -> None:
+    """Swipe from start to end with one or more parallel fingers.
+
+    Args:
+        driver: The Appium driver
+        start: (x, y) start point of the first finger
+        end: (x, y) end point of the first finger
+        duration_ms: Duration of the move
+        fingers: Number of fingers; extra fingers are offset perpendicular to the swipe
+        finger_spacing: Distance in pixels between adjacent fingers
+    """
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length = math.hypot(dx, dy) or 1.0
+    # Unit vector perpendicular to the swipe direction
+    px, py = -dy / length, dx / length
+    sequences = []
+    for i in range(fingers):
+        offset = (i - (fingers - 1) / 2) * finger_spacing
+        s = (start[0] + px * offset, start[1] + py * offset)
+        e = (end[0] + px * offset, end[1] + py * offset)
+        sequences.append([("move", s, 0), ("down", None, 0), ("move", e, duration_ms), ("up", None, 0)])
+    _perform(driver, sequences)
+
+
+def pinch(driver, center: Point, start_distance: int, end_distance: int, duration_ms: int = 400) -> None:
+    """Two-finger pinch around a center point (end > start zooms in, end < start zooms out).
+
+    Args:
+        driver: The Appium driver
+        center: (x, y) center of the gesture
+        start_distance: Initial distance between the fingers in pixels
+        end_distance: Final distance between the fingers in pixels
+        duration_ms: Duration of the move
+    """
+    cx, cy = center
+    sequences = []
+    for direction in (-1, 1):
+        s = (cx + direction * start_distance / 2, cy)
+        e = (cx + direction * end_distance / 2, cy)
+        sequences.append([("move", s, 0), ("down", None, 0), ("move", e, duration_ms), ("up", None, 0)])
+    _perform(driver, sequences)
+
+
+def drag(driver, start: Point, end: Point, hold_ms: int = 600, duration_ms: int = 800) -> None:
+    """Long-press at start, then drag to end and release (drag and drop)."""
+    _perform(driver, [[
+        ("move", start, 0), ("down", None, 0), ("pause", None, hold_ms),
+        ("move", end, duration_ms), ("pause", None, 100), ("up", None, 0),
+    ]])
@@ -0,0 +1,213 @@
+"""Token budgets for tool outputs before they are returned to the LLM."""
+
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from langchain.tools import BaseTool
+from langchain_core.tools import StructuredTool
+from .hierarchy import HierarchySnapshot, compact_hierarchy
+from .token_counter import APPROX_CHARS_PER_TOKEN, count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Prefix of get_page_source / get_page_changes outputs that carry raw XML
+_PAGE_SOURCE_PREFIXES = ("Page source retrieved successfully:\n", "Screen changed completely. Page source retrieved successfully:\n")
+
+# tool name -> (token budget, strategy)
+DEFAULT_BUDGETS: Dict[str, Tuple[int, str]] = {
+    "get_page_source": (6000, "xml"),
+    "get_page_changes": (3000, "lines"),
+    "list_apps": (1500, "lines"),
+    "get_device_info": (800, "lines"),
+    # A base64 screenshot is unreadable as text; only say that it was taken
+    "take_screenshot": (64, "omit"),
+}
+
+
+def _fit_chars(text: str, budget: int, count: Callable[[str], int]) -> int:
+    """Largest prefix length (in characters) of text that fits in budget tokens."""
+    low, high = 0, len(text)
+    # Start from the average chars/token of this text, then bisect
+    guess = min(high, budget * max(1, len(text) // max(1, count(text))))
+    if count(text[:guess]) <= budget:
+        low = guess
+    else:
+        high = guess
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def truncate_head(text: str, budget: int, count: Callable[[str], int]) -> str:
+    """Keep the beginning of the output."""
+    notice = "\n... [output truncated to fit the token budget]"
+    keep = _fit_chars(text, max(0, budget - count(notice)), count)
+    return text[:keep] + notice
+
+
+def truncate_head_tail(text: str, budget: int, count: Callable[[str], int]) -> str:
+    """Keep the beginning and the end of the output (errors and summaries are often at the end)."""
+    notice = "\n... [middle of output truncated to fit the token budget] ...\n"
+    half = max(0, budget - count(notice)) // 2
+    head = text[:_fit_chars(text, half, count)]
+    tail_reversed = text[::-1]
+    tail = tail_reversed[:_fit_chars(tail_reversed, half, count)][::-1]
+    return head + notice + tail
+
+
+def truncate_lines(text: str, budget: int, count: Callable[[str], int]) -> str:
+    """Keep whole lines from the top and report how many were dropped."""
+    lines = text.splitlines()
+    kept: List[str] = []
+    used = 0
+    for index, line in enumerate(lines):
+        tokens = count(line + "\n")
+        # Reserve room for the footer
+        if used + tokens > budget - 16:
+            return "\n".join(kept) + f"\n... {len(lines) - index} more lines omitted (token budget)"
+        kept.append(line)
+        used += tokens
+    return text
+
+
+def summarize_xml(text: str, budget: int, count: Callable[[str], int]) -> str:
+    """Reduce a page-source XML dump to labelled/interactive elements, then truncate by lines."""
+    for prefix in _PAGE_SOURCE_PREFIXES:
+        if text.startswith(prefix):
+            try:
+                snapshot = HierarchySnapshot(text[len(prefix):])
+            except Exception:
+                break
+            max_chars = budget * APPROX_CHARS_PER_TOKEN
+            # Shrink the character cap until the summary fits the budget in real tokens
+            while max_chars > 0:
+                compact, omitted = compact_hierarchy(snapshot, max_chars)
+                footer = f"\n... {omitted} more elements omitted" if omitted else ""
+                summary = (
+                    "Page source retrieved successfully (reduced to labelled/interactive elements "
+                    f"to fit the token budget):\n{compact}{footer}"
+                )
+                if count(summary) <= budget:
+                    return summary
+                max_chars = int(max_chars * 0.8)
+            break
+    return truncate_lines(text, budget, count)
+
+
+def omit(text: str, budget: int, count: Callable[[str], int]) -> str:
+    """Replace the output with a short note."""
+    return f"[output omitted: {len(text)} characters, {count(text)} tokens over the budget]"
+
+
+STRATEGIES: Dict[str, Callable[[str, int, Callable[[str], int]], str]] = {
+    "head": truncate_head,
+    "head_tail": truncate_head_tail,
+    "lines": truncate_lines,
+    "xml": summarize_xml,
+    "omit": omit,
+}
+
+
+class OutputGovernor:
+    """Measures every tool output with tiktoken and enforces per-tool token budgets.
+
+    Outputs over budget are reduced with the tool's strategy (see STRATEGIES) before the
+    LLM sees them. Every call is recorded in `history` for token accounting.
+
+    Example:
+        governor = OutputGovernor(model="gpt-4.1", budgets={"get_page_source": (4000, "xml")})
+        agent = create_agent(model="gpt-4.1", tools=appium_tools(output_governor=governor))
+        print(governor.get_stats())
+    """
+
+    def __init__(
+        self,
+        model: str = "gpt-4.1",
+        default_budget: int = 2000,
+        default_strategy: str = "head_tail",
+        budgets: Optional[Dict[str, Tuple[int, str]]] = None,
+    ) -> None:
+        """
+        Args:
+            model: Model whose tokenizer is used for counting
+            default_budget: Token budget for tools without an explicit budget
+            default_strategy: Strategy for tools without an explicit budget
+            budgets: {tool_name: (token_budget, strategy)}, merged over DEFAULT_BUDGETS
+        """
+        self.model = model
+        self.default_budget = default_budget
+        self.default_strategy = default_strategy
+        self.budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+        for _, strategy in list(self.budgets.values()) + [(default_budget, default_strategy)]:
+            if strategy not in STRATEGIES:
+                raise ValueError(f"Unknown strategy: {strategy}. Use one of {', '.join(STRATEGIES)}")
+        self.history: List[Dict[str, Any]] = []
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def apply(self, tool_name: str, output: Any) -> Any:
+        """Enforce the tool's budget on one output (non-string outputs pass through)."""
+        if not isinstance(output, str):
+            return output
+        budget, strategy = self.budgets.get(tool_name, (self.default_budget, self.default_strategy))
+        raw_tokens = self.count(output)
+        governed = output
+        if raw_tokens > budget:
+            governed = STRATEGIES[strategy](output, budget, self.count)
+            logger.info(f"🔧 {tool_name} output reduced from {raw_tokens} tokens ({strategy}, budget {budget})")
+        self.history.append({
+            "tool": tool_name,
+            "raw_tokens": raw_tokens,
+            "returned_tokens": self.count(governed) if governed is not output else raw_tokens,
+            "budget": budget,
+            "strategy": strategy if governed is not output else None,
+        })
+        return governed
+
+    def wrap(self, tool: BaseTool) -> BaseTool:
+        """Return a copy of the tool whose output goes through apply()."""
+        func = getattr(tool, "func", None)
+        if func is None:
+            return tool
+
+        def governed(**kwargs: Any) -> Any:
+            return self.apply(tool.name, func(**kwargs))
+
+        return StructuredTool.from_function(
+            func=governed,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            return_direct=tool.return_direct,
+        )
+
+    def wrap_all(self, tools: Sequence[BaseTool]) -> List[BaseTool]:
+        return [self.wrap(tool) for tool in tools]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-tool token totals before and after the budgets.
+
+        Returns:
+            {"calls", "raw_tokens", "returned_tokens", "saved_tokens",
+             "tools": {name: {"calls", "raw_tokens", "returned_tokens", "reduced"}}}
+        """
+        tools: Dict[str, Dict[str, int]] = {}
+        for record in self.history:
+            stats = tools.setdefault(record["tool"], {"calls": 0, "raw_tokens": 0, "returned_tokens": 0, "reduced": 0})
+            stats["calls"] += 1
+            stats["raw_tokens"] += record["raw_tokens"]
+            stats["returned_tokens"] += record["returned_tokens"]
+            stats["reduced"] += 1 if record["strategy"] else 0
+        raw = sum(r["raw_tokens"] for r in self.history)
+        returned = sum(r["returned_tokens"] for r in self.history)
+        return {
+            "calls": len(self.history),
+            "raw_tokens": raw,
+            "returned_tokens": returned,
+            "saved_tokens": raw - returned,
+            "tools": tools,
+        }
@@ -0,0 +1,403 @@
+"""Parsed page-source hierarchy and per-screen geometry cache."""
+
+import logging
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from .locators import find_element, parse_simple_xpath
+
+logger = logging.getLogger(__name__)
+
+_BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+# Locator strategy -> page-source attribute
+_STRATEGY_ATTRIBUTES = {
+    "id": "resource-id",
+    "accessibility id": "content-desc",
+    "accessibility_id": "content-desc",
+    "class name": "class",
+    "class_name": "class",
+}
+
+# Attributes indexed for exact-match lookups
+_INDEXED_ATTRIBUTES = ("resource-id", "text", "content-desc", "class")
+
+# {session_id: HierarchySnapshot} - latest parsed page source of the current screen
+_snapshots: Dict[str, "HierarchySnapshot"] = {}
+
+# {session_id: {(by, value): rect}} - element rects resolved on the current screen
+_rect_cache: Dict[str, Dict[Tuple[str, str], Dict[str, int]]] = {}
+
+# {session_id: HierarchySnapshot} - last hierarchy returned to the agent (survives actions; diff baseline)
+_last_seen: Dict[str, "HierarchySnapshot"] = {}
+
+# {session_id: int} - incremented by every screen-changing action (identifies "the same screen")
+_screen_epochs: Dict[str, int] = {}
+
+# Characters fed to the incremental XML parser at a time
+_PARSE_CHUNK_SIZE = 64 * 1024
+
+# Attributes shown for a node in a hierarchy diff
+_DIFF_ATTRIBUTES = ("resource-id", "text", "content-desc", "checked", "selected", "enabled", "focused", "bounds")
+
+
+def parse_bounds(bounds: str) -> Optional[Dict[str, int]]:
+    """Convert a UiAutomator2 bounds attribute ("[x1,y1][x2,y2]") to a rect dict.
+
+    Args:
+        bounds: The bounds attribute value
+
+    Returns:
+        {"x", "y", "width", "height"} or None if the value cannot be parsed
+    """
+    match = _BOUNDS_RE.match(bounds or "")
+    if not match:
+        return None
+    x1, y1, x2, y2 = (int(v) for v in match.groups())
+    return {"x": x1, "y": y1, "width": x2 - x1, "height": y2 - y1}
+
+
+def iter_nodes(source, chunk_size: int = _PARSE_CHUNK_SIZE) -> Iterator[Tuple[int, str, Dict[str, str]]]:
+    """Stream (depth, tag, attrs) for every element of a page source in document order.
+
+    The XML is fed to an incremental parser in chunks and each element is detached
+    from its parent once its end tag is seen, so no element tree is ever built:
+    memory stays bounded by the nesting depth, not by the size of the dump.
+
+    Args:
+        source: XML page source (str or bytes)
+        chunk_size: Characters fed to the parser at a time
+
+    Raises:
+        ET.ParseError: If the source is not well-formed XML
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    stack: List[ET.Element] = []
+    skip_root = False
+
+    def drain():
+        nonlocal skip_root
+        for event, element in parser.read_events():
+            if event == "start":
+                if not stack and element.tag == "hierarchy":
+                    skip_root = True
+                else:
+                    yield len(stack) - skip_root, element.tag, dict(element.attrib)
+                stack.append(element)
+            else:
+                stack.pop()
+                element.clear()
+                if stack:
+                    stack[-1].remove(element)
+
+    for offset in range(0, len(source), chunk_size):
+        parser.feed(source[offset:offset + chunk_size])
+        yield from drain()
+    parser.close()
+    yield from drain()
+
+
+def _matches(actual: Optional[str], op: str, literal: str) -> bool:
+    if actual is None:
+        return False
+    if op == "contains":
+        return literal in actual
+    if op == "starts-with":
+        return actual.startswith(literal)
+    return actual == literal
+
+
+class HierarchySnapshot:
+    """Indexed view of one page-source dump.
+
+    Nodes are plain dicts: {"tag": str, "attrs": dict, "rect": dict or None, "depth": int}.
+    """
+
+    def __init__(self, source: str) -> None:
+        """
+        Args:
+            source: XML page source returned by driver.page_source
+        """
+        self.nodes: List[Dict[str, Any]] = []
+        self._index: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for depth, tag, attrs in iter_nodes(source):
+            self._add_node(tag, attrs, depth)
+
+    def _add_node(self, tag: str, attrs: Dict[str, str], depth: int = 0) -> None:
+        node = {"tag": tag, "attrs": attrs, "rect": parse_bounds(attrs.get("bounds", "")), "depth": depth}
+        self.nodes.append(node)
+        for attr in _INDEXED_ATTRIBUTES:
+            value = attrs.get(attr)
+            if value:
+                self._index.setdefault((attr, value), []).append(node)
+
+    def find_all(self, by: str, value: str) -> Optional[List[Dict[str, Any]]]:
+        """Return nodes matching a locator, or None if the locator cannot be evaluated locally.
+
+        Supported: id, accessibility_id, class_name and XPath of the form
+        //tag[@attr='value' and contains(@attr, 'value') and starts-with(@attr, 'value') ...].
+        """
+        attr = _STRATEGY_ATTRIBUTES.get(by)
+        if attr is not None:
+            tag, conditions = "*", [(attr, "=", value)]
+        elif by == "xpath":
+            parsed = parse_simple_xpath(value)
+            if parsed is None:
+                return None
+            tag, conditions = parsed
+        else:
+            return None
+
+        # An indexed equality narrows the candidates before the remaining conditions are checked
+        candidates = self.nodes
+        for attr, op, literal in conditions:
+            if op == "=" and literal and attr in _INDEXED_ATTRIBUTES:
+                candidates = self._index.get((attr, literal), [])
+                break
+        return [
+            n for n in candidates
+            if (tag == "*" or n["tag"] == tag) and all(_matches(n["attrs"].get(a), op, literal) for a, op, literal in conditions)
+        ]
+
+    def find_unique(self, by: str, value: str) -> Optional[Dict[str, Any]]:
+        """Return the single node matching a locator, or None if not exactly one matches."""
+        matches = self.find_all(by, value)
+        if matches and len(matches) == 1:
+            return matches[0]
+        return None
+
+    def keyed_nodes(self) -> Dict[Tuple[str, ...], Dict[str, Any]]:
+        """Nodes keyed by a stable identity: class + resource-id + bounds.
+
+        Text and state are deliberately not part of the key, so a node whose text or
+        checked state changed is reported as changed rather than removed + added.
+        Identical keys are disambiguated by their order of appearance.
+        """
+        keyed = {}
+        occurrences: Dict[Tuple[str, str, str], int] = {}
+        for node in self.nodes:
+            attrs = node["attrs"]
+            base = (attrs.get("class", node["tag"]), attrs.get("resource-id", ""), attrs.get("bounds", ""))
+            occurrence = occurrences.get(base, 0)
+            occurrences[base] = occurrence + 1
+            keyed[base + (str(occurrence),)] = node
+        return keyed
+
+
+def describe_node(node: Dict[str, Any]) -> str:
+    """Compact one-line description of a node for diffs: <class attr="..." ...>."""
+    attrs = node["attrs"]
+    parts = [attrs.get("class", node["tag"]).rsplit(".", 1)[-1]]
+    for attr in _DIFF_ATTRIBUTES:
+        value = attrs.get(attr)
+        # Skip empty values and the default state flags
+        if not value or (attr in ("checked", "selected", "focused") and value == "false") or (attr == "enabled" and value == "true"):
+            continue
+        parts.append(f'{attr}="{value}"')
+    return "<" + " ".join(parts) + ">"
+
+
+def diff_snapshots(old: HierarchySnapshot, new: HierarchySnapshot) -> Dict[str, List]:
+    """Compute added/removed/changed nodes between two hierarchies.
+
+    Returns:
+        {"added": [node, ...], "removed": [node, ...],
+         "changed": [(old_node, new_node, {attr: (old, new)}), ...]}
+    """
+    old_nodes = old.keyed_nodes()
+    new_nodes = new.keyed_nodes()
+    added = [node for key, node in new_nodes.items() if key not in old_nodes]
+    removed = [node for key, node in old_nodes.items() if key not in new_nodes]
+    changed = []
+    for key, new_node in new_nodes.items():
+        old_node = old_nodes.get(key)
+        if old_node is None or old_node["attrs"] == new_node["attrs"]:
+            continue
+        attr_changes = {
+            attr: (old_node["attrs"].get(attr), new_node["attrs"].get(attr))
+            for attr in set(old_node["attrs"]) | set(new_node["attrs"])
+            if old_node["attrs"].get(attr) != new_node["attrs"].get(attr)
+        }
+        changed.append((old_node, new_node, attr_changes))
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def format_diff(diff: Dict[str, List]) -> str:
+    """Render a hierarchy diff as "+ added", "- removed" and "~ changed" lines."""
+    lines = [f"+ {describe_node(node)}" for node in diff["added"]]
+    lines += [f"- {describe_node(node)}" for node in diff["removed"]]
+    for _, new_node, attr_changes in diff["changed"]:
+        changes = ", ".join(f'{attr}: "{old or ""}" -> "{new or ""}"' for attr, (old, new) in sorted(attr_changes.items()))
+        lines.append(f"~ {describe_node(new_node)} {changes}")
+    return "\n".join(lines)
+
+
+def _is_relevant(node: Dict[str, Any]) -> bool:
+    """Labelled or interactive nodes; pure layout containers are skipped in compact output."""
+    attrs = node["attrs"]
+    if attrs.get("text") or attrs.get("content-desc") or attrs.get("resource-id"):
+        return True
+    return any(attrs.get(flag) == "true" for flag in ("clickable", "scrollable", "checkable", "long-clickable"))
+
+
+def compact_nodes(nodes: Iterable[Tuple[int, str, Dict[str, str]]], max_chars: int) -> Tuple[str, int]:
+    """Render labelled/interactive nodes one per line (indented by depth), up to max_chars.
+
+    Consumes (depth, tag, attrs) tuples one at a time and keeps only the output lines,
+    so with iter_nodes() the nodes of the dump are never held in memory together.
+
+    Returns:
+        (text, number of relevant nodes that did not fit)
+    """
+    lines: List[str] = []
+    length = 0
+    omitted = 0
+    for depth, tag, attrs in nodes:
+        node = {"tag": tag, "attrs": attrs}
+        if not _is_relevant(node):
+            continue
+        if omitted:
+            omitted += 1
+            continue
+        line = "  " * depth + describe_node(node)
+        if length + len(line) + 1 > max_chars:
+            omitted = 1
+            continue
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines), omitted
+
+
+def compact_hierarchy(snapshot: HierarchySnapshot, max_chars: int) -> Tuple[str, int]:
+    """compact_nodes() over an already parsed snapshot."""
+    return compact_nodes(((n["depth"], n["tag"], n["attrs"]) for n in snapshot.nodes), max_chars)
+
+
+def compact_source(source, max_chars: int) -> Tuple[str, int]:
+    """compact_nodes() while stream-parsing a page source (no snapshot is built).
+
+    Raises:
+        ET.ParseError: If the source is not well-formed XML
+    """
+    return compact_nodes(iter_nodes(source), max_chars)
+
+
+def store_snapshot(driver, source: str, seen: bool = True) -> Optional[HierarchySnapshot]:
+    """Parse and cache the page source as the current screen's hierarchy.
+
+    Args:
+        driver: The driver whose session cache is updated
+        source: XML page source
+        seen: The agent receives this hierarchy (it becomes the get_page_changes baseline)
+
+    Returns:
+        The snapshot, or None if the source could not be parsed
+    """
+    try:
+        snapshot = HierarchySnapshot(source)
+    except ET.ParseError as e:
+        logger.debug("🔧 Could not parse page source: %s", e)
+        return None
+    _snapshots[driver.session_id] = snapshot
+    if seen:
+        _last_seen[driver.session_id] = snapshot
+    return snapshot
+
+
+def discard_snapshot(driver) -> None:
+    """Forget the current and last-seen hierarchy (e.g. when a dump was too large to index)."""
+    _snapshots.pop(driver.session_id, None)
+    _last_seen.pop(driver.session_id, None)
+
+
+def get_last_seen(driver) -> Optional[HierarchySnapshot]:
+    """Return the hierarchy the agent last received (kept across screen-changing actions)."""
+    return _last_seen.get(driver.session_id)
+
+
+def get_snapshot(driver) -> Optional[HierarchySnapshot]:
+    """Return the cached hierarchy of the current screen, if any."""
+    return _snapshots.get(driver.session_id)
+
+
+def invalidate_screen(driver, keep_rect: Optional[Tuple[str, str]] = None) -> None:
+    """Forget cached hierarchy/geometry after an action that may change the screen.
+
+    Args:
+        driver: The driver whose session cache is invalidated
+        keep_rect: (by, value) of the container a scroll or pinch happened in; its own
+            bounds do not move, so only its rect survives (everything inside it may have)
+    """
+    _snapshots.pop(driver.session_id, None)
+    _screen_epochs[driver.session_id] = _screen_epochs.get(driver.session_id, 0) + 1
+    session_rects = _rect_cache.pop(driver.session_id, {})
+    if keep_rect is not None and keep_rect in session_rects:
+        _rect_cache[driver.session_id] = {keep_rect: session_rects[keep_rect]}
+
+
+def screen_epoch(driver) -> int:
+    """Number of screen-changing actions so far in the session; equal values mean no action in between."""
+    return _screen_epochs.get(driver.session_id, 0)
+
+
+def clear_screen_cache(session_id: Optional[str] = None) -> None:
+    """Drop all cached screens (for one session, or all sessions)."""
+    if session_id is None:
+        _snapshots.clear()
+        _rect_cache.clear()
+        _last_seen.clear()
+        _screen_epochs.clear()
+    else:
+        _snapshots.pop(session_id, None)
+        _rect_cache.pop(session_id, None)
+        _last_seen.pop(session_id, None)
+        _screen_epochs.pop(session_id, None)
+
+
+def peek_element_rect(driver, by: str, value: str) -> Optional[Dict[str, int]]:
+    """Return an element's rect only if it is already known for the current screen (no round-trips)."""
+    rect = _rect_cache.get(driver.session_id, {}).get((by, value))
+    if rect is not None:
+        return rect
+    snapshot = get_snapshot(driver)
+    if snapshot is not None:
+        node = snapshot.find_unique(by, value)
+        if node is not None and node["rect"] is not None:
+            return node["rect"]
+    return None
+
+
+def get_element_rect(driver, by: str, value: str) -> Dict[str, int]:
+    """Resolve an element's rect with as few round-trips as possible.
+
+    Lookup order: rect cache -> cached page-source hierarchy (zero round-trips) ->
+    find_element + element.rect (two round-trips instead of location + size).
+
+    Args:
+        driver: The Appium driver
+        by: The locator strategy
+        value: The locator value
+
+    Returns:
+        {"x", "y", "width", "height"}
+
+    Raises:
+        NoSuchElementException: If the element is not on the screen
+    """
+    session_rects = _rect_cache.setdefault(driver.session_id, {})
+    key = (by, value)
+    if key in session_rects:
+        return session_rects[key]
+
+    rect = None
+    snapshot = get_snapshot(driver)
+    if snapshot is not None:
+        node = snapshot.find_unique(by, value)
+        if node is not None:
+            rect = node["rect"]
+    if rect is None:
+        element = find_element(driver, by, value)
+        rect = element.rect
+    rect = {k: int(rect[k]) for k in ("x", "y", "width", "height")}
+    session_rects[key] = rect
+    return rect
@@ -6,13 +6,40 @@ from selenium.common.exceptions import (
     InvalidSessionIdException,
     InvalidArgumentException,
     InvalidSelectorException,
-    NoSuchElementException
+    NoSuchElementException,
+    WebDriverException
 )
+from .session import with_session_recovery
+from .hierarchy import get_element_rect, invalidate_screen, peek_element_rect, store_snapshot
+from .resolver import confident_match, format_suggestions, resolve_missing
+from .navigation import LARGE_PAGE_SOURCE_CHARS
+from . import gestures, locators, screen_diff
 
 logger = logging.getLogger(__name__)
 
+# Android KEYCODE_PASTE
+_KEYCODE_PASTE = 279
+
+SEND_KEYS_MODES = ("type", "mobile_type", "set_value", "paste")
+
+# Columns of find_elements when no attributes are given
+DEFAULT_ELEMENT_ATTRIBUTES = "text,resource-id,bounds,checked,enabled"
+
+# Longest cell value in the find_elements table
+_MAX_CELL_CHARS = 80
+
+
+def _element_not_found(driver, by: str, value: str) -> str:
+    """Not-found message with the closest elements of the current screen (no page source for the LLM)."""
+    message = f"❌ Element not found: No element found with by='{by}' and value='{value}'."
+    suggestions = resolve_missing(driver, by, value)
+    if suggestions:
+        return f"{message} Closest elements on the current screen:\n{format_suggestions(suggestions)}"
+    return f"{message} IMPORTANT: Before trying different selectors, use get_page_source() to see the actual screen structure and find the correct element identifiers."
+
 
 @tool
+@with_session_recovery
 def find_element(by: str, value: str) -> str:
     """Find an element on the current screen using a locator strategy.
     
@@ -32,25 +59,29 @@ def find_element(by: str, value: str) -> str:
         raise ValueError("Driver is not initialized")
     
     try:
-        element = driver.find_element(by=by, value=value)
+        element = locators.find_element(driver, by, value)
         logger.info(f"🔧 Found element {element} by {by} with value {value}")
         return f"Successfully found element by {by} with value {value}"
     except (InvalidArgumentException, InvalidSelectorException) as e:
         return f"❌ Invalid locator: by='{by}' is not a valid locator strategy. Use 'xpath', 'id', 'accessibility_id', 'class_name', etc. Error: {e.msg}"
     except NoSuchElementException:
-        return f"❌ Element not found: No element found with by='{by}' and value='{value}'. IMPORTANT: Before trying different selectors, use get_page_source() to see the actual screen structure and find the correct element identifiers."
+        return _element_not_found(driver, by, value)
     except InvalidSessionIdException:
         # Session expired - re-raise to caller
         raise
 
 
 @tool
-def click_element(by: str, value: str) -> str:
+@with_session_recovery
+def click_element(by: str, value: str, verify_change: bool = False) -> str:
     """Find and click an element on the current screen.
     
     Args:
         by: The locator strategy (e.g., "xpath", "id", "accessibility_id")
         value: The locator value to search for
+        verify_change: Compare downscaled screenshots before/after the click and report
+            whether the screen changed (cheaper than re-reading the page source;
+            requires the `vision` extra)
         
     Returns:
         A message indicating success or failure of clicking the element
@@ -64,20 +95,49 @@ def click_element(by: str, value: str) -> str:
         raise ValueError("Driver is not initialized")
     
     try:
-        element = driver.find_element(by=by, value=value)
+        note = ""
+        try:
+            element = locators.find_element(driver, by, value)
+        except NoSuchElementException:
+            # A single near-identical label (e.g. "Bluetooth" vs "Bluetoth") is clicked instead,
+            # judged on the live screen since the cache may predate an animation or scroll
+            match = confident_match(resolve_missing(driver, by, value, fresh=True))
+            if match is None:
+                raise
+            element = locators.find_element(driver, match["by"], match["value"])
+            note = (f" (no exact match for by='{by}' value='{value}'; used the closest element "
+                    f"{match['attribute']}=\"{match['label']}\", similarity {match['score']:.2f})")
+            by, value = match["by"], match["value"]
+        baseline = screen_diff.set_baseline(driver) if verify_change else None
         element.click()
-        logger.info(f"🔧 Clicked element by {by} with value {value}")
-        return f"Successfully clicked on element by {by} with value {value}"
+        if baseline is None:
+            invalidate_screen(driver)
+            logger.info(f"🔧 Clicked element by {by} with value {value}{note}")
+            return f"Successfully clicked on element by {by} with value {value}{note}"
+
+        result = screen_diff.wait_for_change(driver, baseline)
+        logger.info(f"🔧 Clicked element by {by} with value {value} (screen changed: {result['changed']})")
+        if not result["changed"]:
+            # Cached hierarchy and rects are still valid
+            return f"Clicked on element by {by} with value {value}{note}, but the screen did not change within {result['elapsed_seconds']}s"
+        invalidate_screen(driver)
+        return (
+            f"Successfully clicked on element by {by} with value {value}{note}. "
+            f"Screen changed ({result['changed_ratio']:.0%} of the screen) in regions: {screen_diff.format_regions(result['regions'])}"
+        )
     except (InvalidArgumentException, InvalidSelectorException) as e:
         return f"❌ Invalid locator: by='{by}' is not a valid locator strategy. Use 'xpath', 'id', 'accessibility_id', 'class_name', etc. Error: {e.msg}"
     except NoSuchElementException:
-        return f"❌ Element not found: No element found with by='{by}' and value='{value}'. IMPORTANT: Before trying different selectors, use get_page_source() to see the actual screen structure and find the correct element identifiers."
+        return _element_not_found(driver, by, value)
+    except ImportError as e:
+        return f"❌ {e}"
     except InvalidSessionIdException:
         # Session expired - re-raise to caller
         raise
 
 
 @tool
+@with_session_recovery
 def get_text(by: str, value: str) -> str:
     """Get the text content of an element on the screen.
     
@@ -97,20 +157,86 @@ def get_text(by: str, value: str) -> str:
         raise ValueError("Driver is not initialized")
     
     try:
-        element = driver.find_element(by=by, value=value)
+        element = locators.find_element(driver, by, value)
         text = element.text
         logger.info(f"🔧 Got text '{text}' from element by {by} with value {value}")
         return f"Element text: {text}"
     except (InvalidArgumentException, InvalidSelectorException) as e:
         return f"❌ Invalid locator: by='{by}' is not a valid locator strategy. Use 'xpath', 'id', 'accessibility_id', 'class_name', etc. Error: {e.msg}"
     except NoSuchElementException:
-        return f"❌ Element not found: No element found with by='{by}' and value='{value}'. IMPORTANT: Before trying different selectors, use get_page_source() to see the actual screen structure and find the correct element identifiers."
+        return _element_not_found(driver, by, value)
+    except InvalidSessionIdException:
+        # Session expired - re-raise to caller
+        raise
+
+
+def _cell(value) -> str:
+    text = " ".join(str(value if value is not None else "").split()).replace("|", "\\|")
+    return text if len(text) <= _MAX_CELL_CHARS else text[:_MAX_CELL_CHARS - 1] + "…"
+
+
+@tool
+@with_session_recovery
+def find_elements(by: str, value: str, attributes: str = DEFAULT_ELEMENT_ATTRIBUTES, max_results: int = 50) -> str:
+    """Find all elements matching a locator and return selected attributes as a table.
+    
+    Evaluated on one fresh page-source fetch per call instead of one request per element
+    and attribute (checked/enabled states can change without any tool touching the screen).
+    Locators that cannot be evaluated locally (complex XPath, UiSelector) or match nothing
+    in the page source (e.g. short ids), and screens too large to index, fall back to the driver.
+    
+    Args:
+        by: The locator strategy (e.g., "xpath", "id", "accessibility_id", "class_name")
+        value: The locator value to search for
+        attributes: Comma-separated attributes to return
+            (default: "text,resource-id,bounds,checked,enabled"; also e.g. "content-desc", "class")
+        max_results: Maximum number of rows (default: 50)
+        
+    Returns:
+        One row per element ("# | text | resource-id | ..."), or an error message
+        
+    Raises:
+        ValueError: If driver is not initialized
+        InvalidSessionIdException: If Appium session has expired
+    """
+    from .session import driver
+    if not driver:
+        raise ValueError("Driver is not initialized")
+    
+    columns = [name.strip() for name in attributes.split(",") if name.strip()]
+    try:
+        # The XML only feeds the local evaluation; it is not the hierarchy the agent has seen
+        source = driver.page_source
+        # Huge dumps are not worth indexing on every call; the driver evaluates the locator instead
+        snapshot = store_snapshot(driver, source, seen=False) if len(source) <= LARGE_PAGE_SOURCE_CHARS else None
+        nodes = snapshot.find_all(by, value) if snapshot is not None else None
+        # No local match is not final: the driver also resolves short ids ("title") and other forms
+        if nodes:
+            rows = [[node["attrs"].get(name) for name in columns] for node in nodes[:max_results]]
+            total = len(nodes)
+        else:
+            elements = locators.find_elements(driver, by, value)
+            rows = [[element.get_attribute(name) for name in columns] for element in elements[:max_results]]
+            total = len(elements)
+            logger.info(f"🔧 Locator by {by} with value {value} evaluated on the device")
+        if not total:
+            return _element_not_found(driver, by, value)
+        
+        lines = [f"Found {total} element(s) by {by} with value {value}:", " | ".join(["#"] + columns)]
+        lines += [" | ".join([str(i)] + [_cell(v) for v in row]) for i, row in enumerate(rows, 1)]
+        if total > len(rows):
+            lines.append(f"... {total - len(rows)} more (increase max_results or narrow the locator)")
+        logger.info(f"🔧 Found {total} elements by {by} with value {value}")
+        return "\n".join(lines)
+    except (InvalidArgumentException, InvalidSelectorException) as e:
+        return f"❌ Invalid locator: by='{by}' is not a valid locator strategy. Use 'xpath', 'id', 'accessibility_id', 'class_name', etc. Error: {e.msg}"
     except InvalidSessionIdException:
         # Session expired - re-raise to caller
         raise
 
 
 @tool
+@with_session_recovery
 def press_keycode(keycode: int) -> str:
     """Press an Android keycode (e.g., back button, home button, etc.).
     
@@ -137,6 +263,7 @@ def press_keycode(keycode: int) -> str:
     
     try:
         driver.press_keycode(keycode)
+        invalidate_screen(driver)
         logger.info(f"🔧 Pressed keycode {keycode}")
         return f"Successfully pressed keycode {keycode}"
     except InvalidSessionIdException:
@@ -145,6 +272,7 @@ def press_keycode(keycode: int) -> str:
 
 
 @tool
+@with_session_recovery
 def double_tap(by: str, value: str) -> str:
     """Double tap on an element on the screen.
     
@@ -164,61 +292,242 @@ def double_tap(by: str, value: str) -> str:
         raise ValueError("Driver is not initialized")
     
     try:
-        element = driver.find_element(by=by, value=value)
-        # Double tap using actions API
-        from appium.webdriver.common.touch_action import TouchAction
-        action = TouchAction(driver)
-        action.tap(element).perform()
-        action.tap(element).perform()
+        # Both taps are sent as one gesture command; known bounds skip the element lookup
+        rect = peek_element_rect(driver, by, value)
+        if rect is not None:
+            gestures.double_tap(driver, point=gestures.rect_center(rect))
+        else:
+            element = locators.find_element(driver, by, value)
+            gestures.double_tap(driver, element=element)
+        invalidate_screen(driver)
         logger.info(f"🔧 Double tapped element by {by} with value {value}")
         return f"Successfully double tapped on element by {by} with value {value}"
     except (InvalidArgumentException, InvalidSelectorException) as e:
         return f"❌ Invalid locator: by='{by}' is not a valid locator strategy. Use 'xpath', 'id', 'accessibility_id', 'class_name', etc. Error: {e.msg}"
     except NoSuchElementException:
-        return f"❌ Element not found: No element found with by='{by}' and value='{value}'. IMPORTANT: Before trying different selectors, use get_page_source() to see the actual screen structure and find the correct element identifiers."
+        return _element_not_found(driver, by, value)
+    except InvalidSessionIdException:
+        # Session expired - re-raise to caller
+        raise
+
+
+@tool
+@with_session_recovery
+def long_press(by: str, value: str, duration_ms: int = 1000) -> str:
+    """Long press (press and hold) on an element, e.g. to open a context menu.
+    
+    Args:
+        by: The locator strategy (e.g., "xpath", "id", "accessibility_id")
+        value: The locator value to search for
+        duration_ms: How long to hold in milliseconds (default: 1000)
+        
+    Returns:
+        A message indicating success or failure of the long press
+        
+    Raises:
+        ValueError: If driver is not initialized
+        InvalidSessionIdException: If Appium session has expired
+    """
+    from .session import driver
+    if not driver:
+        raise ValueError("Driver is not initialized")
+    
+    try:
+        rect = get_element_rect(driver, by, value)
+        gestures.long_press(driver, gestures.rect_center(rect), duration_ms)
+        invalidate_screen(driver)
+        logger.info(f"🔧 Long pressed element by {by} with value {value} for {duration_ms}ms")
+        return f"Successfully long pressed on element by {by} with value {value}"
+    except (InvalidArgumentException, InvalidSelectorException) as e:
+        return f"❌ Invalid locator: by='{by}' is not a valid locator strategy. Use 'xpath', 'id', 'accessibility_id', 'class_name', etc. Error: {e.msg}"
+    except NoSuchElementException:
+        return _element_not_found(driver, by, value)
+    except InvalidSessionIdException:
+        # Session expired - re-raise to caller
+        raise
+
+
+@tool
+@with_session_recovery
+def pinch(by: str, value: str, zoom: str = "in") -> str:
+    """Pinch with two fingers inside an element (e.g. a map or image) to zoom.
+    
+    Args:
+        by: The locator strategy (e.g., "xpath", "id", "accessibility_id")
+        value: The locator value to search for
+        zoom: "in" to spread the fingers (zoom in) or "out" to pinch them together (zoom out)
+        
+    Returns:
+        A message indicating success or failure of the pinch
+        
+    Raises:
+        ValueError: If driver is not initialized or zoom is invalid
+        InvalidSessionIdException: If Appium session has expired
+    """
+    from .session import driver
+    if not driver:
+        raise ValueError("Driver is not initialized")
+    
+    if zoom not in ("in", "out"):
+        raise ValueError(f"Invalid zoom: {zoom}. Use 'in' or 'out'")
+    
+    try:
+        rect = get_element_rect(driver, by, value)
+        span = min(rect['width'], rect['height'])
+        near, far = int(span * 0.2), int(span * 0.8)
+        start, end = (near, far) if zoom == "in" else (far, near)
+        gestures.pinch(driver, gestures.rect_center(rect), start, end)
+        invalidate_screen(driver, keep_rect=(by, value))
+        logger.info(f"🔧 Pinched {zoom} in element by {by} with value {value}")
+        return f"Successfully pinched {zoom} in element by {by} with value {value}"
+    except (InvalidArgumentException, InvalidSelectorException) as e:
+        return f"❌ Invalid locator: by='{by}' is not a valid locator strategy. Use 'xpath', 'id', 'accessibility_id', 'class_name', etc. Error: {e.msg}"
+    except NoSuchElementException:
+        return _element_not_found(driver, by, value)
+    except InvalidSessionIdException:
+        # Session expired - re-raise to caller
+        raise
+
+
+@tool
+@with_session_recovery
+def drag_and_drop(by: str, value: str, target_by: str, target_value: str) -> str:
+    """Drag an element and drop it onto another element (long press, move, release).
+    
+    Args:
+        by: The locator strategy for the element to drag
+        value: The locator value for the element to drag
+        target_by: The locator strategy for the drop target
+        target_value: The locator value for the drop target
+        
+    Returns:
+        A message indicating success or failure of the drag
+        
+    Raises:
+        ValueError: If driver is not initialized
+        InvalidSessionIdException: If Appium session has expired
+    """
+    from .session import driver
+    if not driver:
+        raise ValueError("Driver is not initialized")
+    
+    try:
+        source_rect = get_element_rect(driver, by, value)
+        target_rect = get_element_rect(driver, target_by, target_value)
+        gestures.drag(driver, gestures.rect_center(source_rect), gestures.rect_center(target_rect))
+        invalidate_screen(driver)
+        logger.info(f"🔧 Dragged element by {by} with value {value} to {target_by}={target_value}")
+        return f"Successfully dragged element by {by} with value {value} to element by {target_by} with value {target_value}"
+    except (InvalidArgumentException, InvalidSelectorException) as e:
+        return f"❌ Invalid locator: {e.msg}. Use 'xpath', 'id', 'accessibility_id', 'class_name', etc."
+    except NoSuchElementException:
+        return f"❌ Element not found: by='{by}' value='{value}' or target by='{target_by}' value='{target_value}' is not on the screen. IMPORTANT: Before trying different selectors, use get_page_source() to see the actual screen structure and find the correct element identifiers."
     except InvalidSessionIdException:
         # Session expired - re-raise to caller
         raise
 
 
+def _enter_text_fast(driver, element, text: str, mode: str) -> bool:
+    """Enter text bypassing per-character IME typing.
+    
+    Returns:
+        True if the field holds the expected value, False if it should be typed instead
+        (a partially applied input is undone first so typing does not duplicate it)
+    """
+    before = element.text
+    try:
+        if mode == "set_value":
+            driver.execute_script("mobile: replaceElementValue", {"elementId": element.id, "text": text})
+        else:
+            element.click()
+            if mode == "mobile_type":
+                driver.execute_script("mobile: type", {"text": text})
+            else:
+                driver.set_clipboard_text(text)
+                driver.press_keycode(_KEYCODE_PASTE)
+    except InvalidSessionIdException:
+        raise
+    except WebDriverException as e:
+        logger.info(f"🔧 Fast input mode '{mode}' rejected: {e.msg}")
+    after = element.text
+    # An empty field reports its hint as text, so the text alone also counts
+    if after == text or (mode != "set_value" and after == before + text):
+        return True
+    if mode == "set_value":
+        # Typing appends, so start from an empty field to end up with the replaced value
+        element.clear()
+    elif after != before:
+        _restore_field(element, before)
+    return False
+
+
+def _restore_field(element, content: str) -> None:
+    """Put back the content a field had before a partially applied fast input."""
+    logger.info("🔧 Fast input was partially applied, restoring the field before typing")
+    element.clear()
+    if not content:
+        return
+    try:
+        hint = element.get_attribute("hint")
+    except WebDriverException:
+        hint = None
+    if content != hint:
+        element.send_keys(content)
+
+
 @tool
-def send_keys(by: str, value: str, text: str) -> str:
+@with_session_recovery
+def send_keys(by: str, value: str, text: str, mode: str = "type") -> str:
     """Send text to an input element (recommended for normal text input).
     
-    ✅ This is the recommended method for text input as it:
+    ✅ The default "type" mode is recommended for text input as it:
     - Simulates real user typing through the keyboard
     - Triggers input events properly
     - Works with IME (Input Method Editor) and autocomplete
     - Appends text without clearing existing content
     
-    For special cases where you need to bypass the keyboard, use set_value() instead.
+    For long text, a faster mode can be selected. If the field rejects it or ends up
+    with a different value, it is restored and the text is typed normally instead:
+    - "mobile_type": types the whole string in one command into the focused field (appends)
+    - "set_value": replaces the field content directly, bypassing the keyboard
+    - "paste": pastes the text from the clipboard at the cursor (appends)
     
     Args:
         by: The locator strategy (e.g., "xpath", "id", "accessibility_id")
         value: The locator value to search for the input element
         text: The text to send to the input element
+        mode: "type" (default), "mobile_type", "set_value", or "paste"
         
     Returns:
         A message indicating success or failure of sending keys
         
     Raises:
-        ValueError: If driver is not initialized
+        ValueError: If driver is not initialized or mode is invalid
         InvalidSessionIdException: If Appium session has expired
     """
     from .session import driver
     if not driver:
         raise ValueError("Driver is not initialized")
     
+    if mode not in SEND_KEYS_MODES:
+        raise ValueError(f"Invalid mode: {mode}. Use one of {', '.join(SEND_KEYS_MODES)}")
+    
     try:
-        element = driver.find_element(by=by, value=value)
-        element.click()
-        element.send_keys(text)
-        logger.info(f"🔧 Sent keys '{text}' to element by {by} with value {value}")
-        return f"Successfully sent keys '{text}' to element"
+        element = locators.find_element(driver, by, value)
+        used_mode = mode
+        if mode == "type" or not _enter_text_fast(driver, element, text, mode):
+            if mode != "type":
+                logger.info(f"🔧 Falling back to typing for element by {by} with value {value}")
+                used_mode = "type (fallback)"
+            element.click()
+            element.send_keys(text)
+        invalidate_screen(driver)
+        logger.info(f"🔧 Sent keys '{text}' to element by {by} with value {value} using {used_mode}")
+        return f"Successfully sent keys '{text}' to element" + (f" (mode: {used_mode})" if mode != "type" else "")
     except (InvalidArgumentException, InvalidSelectorException) as e:
         return f"❌ Invalid locator: by='{by}' is not a valid locator strategy. Use 'xpath', 'id', 'accessibility_id', 'class_name', etc. Error: {e.msg}"
     except NoSuchElementException:
-        return f"❌ Element not found: No element found with by='{by}' and value='{value}'. IMPORTANT: Before trying different selectors, use get_page_source() to see the actual screen structure and find the correct element identifiers."
+        return _element_not_found(driver, by, value)
     except InvalidSessionIdException:
         # Session expired - re-raise to caller
         raise
@@ -0,0 +1,200 @@
+"""Rewrite common XPath locators to native UiAutomator2 strategies and time every lookup."""
+
+import logging
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from selenium.common.exceptions import InvalidSelectorException
+
+logger = logging.getLogger(__name__)
+
+UIAUTOMATOR = "-android uiautomator"
+
+# //class[predicate and predicate ...]
+_XPATH_RE = re.compile(r"""^//(\*|[\w.$]+)\[(.+)\]$""")
+
+# @attr='value' / contains(@attr, 'value') / starts-with(@attr, 'value')
+_PREDICATE_RE = re.compile(r"""^(?:@([\w:-]+)\s*=\s*(['"])(.*)\2|(contains|starts-with)\(\s*@([\w:-]+)\s*,\s*(['"])(.*)\6\s*\))$""")
+
+# (attribute, comparison) -> UiSelector method
+_SELECTOR_METHODS = {
+    ("text", "="): "text",
+    ("text", "contains"): "textContains",
+    ("text", "starts-with"): "textStartsWith",
+    ("content-desc", "="): "description",
+    ("content-desc", "contains"): "descriptionContains",
+    ("content-desc", "starts-with"): "descriptionStartsWith",
+    ("resource-id", "="): "resourceId",
+    ("class", "="): "className",
+}
+
+# {strategy: {"calls", "found", "total_seconds", "max_seconds"}} - lookups through find_element
+_latencies: Dict[str, Dict[str, float]] = {}
+
+
+def _java_string(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _split_predicates(expression: str) -> Optional[List[str]]:
+    """Split "a and b" outside of quotes; None if the expression uses "or" or nesting."""
+    parts, current, quote = [], "", None
+    i = 0
+    while i < len(expression):
+        char = expression[i]
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "'\"":
+            quote = char
+        elif char == "[":
+            return None
+        elif expression.startswith(" and ", i):
+            parts.append(current.strip())
+            current, i = "", i + 5
+            continue
+        elif expression.startswith(" or ", i):
+            return None
+        current += char
+        i += 1
+    parts.append(current.strip())
+    return parts
+
+
+def parse_simple_xpath(value: str) -> Optional[Tuple[str, List[Tuple[str, str, str]]]]:
+    """Parse //tag[predicate and ...] into (tag, [(attribute, "=" | "contains" | "starts-with", literal), ...]).
+
+    Returns:
+        None for anything else (axes, indexes, "or", text(), nested paths)
+    """
+    match = _XPATH_RE.match(value.strip())
+    if not match:
+        return None
+    tag, expression = match.groups()
+    predicates = _split_predicates(expression)
+    if not predicates:
+        return None
+    conditions: List[Tuple[str, str, str]] = []
+    for predicate in predicates:
+        parsed = _PREDICATE_RE.match(predicate)
+        if not parsed:
+            return None
+        attr, _, literal, function, function_attr, _, function_literal = parsed.groups()
+        if attr is not None:
+            conditions.append((attr, "=", literal))
+        else:
+            conditions.append((function_attr, function, function_literal))
+    return tag, conditions
+
+
+def optimize_locator(by: str, value: str) -> Tuple[str, str]:
+    """Translate an XPath into an equivalent id / accessibility_id / UiSelector locator.
+
+    Handled forms (tag may be * or a class name, predicates joined by "and"):
+        //*[@resource-id='pkg:id/x']         -> id
+        //*[@content-desc='x']               -> accessibility_id
+        //*[@text='x'], contains(@text, 'x'), starts-with(...), @class='x', class tags
+                                             -> -android uiautomator UiSelector
+    Anything else (axes, indexes, "or", text(), other attributes) is returned unchanged.
+
+    Returns:
+        (by, value) to send to the driver
+    """
+    parsed = parse_simple_xpath(value) if by == "xpath" else None
+    if parsed is None:
+        return by, value
+    tag, conditions = parsed
+    if tag != "*":
+        conditions = [("class", "=", tag)] + conditions
+    if any((attr, op) not in _SELECTOR_METHODS for attr, op, _ in conditions):
+        return by, value
+
+    if len(conditions) == 1:
+        attr, op, literal = conditions[0]
+        # Without a package prefix the id strategy would also match "<app package>:id/<literal>"
+        if (attr, op) == ("resource-id", "=") and ":id/" in literal:
+            return "id", literal
+        if (attr, op) == ("content-desc", "="):
+            return "accessibility_id", literal
+    selector = "new UiSelector()" + "".join(
+        f".{_SELECTOR_METHODS[(attr, op)]}({_java_string(literal)})" for attr, op, literal in conditions
+    )
+    return UIAUTOMATOR, selector
+
+
+def supports_uiautomator(driver) -> bool:
+    """True for Android sessions driven by UiAutomator2 (the only place the rewrite applies)."""
+    capabilities = getattr(driver, "capabilities", None)
+    if not isinstance(capabilities, dict):
+        return False
+    platform = str(capabilities.get("platformName") or capabilities.get("appium:platformName") or "")
+    automation = str(capabilities.get("automationName") or capabilities.get("appium:automationName") or "uiautomator2")
+    return platform.lower() == "android" and automation.lower() == "uiautomator2"
+
+
+def _record(strategy: str, seconds: float, found: bool) -> None:
+    stats = _latencies.setdefault(strategy, {"calls": 0, "found": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+    stats["calls"] += 1
+    stats["found"] += int(found)
+    stats["total_seconds"] += seconds
+    stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+
+def _timed_find(driver, by: str, value: str, many: bool):
+    start = time.perf_counter()
+    found = False
+    try:
+        result = driver.find_elements(by=by, value=value) if many else driver.find_element(by=by, value=value)
+        found = bool(result) if many else True
+        return result
+    finally:
+        _record(by, time.perf_counter() - start, found)
+
+
+def _find(driver, by: str, value: str, many: bool = False) -> Any:
+    optimized_by, optimized_value = optimize_locator(by, value) if supports_uiautomator(driver) else (by, value)
+    if (optimized_by, optimized_value) == (by, value):
+        return _timed_find(driver, by, value, many)
+    logger.debug("🔧 Locator %s=%s rewritten to %s=%s", by, value, optimized_by, optimized_value)
+    try:
+        return _timed_find(driver, optimized_by, optimized_value, many)
+    except InvalidSelectorException as e:
+        logger.info(f"🔧 {optimized_by} locator rejected ({e.msg}), falling back to {by}")
+        return _timed_find(driver, by, value, many)
+
+
+def find_element(driver, by: str, value: str) -> Any:
+    """driver.find_element with XPath rewritten to a native strategy on UiAutomator2.
+
+    If the server rejects the rewritten selector, the original XPath is used.
+
+    Raises:
+        NoSuchElementException: If the element is not on the screen
+    """
+    return _find(driver, by, value)
+
+
+def find_elements(driver, by: str, value: str) -> List[Any]:
+    """driver.find_elements with the same rewriting and fallback as find_element."""
+    return _find(driver, by, value, many=True)
+
+
+def get_locator_stats() -> Dict[str, Dict[str, float]]:
+    """Lookup latency per strategy actually sent to the driver.
+
+    Returns:
+        {strategy: {"calls", "found", "avg_seconds", "max_seconds"}}
+    """
+    return {
+        strategy: {
+            "calls": stats["calls"],
+            "found": stats["found"],
+            "avg_seconds": round(stats["total_seconds"] / stats["calls"], 4),
+            "max_seconds": round(stats["max_seconds"], 4),
+        }
+        for strategy, stats in _latencies.items()
+    }
+
+
+def reset_locator_stats() -> None:
+    """Forget the recorded lookup latencies."""
+    _latencies.clear()
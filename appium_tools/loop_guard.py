@@ -0,0 +1,229 @@
+"""Detect repeated and oscillating tool calls and short-circuit exact repeats on an unchanged screen."""
+
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.messages import ToolMessage
+from .hierarchy import screen_epoch
+from .token_counter import count_tokens
+from . import screen_diff
+
+logger = logging.getLogger(__name__)
+
+# Tools without side effects: repeating one on an unchanged screen returns the same result
+READ_ONLY_TOOLS = [
+    "get_driver_status",
+    "find_element",
+    "find_elements",
+    "get_text",
+    "get_page_source",
+    "get_current_app",
+    "list_apps",
+    "get_device_info",
+    "is_locked",
+    "get_orientation",
+]
+
+# Tools that are legitimately called many times in a row (never flagged as a loop on their own)
+REPEATABLE_TOOLS = ["scroll_element", "wait_short_loading", "wait_for_element", "check_screen_changed", "get_page_changes"]
+
+# Tools after which the screen may have changed by itself (loading finished)
+WAIT_TOOLS = ["wait_short_loading", "wait_for_element"]
+
+# Successful outputs up to this many tokens are not worth reusing: the tool simply runs again
+SMALL_OUTPUT_TOKENS = 200
+
+# Without a screenshot to confirm the screen is unchanged (no `vision` extra), a result is reused only this long
+UNVERIFIED_MAX_AGE_SECONDS = 3.0
+
+# Locator arguments; only these are normalized (text arguments such as send_keys' must stay exact)
+_LOCATOR_ARGS = ("by", "value", "target_by", "target_value", "scrollable_by", "scrollable_value")
+
+
+def _normalize_args(args: Dict[str, Any]) -> str:
+    """Canonical form of the arguments: near-identical locators ('x' vs "x", extra spaces) compare equal."""
+    normalized = {}
+    for key, value in args.items():
+        if key in _LOCATOR_ARGS and isinstance(value, str):
+            value = " ".join(value.replace("'", '"').split())
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _is_failure(message: ToolMessage) -> bool:
+    return message.status == "error" or str(message.content).startswith("❌")
+
+
+class LoopGuard(AgentMiddleware):
+    """Agent middleware that tracks recent (tool, args, screen) calls.
+
+    - An exact repeat of a read-only tool (see READ_ONLY_TOOLS) whose previous output was
+      large (e.g. a page source) or a failure is answered without touching the device,
+      if the screen is still the same: no screen-changing action since (see
+      hierarchy.screen_epoch) and a downscaled screenshot that still matches the one
+      taken with the previous result (see screen_diff). Without the `vision` extra the
+      result is only reused for `unverified_max_age_seconds`. A large output is replaced
+      by a short note pointing at the earlier output; a failure is returned with a hint
+      to try something else.
+    - Actions (clicks, text entry, app management) always reach the device, even when
+      the same call failed before: the screen may have changed on its own.
+    - Oscillation (A B A B ..., or the same action `repeat_threshold` times in a row) gets
+      a warning appended to the tool output.
+
+    Example:
+        guard = LoopGuard()
+        agent = create_agent(model="gpt-4.1", tools=appium_tools(), middleware=[guard])
+        print(guard.get_stats())  # calls and tokens saved, loops flagged
+    """
+
+    def __init__(
+        self,
+        model: str = "gpt-4.1",
+        max_age_seconds: float = 30.0,
+        unverified_max_age_seconds: float = UNVERIFIED_MAX_AGE_SECONDS,
+        window: int = 12,
+        repeat_threshold: int = 3,
+        read_only_tools: Optional[Sequence[str]] = None,
+        repeatable_tools: Optional[Sequence[str]] = None,
+    ) -> None:
+        """
+        Args:
+            model: Model whose tokenizer is used for the saved-token stats
+            max_age_seconds: How long a result stays reusable on a screen confirmed unchanged by screenshot
+            unverified_max_age_seconds: How long a result stays reusable when no screenshot can be compared
+            window: Number of recent calls inspected for oscillation
+            repeat_threshold: Identical consecutive action calls flagged as a loop
+            read_only_tools: Tools whose repeats may be short-circuited (default: READ_ONLY_TOOLS)
+            repeatable_tools: Tools never flagged for plain repetition (default: REPEATABLE_TOOLS)
+        """
+        super().__init__()
+        self.model = model
+        self.max_age_seconds = max_age_seconds
+        self.unverified_max_age_seconds = unverified_max_age_seconds
+        self.repeat_threshold = repeat_threshold
+        self.read_only_tools = set(read_only_tools if read_only_tools is not None else READ_ONLY_TOOLS)
+        self.repeatable_tools = set(repeatable_tools if repeatable_tools is not None else REPEATABLE_TOOLS)
+        self.stats = {"calls": 0, "short_circuited": 0, "tokens_saved": 0, "loops_flagged": 0}
+        self.events: List[Dict[str, Any]] = []
+        # (tool, normalized args, screen) -> (time, output, failed, screenshot frame or None)
+        self._results: Dict[Tuple[str, str, Any], Tuple[float, str, bool, Optional[Dict[str, Any]]]] = {}
+        self._recent: Deque[str] = deque(maxlen=window)
+        self._waits = 0
+        self._vision = True
+
+    def _screen(self) -> Any:
+        from .session import current_driver
+        driver = current_driver()
+        if driver is None:
+            return self._waits
+        return (driver.session_id, screen_epoch(driver), self._waits)
+
+    def _capture(self) -> Optional[Dict[str, Any]]:
+        """Downscaled screenshot of the current screen, or None if it cannot be taken."""
+        from .session import current_driver
+        driver = current_driver()
+        if driver is None or not self._vision:
+            return None
+        try:
+            return screen_diff.capture_frame(driver)
+        except ImportError:
+            self._vision = False
+            return None
+        except Exception as e:
+            logger.debug("🔧 No screenshot for the loop guard: %s", e)
+            return None
+
+    def _still_same_screen(self, recorded_at: float, frame: Optional[Dict[str, Any]]) -> bool:
+        age = time.time() - recorded_at
+        if frame is None:
+            return age <= self.unverified_max_age_seconds
+        if age > self.max_age_seconds:
+            return False
+        current = self._capture()
+        return current is not None and not screen_diff.compare_frames(frame, current)["changed"]
+
+    def _short_circuit(self, call: Dict[str, Any], key: Tuple[str, str, Any]) -> Optional[ToolMessage]:
+        if call["name"] not in self.read_only_tools:
+            return None
+        previous = self._results.get(key)
+        if previous is None:
+            return None
+        recorded_at, output, failed, frame = previous
+        if not self._still_same_screen(recorded_at, frame):
+            return None
+        if failed:
+            content = (
+                f"{output}\n⚠️ The same call already failed on this unchanged screen. "
+                "Try a different locator or inspect the screen with get_page_source."
+            )
+        else:
+            content = (
+                f"The screen has not changed since the previous {call['name']} call with the same "
+                "arguments; its output above is still current."
+            )
+        saved = max(0, count_tokens(output, self.model) - count_tokens(content, self.model))
+        self.stats["short_circuited"] += 1
+        self.stats["tokens_saved"] += saved
+        self.events.append({"type": "short_circuit", "tool": call["name"], "args": call["args"], "tokens_saved": saved})
+        logger.info(f"🔧 Repeated {call['name']} on an unchanged screen answered from the previous result")
+        return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"], status="error" if failed else "success")
+
+    def _detect_loop(self) -> Optional[str]:
+        recent = list(self._recent)
+        for period in (2, 3):
+            if len(recent) >= 2 * period and recent[-period:] == recent[-2 * period:-period] and len(set(recent[-period:])) > 1:
+                return " → ".join(recent[-period:])
+        last = recent[-self.repeat_threshold:]
+        if len(last) == self.repeat_threshold and len(set(last)) == 1 and last[0].split("(", 1)[0] not in self.repeatable_tools:
+            return f"{last[0]} × {self.repeat_threshold}"
+        return None
+
+    def _after(self, call: Dict[str, Any], key: Tuple[str, str, Any], result: Any, cached: bool = False) -> Any:
+        if not isinstance(result, ToolMessage):
+            return result
+        failed = _is_failure(result)
+        if call["name"] in WAIT_TOOLS:
+            self._waits += 1
+        output = str(result.content)
+        if not cached and call["name"] in self.read_only_tools:
+            if failed or count_tokens(output, self.model) > SMALL_OUTPUT_TOKENS:
+                self._results[key] = (time.time(), output, failed, self._capture())
+            else:
+                self._results.pop(key, None)
+        loop = self._detect_loop()
+        if loop is None:
+            return result
+        self.stats["loops_flagged"] += 1
+        self.events.append({"type": "loop", "pattern": loop})
+        logger.warning(f"🔧 Possible loop in tool calls: {loop}")
+        return result.model_copy(update={
+            "content": f"{result.content}\n⚠️ Possible loop: the recent calls repeat [{loop}]. "
+                       "The screen is not progressing; try a different approach."
+        })
+
+    def _before(self, request) -> Tuple[Dict[str, Any], Tuple[str, str, Any], Optional[ToolMessage]]:
+        call = request.tool_call
+        args = _normalize_args(call["args"])
+        key = (call["name"], args, self._screen())
+        self.stats["calls"] += 1
+        self._recent.append(f"{call['name']}({args})")
+        return call, key, self._short_circuit(call, key)
+
+    def wrap_tool_call(self, request, handler):
+        call, key, cached = self._before(request)
+        if cached is not None:
+            return self._after(call, key, cached, cached=True)
+        return self._after(call, key, handler(request))
+
+    async def awrap_tool_call(self, request, handler):
+        call, key, cached = self._before(request)
+        if cached is not None:
+            return self._after(call, key, cached, cached=True)
+        return self._after(call, key, await handler(request))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Calls seen, calls answered without the device, tool-output tokens saved and loops flagged."""
+        return dict(self.stats)
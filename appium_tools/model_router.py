@@ -0,0 +1,186 @@
+"""Cost-aware model routing: a cheap model for routine steps, the large model for planning and failures."""
+
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import HumanMessage, ToolMessage
+from .budget import BudgetExceededError
+from .replay import ReplayMissError
+from .token_counter import OpenAIPricingCalculator
+
+logger = logging.getLogger(__name__)
+
+# Tools whose result rarely needs reasoning: the next step is "continue" or "report"
+ROUTINE_TOOLS = [
+    "get_driver_status",
+    "click_element",
+    "send_keys",
+    "press_keycode",
+    "double_tap",
+    "long_press",
+    "pinch",
+    "drag_and_drop",
+    "scroll_element",
+    "scroll_to_element",
+    "wait_short_loading",
+    "wait_for_element",
+    "check_screen_changed",
+    "activate_app",
+    "terminate_app",
+    "get_current_app",
+    "is_locked",
+    "get_orientation",
+    "set_orientation",
+    "get_text",
+]
+
+
+# Raised around the model call but not by the model: retrying on the large model would only
+# repeat the refusal at a higher price
+_NOT_ESCALATED = (BudgetExceededError, ReplayMissError)
+
+
+def _is_failure(message: ToolMessage) -> bool:
+    return message.status == "error" or str(message.content).startswith("❌")
+
+
+class ModelRouter(AgentMiddleware):
+    """Agent middleware that picks the model for each step of the agent loop.
+
+    - Planning turns (a new user message) and steps right after a failed tool call go
+      to the large model (the agent's own model unless `strong_model` is given).
+    - Steps that only follow routine tools (see ROUTINE_TOOLS), e.g. "click the element
+      you just found", go to the cheap model.
+    - After `escalate_after_failures` failed tool calls in a turn, the rest of the turn
+      stays on the large model. If the cheap model call itself raises, the step is
+      retried on the large model.
+
+    Per-model cost and latency are reported by TiktokenCountCallback.get_model_breakdown().
+
+    Example:
+        router = ModelRouter(cheap_model="gpt-4.1-nano")
+        agent = create_agent(model="gpt-4.1", tools=appium_tools(), middleware=[router])
+    """
+
+    def __init__(
+        self,
+        cheap_model: Union[str, BaseChatModel] = "gpt-4.1-nano",
+        strong_model: Optional[Union[str, BaseChatModel]] = None,
+        routine_tools: Optional[Sequence[str]] = None,
+        escalate_after_failures: int = 2,
+    ) -> None:
+        """
+        Args:
+            cheap_model: Model (name from OpenAIPricingCalculator.PRICING or a chat model) for routine steps
+            strong_model: Model for planning and failures (default: the agent's model)
+            routine_tools: Tools whose results the cheap model may follow up (default: ROUTINE_TOOLS)
+            escalate_after_failures: Failed tool calls in a turn after which the turn stays on the large model
+        """
+        super().__init__()
+        self.cheap_model = cheap_model
+        self.strong_model = strong_model
+        self.routine_tools = set(routine_tools if routine_tools is not None else ROUTINE_TOOLS)
+        self.escalate_after_failures = escalate_after_failures
+        for model in (cheap_model, strong_model):
+            if isinstance(model, str) and OpenAIPricingCalculator._normalize_model_name(model) == "default":
+                logger.warning(f"🔧 {model} is not in the pricing table; its cost will use default pricing")
+        self.history: List[Dict[str, Any]] = []
+        self._models: Dict[str, BaseChatModel] = {}
+
+    def _resolve(self, model: Union[str, BaseChatModel]) -> BaseChatModel:
+        if not isinstance(model, str):
+            return model
+        if model not in self._models:
+            # Created on first use so that constructing the router needs no API key
+            from langchain.chat_models import init_chat_model
+            self._models[model] = init_chat_model(model, model_provider="openai")
+        return self._models[model]
+
+    def choose(self, messages: Sequence[Any]) -> Tuple[str, str]:
+        """Decide which model handles the next step.
+
+        Returns:
+            ("cheap" | "strong", reason)
+        """
+        if not messages or isinstance(messages[-1], HumanMessage):
+            return "strong", "planning"
+
+        turn_start = 0
+        for index, message in enumerate(messages):
+            if isinstance(message, HumanMessage):
+                turn_start = index
+        failures = sum(1 for m in messages[turn_start:] if isinstance(m, ToolMessage) and _is_failure(m))
+        if failures >= self.escalate_after_failures:
+            return "strong", f"{failures} failed tool calls this turn"
+
+        # Tool results the next step has to read
+        results: List[ToolMessage] = []
+        for message in reversed(messages):
+            if not isinstance(message, ToolMessage):
+                break
+            results.append(message)
+        if not results:
+            return "strong", "no tool results"
+        if any(_is_failure(m) for m in results):
+            return "strong", "tool failure"
+        unusual = sorted({m.name for m in results if m.name not in self.routine_tools})
+        if unusual:
+            return "strong", f"non-routine tool: {', '.join(unusual)}"
+        return "cheap", "routine follow-up"
+
+    def _route(self, request) -> Tuple[Any, str]:
+        tier, reason = self.choose(request.messages)
+        if tier == "cheap":
+            model = self._resolve(self.cheap_model)
+        elif self.strong_model is not None:
+            model = self._resolve(self.strong_model)
+        else:
+            model = request.model
+        self.history.append({"tier": tier, "reason": reason, "escalated": False})
+        logger.debug("🔧 Model router: %s (%s)", tier, reason)
+        return request.override(model=model), tier
+
+    def _escalate(self, request, error: Exception):
+        logger.warning(f"🔧 Cheap model failed ({type(error).__name__}: {error}), retrying on the large model")
+        self.history[-1]["escalated"] = True
+        return request.override(model=self._resolve(self.strong_model) if self.strong_model is not None else request.model)
+
+    def wrap_model_call(self, request, handler):
+        routed, tier = self._route(request)
+        if tier != "cheap":
+            return handler(routed)
+        try:
+            return handler(routed)
+        except _NOT_ESCALATED:
+            raise
+        except Exception as e:
+            return handler(self._escalate(request, e))
+
+    async def awrap_model_call(self, request, handler):
+        routed, tier = self._route(request)
+        if tier != "cheap":
+            return await handler(routed)
+        try:
+            return await handler(routed)
+        except _NOT_ESCALATED:
+            raise
+        except Exception as e:
+            return await handler(self._escalate(request, e))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """How many steps went to each tier and why.
+
+        Returns:
+            {"calls", "cheap", "strong", "escalated", "reasons": {reason: count}}
+        """
+        reasons: Dict[str, int] = {}
+        for record in self.history:
+            reasons[record["reason"]] = reasons.get(record["reason"], 0) + 1
+        return {
+            "calls": len(self.history),
+            "cheap": sum(1 for r in self.history if r["tier"] == "cheap"),
+            "strong": sum(1 for r in self.history if r["tier"] == "strong"),
+            "escalated": sum(1 for r in self.history if r["escalated"]),
+            "reasons": reasons,
+        }
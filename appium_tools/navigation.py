@@ -1,13 +1,61 @@
 """Navigation and screen inspection tools for Appium."""
 
 import logging
+import time
+import xml.etree.ElementTree as ET
 from langchain.tools import tool
-from selenium.common.exceptions import InvalidSessionIdException
+from selenium.common.exceptions import (
+    InvalidArgumentException,
+    InvalidSelectorException,
+    InvalidSessionIdException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+)
+from selenium.webdriver.support.ui import WebDriverWait
+from .session import with_session_recovery
+from .hierarchy import compact_source, diff_snapshots, discard_snapshot, format_diff, get_element_rect, get_last_seen, invalidate_screen, store_snapshot
+from .locators import find_element
+from . import screen_diff
 
 logger = logging.getLogger(__name__)
 
+# Page sources larger than this are returned as a compact element list instead of raw XML
+LARGE_PAGE_SOURCE_CHARS = 200_000
+
+# Maximum size of the compact element list
+MAX_COMPACT_SOURCE_CHARS = 40_000
+
+WAIT_CONDITIONS = ("present", "visible", "gone", "text_equals")
+
+
+def _is_large(source: str) -> bool:
+    return len(source) > LARGE_PAGE_SOURCE_CHARS
+
+
+def _format_page_source(source: str) -> str:
+    """Tool output for a page source; huge dumps are reduced to labelled/interactive elements.
+
+    Huge dumps are filtered while they are stream-parsed, so neither a tree nor a
+    node list of the whole dump is built for them.
+    """
+    if not _is_large(source):
+        return f"Page source retrieved successfully:\n{source}"
+    try:
+        compact, omitted = compact_source(source, MAX_COMPACT_SOURCE_CHARS)
+    except ET.ParseError as e:
+        logger.debug("🔧 Could not parse page source: %s", e)
+        return f"Page source retrieved successfully:\n{source}"
+    logger.info(f"🔧 Page source is {len(source)} chars, returning compact view ({omitted} elements omitted)")
+    footer = f"\n... {omitted} more elements omitted" if omitted else ""
+    return (
+        f"Page source retrieved successfully (large screen: {len(source)} chars of XML, "
+        f"showing labelled/interactive elements only):\n{compact}{footer}"
+    )
+
 
 @tool
+@with_session_recovery
 def take_screenshot() -> str:
     """Take a screenshot of the current screen and return it as base64 string.
     
@@ -55,7 +103,6 @@ def wait_short_loading(seconds: str = "5") -> str:
             wait_secs = 5
 
         logger.info(f"🔧 Waiting {wait_secs}s to allow UI to settle...")
-        import time
         time.sleep(wait_secs)
         return f"Waited {wait_secs} seconds for loading"
     except InvalidSessionIdException:
@@ -63,9 +110,87 @@ def wait_short_loading(seconds: str = "5") -> str:
         raise
     except Exception as e:
         return f"Failed: {e}"
+    finally:
+        # 待機中に画面が変わった可能性があるため、キャッシュした階層と座標を破棄
+        invalidate_screen(driver)
+
+
+def _wait_condition(by: str, value: str, condition: str, text: str):
+    """WebDriverWait predicate: truthy once the condition holds; lookup errors count as "not yet"."""
+    def check(driver):
+        if condition == "gone":
+            try:
+                return not find_element(driver, by, value).is_displayed()
+            except (NoSuchElementException, StaleElementReferenceException):
+                return True
+        element = find_element(driver, by, value)
+        if condition == "present":
+            return True
+        if condition == "visible":
+            return element.is_displayed()
+        return element.text == text
+    return check
 
 
 @tool
+@with_session_recovery
+def wait_for_element(by: str, value: str, condition: str = "visible", text: str = "", timeout: float = 10.0, interval: float = 0.5) -> str:
+    """Wait until an element appears, becomes visible, disappears or shows a given text.
+    
+    Polls the locator every `interval` seconds and returns as soon as the condition
+    holds. Use this after a transition instead of alternating wait_short_loading()
+    and find_element().
+    
+    Args:
+        by: The locator strategy (e.g., "xpath", "id", "accessibility_id")
+        value: The locator value to search for
+        condition: "present" (in the hierarchy), "visible" (displayed), "gone" (absent
+            or hidden) or "text_equals" (element text equals `text`) (default: "visible")
+        text: Expected text for condition="text_equals"
+        timeout: Maximum seconds to wait (default: 10)
+        interval: Seconds between checks (default: 0.5)
+        
+    Returns:
+        The condition and the elapsed time, or a timeout message
+        
+    Raises:
+        ValueError: If driver is not initialized or condition is invalid
+        InvalidSessionIdException: If Appium session has expired
+    """
+    from .session import driver
+    if not driver:
+        raise ValueError("Driver is not initialized")
+    
+    if condition not in WAIT_CONDITIONS:
+        raise ValueError(f"Invalid condition: {condition}. Use one of {', '.join(WAIT_CONDITIONS)}")
+    
+    expected = f"showing text '{text}'" if condition == "text_equals" else condition
+    start = time.monotonic()
+    try:
+        wait = WebDriverWait(
+            driver, timeout, poll_frequency=interval,
+            ignored_exceptions=(NoSuchElementException, StaleElementReferenceException),
+        )
+        wait.until(_wait_condition(by, value, condition, text))
+        elapsed = time.monotonic() - start
+        logger.info(f"🔧 Element by {by} with value {value} is {expected} after {elapsed:.1f}s")
+        return f"Element by {by} with value {value} is {expected} after {elapsed:.1f}s"
+    except TimeoutException:
+        elapsed = time.monotonic() - start
+        logger.info(f"🔧 Timed out after {elapsed:.1f}s waiting for element by {by} with value {value} to be {expected}")
+        return f"❌ Timed out after {elapsed:.1f}s: element by {by} with value {value} is not {expected}"
+    except (InvalidArgumentException, InvalidSelectorException) as e:
+        return f"❌ Invalid locator: by='{by}' is not a valid locator strategy. Use 'xpath', 'id', 'accessibility_id', 'class_name', etc. Error: {e.msg}"
+    except InvalidSessionIdException:
+        # Session expired - re-raise to caller
+        raise
+    finally:
+        # The screen may have changed while waiting
+        invalidate_screen(driver)
+
+
+@tool
+@with_session_recovery
 def get_page_source() -> str:
     """Get the XML source of the current screen layout.
     
@@ -91,15 +216,109 @@ def get_page_source() -> str:
     
     try:
         source = driver.page_source
+        if _is_large(source):
+            # Not indexed: the compact view is built while parsing and the dump is not kept
+            discard_snapshot(driver)
+        else:
+            store_snapshot(driver, source)
         logger.info("🔧 Page source retrieved successfully")  
-        logger.debug(f"\n{source}\n")     
-        return f"Page source retrieved successfully:\n{source}"
+        logger.debug("\n%s\n", source)     
+        return _format_page_source(source)
+    except InvalidSessionIdException:
+        # Session expired - re-raise to caller
+        raise
+
+
+@tool
+@with_session_recovery
+def get_page_changes() -> str:
+    """Get only what changed on the screen since the last page source you received.
+    
+    Use this instead of get_page_source() after an action on the same screen (toggling a
+    switch, typing, expanding an item): it returns just the added (+), removed (-) and
+    changed (~) elements, which is far shorter than the full XML. Elements are matched by
+    class + resource-id + bounds. If there is no previous page source, or the whole
+    screen changed, the full page source is returned instead.
+    
+    Returns:
+        The changed elements, "No changes", or the full XML page source
+        
+    Raises:
+        ValueError: If driver is not initialized
+        InvalidSessionIdException: If Appium session has expired
+    """
+    from .session import driver
+    if not driver:
+        raise ValueError("Driver is not initialized")
+    
+    try:
+        previous = get_last_seen(driver)
+        source = driver.page_source
+        if _is_large(source):
+            # Too large to index for a diff: return the compact view built while parsing
+            discard_snapshot(driver)
+            logger.info("🔧 Page source too large to diff, returning the compact page source")
+            return _format_page_source(source)
+        current = store_snapshot(driver, source)
+        if previous is None or current is None:
+            logger.info("🔧 No previous page source, returning the full page source")
+            return _format_page_source(source)
+        
+        diff = diff_snapshots(previous, current)
+        counts = f"{len(diff['added'])} added, {len(diff['removed'])} removed, {len(diff['changed'])} changed"
+        logger.info(f"🔧 Page changes: {counts}")
+        if not (diff["added"] or diff["removed"] or diff["changed"]):
+            return f"No changes since the last page source ({len(current.nodes)} elements)"
+        changes = format_diff(diff)
+        logger.debug("\n%s\n", changes)
+        full = _format_page_source(source)
+        if len(changes) >= len(full):
+            # New screen: the delta is no shorter than the full dump
+            return f"Screen changed completely. {full}"
+        return f"Page changes ({counts}):\n{changes}"
     except InvalidSessionIdException:
         # Session expired - re-raise to caller
         raise
 
 
 @tool
+@with_session_recovery
+def check_screen_changed() -> str:
+    """Check whether the screen changed since the last check, without reading the page source.
+    
+    Compares a heavily downscaled screenshot with the previous one using a perceptual
+    hash and reports the changed regions. Much cheaper than get_page_source() for
+    confirming that an action had an effect. The first call only records a baseline.
+    
+    Returns:
+        "changed" with the changed regions, "unchanged", or a baseline/error message
+        
+    Raises:
+        ValueError: If driver is not initialized
+        InvalidSessionIdException: If Appium session has expired
+    """
+    from .session import driver
+    if not driver:
+        raise ValueError("Driver is not initialized")
+    
+    try:
+        result = screen_diff.check_screen_change(driver)
+        if result is None:
+            logger.info("🔧 Screen baseline recorded")
+            return "Baseline recorded. Call again after an action to see whether the screen changed."
+        logger.info(f"🔧 Screen changed: {result['changed']} (hash distance {result['hash_distance']})")
+        if not result["changed"]:
+            return "Screen unchanged since the last check"
+        return f"Screen changed ({result['changed_ratio']:.0%} of the screen) in regions: {screen_diff.format_regions(result['regions'])}"
+    except ImportError as e:
+        return f"❌ {e}"
+    except InvalidSessionIdException:
+        # Session expired - re-raise to caller
+        raise
+
+
+@tool
+@with_session_recovery
 def scroll_element(by: str, value: str, direction: str = "up") -> str:
     """Scroll within a scrollable element (like a list or scrollview).
     
@@ -124,11 +343,10 @@ def scroll_element(by: str, value: str, direction: str = "up") -> str:
         raise ValueError("Driver is not initialized")
     
     try:
-        element = driver.find_element(by=by, value=value)
-        
-        # Get element location and size
-        location = element.location
-        size = element.size
+        # Get element bounds (cached per screen, single rect call on a miss)
+        rect = get_element_rect(driver, by, value)
+        location = {'x': rect['x'], 'y': rect['y']}
+        size = {'width': rect['width'], 'height': rect['height']}
         
         # Calculate center point
         center_x = location['x'] + size['width'] // 2
@@ -160,6 +378,7 @@ def scroll_element(by: str, value: str, direction: str = "up") -> str:
         
         # Perform swipe
         driver.swipe(int(start_x), int(start_y), int(end_x), int(end_y), 500)
+        invalidate_screen(driver, keep_rect=(by, value))
         logger.info(f"🔧 Scrolled {direction} in element found by {by} with value {value}")
         return f"Successfully scrolled {direction} in element"
     except InvalidSessionIdException:
@@ -168,6 +387,7 @@ def scroll_element(by: str, value: str, direction: str = "up") -> str:
 
 
 @tool
+@with_session_recovery
 def scroll_to_element(by: str, value: str, scrollable_by: str = "xpath", scrollable_value: str = "//*[@scrollable='true']") -> str:
     """Scroll within a scrollable container until an element is visible.
     
@@ -193,21 +413,20 @@ def scroll_to_element(by: str, value: str, scrollable_by: str = "xpath", scrolla
         max_scrolls = 10
         for i in range(max_scrolls):
             try:
-                element = driver.find_element(by=by, value=value)
+                element = find_element(driver, by, value)
                 if element.is_displayed():
                     logger.info(f"🔧 Found element by {by} with value {value} after {i} scrolls")
                     return f"Successfully scrolled to element by {by} with value {value}"
             except Exception:
                 pass
             
-            # Scroll down
-            scrollable = driver.find_element(by=scrollable_by, value=scrollable_value)
-            location = scrollable.location
-            size = scrollable.size
-            center_x = location['x'] + size['width'] // 2
-            start_y = location['y'] + size['height'] * 0.8
-            end_y = location['y'] + size['height'] * 0.2
+            # Scroll down (container bounds are resolved once and reused for every swipe)
+            rect = get_element_rect(driver, scrollable_by, scrollable_value)
+            center_x = rect['x'] + rect['width'] // 2
+            start_y = rect['y'] + rect['height'] * 0.8
+            end_y = rect['y'] + rect['height'] * 0.2
             driver.swipe(int(center_x), int(start_y), int(center_x), int(end_y), 500)
+            invalidate_screen(driver, keep_rect=(scrollable_by, scrollable_value))
         
         raise ValueError(f"Failed to find element by {by} with value {value} after {max_scrolls} scrolls")
     except InvalidSessionIdException:
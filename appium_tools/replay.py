@@ -0,0 +1,209 @@
+"""Disk-backed record/replay of LLM responses and tool outputs for offline agent runs."""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, ToolMessage, messages_from_dict, message_to_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict
+
+logger = logging.getLogger(__name__)
+
+MODES = ("record", "replay", "passthrough")
+
+
+class ReplayMissError(LookupError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+def _stable_hash(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def _message_key(message: BaseMessage) -> Dict[str, Any]:
+    """The parts of a message that determine the response (ids and usage are excluded)."""
+    key: Dict[str, Any] = {"type": message.type, "content": message.content}
+    if getattr(message, "tool_calls", None):
+        key["tool_calls"] = [{"name": c["name"], "args": c["args"], "id": c.get("id")} for c in message.tool_calls]
+    if isinstance(message, ToolMessage):
+        key["tool_call_id"] = message.tool_call_id
+    return key
+
+
+class ReplayCache:
+    """Stores LLM responses and tool outputs as JSON files under one directory.
+
+    Modes:
+        record: call the model/tool and store the result (overwriting older recordings)
+        replay: return stored results only; a missing entry raises ReplayMissError
+        passthrough: no caching at all
+
+    Layout: <path>/llm/<sha256>.json and <path>/tools/<sha256>.json
+    """
+
+    def __init__(self, path: str, mode: str = "replay") -> None:
+        """
+        Args:
+            path: Directory of the recording (created in record mode)
+            mode: "record", "replay" or "passthrough"
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}. Use one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+        # Tool outputs depend on the device state, so repeated identical calls are told apart by order
+        self._tool_occurrences: Dict[str, int] = {}
+
+    def _file(self, kind: str, key: str) -> str:
+        return os.path.join(self.path, kind, f"{key}.json")
+
+    def load(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._file(kind, key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry
+
+    def save(self, kind: str, key: str, entry: Dict[str, Any]) -> None:
+        os.makedirs(os.path.join(self.path, kind), exist_ok=True)
+        # Write then rename so that an interrupted run never leaves a truncated entry
+        target = self._file(kind, key)
+        with open(target + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, indent=1)
+        os.replace(target + ".tmp", target)
+        self.stats["recorded"] += 1
+
+    def llm_key(self, model_name: str, messages: List[BaseMessage], **kwargs: Any) -> str:
+        return _stable_hash({
+            "model": model_name,
+            "messages": [_message_key(m) for m in messages],
+            "tools": kwargs.get("tools"),
+            "tool_choice": kwargs.get("tool_choice"),
+            "stop": kwargs.get("stop"),
+        })
+
+    def tool_key(self, name: str, args: Dict[str, Any]) -> str:
+        base = _stable_hash({"tool": name, "args": args})
+        occurrence = self._tool_occurrences.get(base, 0)
+        self._tool_occurrences[base] = occurrence + 1
+        return _stable_hash({"call": base, "occurrence": occurrence})
+
+
+class CachedChatModel(BaseChatModel):
+    """Chat model wrapper that records or replays responses through a ReplayCache.
+
+    Replayed responses go through the normal callback path, so TiktokenCountCallback
+    reports the recorded token usage and model name. In replay mode `inner` may be
+    None (no API key needed).
+
+    Example:
+        cache = ReplayCache("recordings/wifi", mode="record")
+        model = CachedChatModel(model_name="gpt-4.1", inner=ChatOpenAI(model="gpt-4.1"), replay_cache=cache)
+        agent = create_agent(model=model, tools=appium_tools(), middleware=[ToolReplayMiddleware(cache)])
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model_name: str
+    replay_cache: ReplayCache
+    inner: Optional[BaseChatModel] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cached-chat-model"
+
+    def bind_tools(self, tools, *, tool_choice: Optional[Any] = None, **kwargs: Any):
+        schemas = [convert_to_openai_tool(tool) for tool in tools]
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        return self.bind(tools=schemas, **kwargs)
+
+    def _lookup(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]):
+        if self.replay_cache.mode == "passthrough":
+            return None, None
+        key = self.replay_cache.llm_key(self.model_name, messages, stop=stop, **kwargs)
+        if self.replay_cache.mode == "record":
+            return key, None
+        entry = self.replay_cache.load("llm", key)
+        if entry is None:
+            raise ReplayMissError(f"No recorded response for this {self.model_name} request ({key[:12]})")
+        generations = [ChatGeneration(message=m) for m in messages_from_dict(entry["messages"])]
+        return key, ChatResult(generations=generations, llm_output=entry.get("llm_output"))
+
+    def _store(self, key: Optional[str], result: ChatResult) -> ChatResult:
+        if key is not None and self.replay_cache.mode == "record":
+            self.replay_cache.save("llm", key, {
+                "model": self.model_name,
+                "messages": [message_to_dict(g.message) for g in result.generations],
+                "llm_output": result.llm_output,
+            })
+        return result
+
+    def _require_inner(self) -> BaseChatModel:
+        if self.inner is None:
+            raise ValueError(f"CachedChatModel in {self.replay_cache.mode} mode needs an inner model")
+        return self.inner
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        key, replayed = self._lookup(messages, stop, kwargs)
+        if replayed is not None:
+            return replayed
+        # Called without run_manager: the callbacks already see this (outer) call once
+        return self._store(key, self._require_inner()._generate(messages, stop=stop, **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        key, replayed = self._lookup(messages, stop, kwargs)
+        if replayed is not None:
+            return replayed
+        return self._store(key, await self._require_inner()._agenerate(messages, stop=stop, **kwargs))
+
+
+class ToolReplayMiddleware(AgentMiddleware):
+    """Agent middleware that records tool outputs, or replays them without touching the device."""
+
+    def __init__(self, cache: ReplayCache) -> None:
+        super().__init__()
+        self.cache = cache
+
+    def _replay(self, request) -> Tuple[Optional[str], Optional[ToolMessage]]:
+        call = request.tool_call
+        if self.cache.mode == "passthrough":
+            return None, None
+        key = self.cache.tool_key(call["name"], call["args"])
+        if self.cache.mode == "record":
+            return key, None
+        entry = self.cache.load("tools", key)
+        if entry is None:
+            raise ReplayMissError(f"No recorded output for {call['name']}({call['args']})")
+        return key, ToolMessage(content=entry["content"], name=call["name"], tool_call_id=call["id"], status=entry["status"])
+
+    def _record(self, key: Optional[str], request, result: Any) -> Any:
+        if key is not None and self.cache.mode == "record" and isinstance(result, ToolMessage):
+            self.cache.save("tools", key, {
+                "tool": request.tool_call["name"],
+                "args": request.tool_call["args"],
+                "content": result.content,
+                "status": result.status,
+            })
+        return result
+
+    def wrap_tool_call(self, request, handler):
+        key, replayed = self._replay(request)
+        if replayed is not None:
+            return replayed
+        return self._record(key, request, handler(request))
+
+    async def awrap_tool_call(self, request, handler):
+        key, replayed = self._replay(request)
+        if replayed is not None:
+            return replayed
+        return self._record(key, request, await handler(request))
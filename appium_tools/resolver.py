@@ -0,0 +1,196 @@
+"""Suggest the nearest elements of the cached hierarchy when a locator does not match."""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from .hierarchy import HierarchySnapshot, get_snapshot, store_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Attributes compared with the searched value
+_MATCH_ATTRIBUTES = ("resource-id", "text", "content-desc")
+
+# Locator strategy -> attribute it searches
+_STRATEGY_ATTRIBUTES = {
+    "id": "resource-id",
+    "accessibility id": "content-desc",
+    "accessibility_id": "content-desc",
+}
+
+# Literals compared in an XPath: @attr='value', contains(@attr, "value"), text()='value'
+_XPATH_LITERAL_RE = re.compile(r"""(?:@([\w:-]+)|(text)\(\))\s*(?:=|,)\s*(['"])(.*?)\3""")
+
+# Candidates below this similarity are not suggested
+MIN_SIMILARITY = 0.6
+
+# A single candidate at or above this similarity (and clearly ahead of the next) is used directly
+HIGH_CONFIDENCE = 0.85
+
+# Only labels the user can read are trusted for acting; near ids ("btn_ok" / "btn_no") differ in meaning
+_CONFIDENT_ATTRIBUTES = ("text", "content-desc")
+_CONFIDENCE_MARGIN = 0.1
+
+
+def _normalize(value: str) -> str:
+    return " ".join(value.casefold().split())
+
+
+def _short_id(resource_id: str) -> str:
+    """"com.android.settings:id/title" -> "title"."""
+    return resource_id.split(":id/", 1)[-1]
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance between two strings."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def similarity(a: str, b: str) -> float:
+    """1.0 for equal strings after case/whitespace normalization, down to 0.0."""
+    a, b = _normalize(a), _normalize(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    return 1.0 - edit_distance(a, b) / max(len(a), len(b))
+
+
+def locator_targets(by: str, value: str) -> List[Tuple[Optional[str], str]]:
+    """What a locator looks for: [(attribute or None for any, value), ...]."""
+    attr = _STRATEGY_ATTRIBUTES.get(by)
+    if attr is not None:
+        return [(attr, value)]
+    if by == "xpath":
+        targets = []
+        for attr, text_fn, _, literal in _XPATH_LITERAL_RE.findall(value):
+            attr = "text" if text_fn else attr
+            targets.append((attr if attr in _MATCH_ATTRIBUTES else None, literal))
+        return targets
+    if by in ("-android uiautomator", "android_uiautomator"):
+        return [(None, literal) for literal in re.findall(r'"(.*?)"', value)]
+    return []
+
+
+def _score(node: Dict[str, Any], targets: List[Tuple[Optional[str], str]]) -> Tuple[float, str]:
+    """Best (similarity, attribute) of a node over all targets."""
+    best = (0.0, "")
+    for target_attr, target in targets:
+        for attr in (target_attr,) if target_attr else _MATCH_ATTRIBUTES:
+            actual = node["attrs"].get(attr)
+            if not actual:
+                continue
+            if attr == "resource-id":
+                # The shared "<package>:id/" prefix would make unrelated ids look alike
+                score = similarity(_short_id(target), _short_id(actual))
+            else:
+                score = similarity(target, actual)
+            if score > best[0]:
+                best = (score, attr)
+    return best
+
+
+def _locator_for(snapshot: HierarchySnapshot, node: Dict[str, Any]) -> Tuple[str, str]:
+    """A locator that matches exactly this node: id, then accessibility_id, then an XPath."""
+    attrs = node["attrs"]
+    if attrs.get("resource-id") and snapshot.find_all("id", attrs["resource-id"]) == [node]:
+        return "id", attrs["resource-id"]
+    if attrs.get("content-desc") and snapshot.find_all("accessibility_id", attrs["content-desc"]) == [node]:
+        return "accessibility_id", attrs["content-desc"]
+    for attr in ("text", "content-desc", "resource-id"):
+        value = attrs.get(attr)
+        if value and '"' not in value:
+            xpath = f'//*[@{attr}="{value}"]'
+            if snapshot.find_all("xpath", xpath) == [node]:
+                return "xpath", xpath
+    # Not unique by any single attribute: position among nodes of the same class
+    cls = attrs.get("class", node["tag"])
+    same = [n for n in snapshot.nodes if n["attrs"].get("class", n["tag"]) == cls]
+    return "xpath", f'(//{cls})[{same.index(node) + 1}]'
+
+
+def is_positional(by: str, value: str) -> bool:
+    """True for the (//class)[n] fallback locator, which can hit another element after any layout change."""
+    return by == "xpath" and value.startswith("(")
+
+
+def suggest_locators(snapshot: HierarchySnapshot, by: str, value: str, limit: int = 3) -> List[Dict[str, Any]]:
+    """Nearest nodes to a locator that matched nothing.
+
+    Args:
+        snapshot: Hierarchy of the current screen
+        by: The locator strategy that failed
+        value: The locator value that failed
+        limit: Maximum number of suggestions
+
+    Returns:
+        [{"by", "value", "score", "attribute", "label", "node", "positional"}, ...] best first
+    """
+    targets = locator_targets(by, value)
+    if not targets:
+        return []
+    scored = []
+    for node in snapshot.nodes:
+        score, attr = _score(node, targets)
+        if score >= MIN_SIMILARITY:
+            scored.append((score, attr, node))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    suggestions = []
+    for score, attr, node in scored[:limit]:
+        locator_by, locator_value = _locator_for(snapshot, node)
+        suggestions.append({
+            "by": locator_by,
+            "value": locator_value,
+            "score": round(score, 2),
+            "attribute": attr,
+            "label": node["attrs"][attr],
+            "node": node,
+            "positional": is_positional(locator_by, locator_value),
+        })
+    return suggestions
+
+
+def confident_match(suggestions: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The only suggestion that is both high-confidence and clearly ahead of the others, if any.
+
+    Positional locators and resource-id matches are never returned: they are only safe
+    to show, not to act on.
+    """
+    if not suggestions or suggestions[0]["score"] < HIGH_CONFIDENCE or suggestions[0]["positional"]:
+        return None
+    if suggestions[0]["attribute"] not in _CONFIDENT_ATTRIBUTES:
+        return None
+    if len(suggestions) > 1 and suggestions[0]["score"] - suggestions[1]["score"] < _CONFIDENCE_MARGIN:
+        return None
+    return suggestions[0]
+
+
+def format_suggestions(suggestions: List[Dict[str, Any]]) -> str:
+    """One compact line per suggestion: by='...' value='...' (attribute "label", similarity)."""
+    return "\n".join(
+        f"- by='{s['by']}' value='{s['value']}' ({s['attribute']}=\"{s['label']}\", similarity {s['score']:.2f})"
+        for s in suggestions
+    )
+
+
+def resolve_missing(driver, by: str, value: str, limit: int = 3, fresh: bool = False) -> List[Dict[str, Any]]:
+    """Suggestions for a locator that raised NoSuchElementException.
+
+    Uses the cached hierarchy of the current screen; if there is none (or fresh is set,
+    for decisions that act on the device), the page source is fetched once and cached
+    (the XML never reaches the LLM, so it is not recorded as the hierarchy the agent has seen).
+    """
+    snapshot = None if fresh else get_snapshot(driver)
+    snapshot = snapshot or store_snapshot(driver, driver.page_source, seen=False)
+    if snapshot is None:
+        return []
+    suggestions = suggest_locators(snapshot, by, value, limit)
+    logger.info(f"🔧 {len(suggestions)} locator suggestion(s) for by={by} value={value}")
+    return suggestions
@@ -0,0 +1,214 @@
+"""Expose a small core tool set plus on-demand tool groups to the LLM on each call."""
+
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+from langchain.agents.middleware import AgentMiddleware
+from langchain.tools import tool
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from .token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Always exposed: enough to inspect the screen and operate ordinary elements
+CORE_TOOLS = [
+    "get_driver_status",
+    "find_element",
+    "find_elements",
+    "click_element",
+    "get_text",
+    "send_keys",
+    "press_keycode",
+    "get_page_source",
+    "get_current_app",
+]
+
+# group name -> tools exposed only when the group is enabled
+TOOL_GROUPS: Dict[str, List[str]] = {
+    "interaction": ["double_tap", "long_press", "pinch", "drag_and_drop"],
+    "navigation": [
+        "take_screenshot", "scroll_element", "scroll_to_element",
+        "get_page_changes", "check_screen_changed", "wait_short_loading", "wait_for_element",
+    ],
+    "app_management": ["activate_app", "terminate_app", "list_apps"],
+    "device_info": ["get_device_info", "is_locked", "get_orientation", "set_orientation"],
+}
+
+# group name -> words in the user's task that enable the group up front
+GROUP_KEYWORDS: Dict[str, List[str]] = {
+    "interaction": [
+        "double", "long press", "long-press", "pinch", "zoom", "drag", "drop",
+        "ダブルタップ", "長押し", "ピンチ", "拡大", "縮小", "ドラッグ",
+    ],
+    "navigation": [
+        "scroll", "screenshot", "wait", "loading", "changed",
+        "スクロール", "スクリーンショット", "待", "読み込み", "変化",
+    ],
+    "app_management": [
+        "app", "launch", "open", "close", "terminate", "installed", "package",
+        "アプリ", "起動", "終了", "開", "閉じ", "パッケージ",
+    ],
+    "device_info": [
+        "device", "orientation", "rotate", "landscape", "portrait", "lock", "screen size",
+        "デバイス", "端末", "向き", "回転", "横向き", "縦向き", "ロック", "画面サイズ",
+    ],
+}
+
+REQUEST_TOOL_NAME = "request_tools"
+
+
+@tool(REQUEST_TOOL_NAME)
+def request_tools(groups: str) -> str:
+    """Enable additional tool groups when the current tools are not enough.
+
+    Groups:
+        interaction: double_tap, long_press, pinch, drag_and_drop
+        navigation: take_screenshot, scroll_element, scroll_to_element, get_page_changes, check_screen_changed, wait_short_loading, wait_for_element
+        app_management: activate_app, terminate_app, list_apps
+        device_info: get_device_info, is_locked, get_orientation, set_orientation
+
+    Args:
+        groups: Comma-separated group names (e.g. "navigation,device_info")
+
+    Returns:
+        str: The enabled groups; their tools are available from the next step
+    """
+    requested = _parse_groups(groups)
+    unknown = [name for name in requested if name not in TOOL_GROUPS]
+    if unknown:
+        return f"❌ Unknown tool group(s): {', '.join(unknown)}. Available: {', '.join(TOOL_GROUPS)}"
+    return f"Enabled tool groups: {', '.join(requested)}"
+
+
+def _parse_groups(groups: str) -> List[str]:
+    return [name.strip().lower().replace(" ", "_") for name in groups.split(",") if name.strip()]
+
+
+def _tool_name(tool_or_schema: Any) -> str:
+    if isinstance(tool_or_schema, dict):
+        return tool_or_schema.get("name") or tool_or_schema.get("function", {}).get("name", "")
+    return getattr(tool_or_schema, "name", "")
+
+
+def select_groups(task: str) -> Set[str]:
+    """Tool groups whose keywords appear in the task."""
+    text = task.lower()
+    return {group for group, words in GROUP_KEYWORDS.items() if any(word in text for word in words)}
+
+
+def schema_tokens(tools: Iterable[Any], model: str = "gpt-4.1") -> int:
+    """Tokens of the tool schemas as sent with a chat request (tiktoken, see count_tokens)."""
+    schemas = [tool if isinstance(tool, dict) else convert_to_openai_tool(tool) for tool in tools]
+    return count_tokens(json.dumps(schemas, ensure_ascii=False), model) if schemas else 0
+
+
+class ToolRouter(AgentMiddleware):
+    """Agent middleware that sends only the core tools plus the enabled groups with each model call.
+
+    Groups are enabled for the current user turn by keywords in the user's message
+    (see GROUP_KEYWORDS) or by the agent calling `request_tools`. All tools stay
+    registered with the agent, so a tool enabled mid-turn can be called on the next step.
+
+    Example:
+        router = ToolRouter(model="gpt-4.1")
+        agent = create_agent(model="gpt-4.1", tools=appium_tools(), middleware=[router])
+        print(router.get_stats())  # schema tokens sent vs. sending every tool
+    """
+
+    def __init__(
+        self,
+        model: str = "gpt-4.1",
+        core: Optional[Sequence[str]] = None,
+        groups: Optional[Dict[str, List[str]]] = None,
+        always_enabled: Optional[Sequence[str]] = None,
+    ) -> None:
+        """
+        Args:
+            model: Model whose tokenizer is used for the schema token stats
+            core: Tool names always exposed (default: CORE_TOOLS)
+            groups: {group: [tool names]} exposed on demand (default: TOOL_GROUPS)
+            always_enabled: Groups exposed on every call regardless of the task
+        """
+        super().__init__()
+        self.model = model
+        self.core = list(core if core is not None else CORE_TOOLS)
+        self.groups = groups if groups is not None else TOOL_GROUPS
+        self.always_enabled = set(always_enabled or [])
+        unknown = self.always_enabled - set(self.groups)
+        if unknown:
+            raise ValueError(f"Unknown tool group(s): {', '.join(sorted(unknown))}")
+        self.tools = [request_tools]
+        self.history: List[Dict[str, Any]] = []
+        self._schema_tokens: Dict[str, int] = {}
+
+    def enabled_groups(self, messages: Sequence[Any]) -> Set[str]:
+        """Groups enabled for the current turn (messages since the last user message)."""
+        turn_start = 0
+        for index, message in enumerate(messages):
+            if isinstance(message, HumanMessage):
+                turn_start = index
+        enabled = set(self.always_enabled)
+        for message in messages[turn_start:]:
+            if isinstance(message, HumanMessage):
+                enabled |= select_groups(message.text)
+            elif isinstance(message, AIMessage):
+                for call in message.tool_calls:
+                    if call["name"] == REQUEST_TOOL_NAME:
+                        enabled |= set(_parse_groups(str(call["args"].get("groups", ""))))
+        return enabled & set(self.groups)
+
+    def _exposed_names(self, enabled: Set[str]) -> Set[str]:
+        names = set(self.core) | {REQUEST_TOOL_NAME}
+        for group in enabled:
+            names.update(self.groups[group])
+        return names
+
+    def _tokens(self, tool: Any) -> int:
+        name = _tool_name(tool)
+        if name not in self._schema_tokens:
+            self._schema_tokens[name] = schema_tokens([tool], self.model)
+        return self._schema_tokens[name]
+
+    def _route(self, request):
+        enabled = self.enabled_groups(request.messages)
+        names = self._exposed_names(enabled)
+        exposed = [t for t in request.tools if _tool_name(t) in names]
+        # Tools outside the router's catalog (e.g. added by other middleware) always pass through
+        catalog = set(self.core) | {n for tools in self.groups.values() for n in tools} | {REQUEST_TOOL_NAME}
+        exposed += [t for t in request.tools if _tool_name(t) not in catalog]
+        self.history.append({
+            "groups": sorted(enabled),
+            "exposed_tools": len(exposed),
+            "total_tools": len(request.tools),
+            "exposed_schema_tokens": sum(self._tokens(t) for t in exposed),
+            "full_schema_tokens": sum(self._tokens(t) for t in request.tools),
+        })
+        logger.debug("🔧 Tool router exposes %d/%d tools (groups: %s)", len(exposed), len(request.tools), sorted(enabled))
+        return request.override(tools=exposed)
+
+    def wrap_model_call(self, request, handler):
+        return handler(self._route(request))
+
+    async def awrap_model_call(self, request, handler):
+        return await handler(self._route(request))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Schema tokens sent through the router vs. exposing every tool on every call.
+
+        The schema token counts are tiktoken estimates of the JSON tool definitions; the
+        actual per-call input tokens are in TiktokenCountCallback's invocation records
+        ("tool_schema_tokens").
+
+        Returns:
+            {"calls", "exposed_schema_tokens", "full_schema_tokens", "saved_tokens", "saved_ratio"}
+        """
+        exposed = sum(r["exposed_schema_tokens"] for r in self.history)
+        full = sum(r["full_schema_tokens"] for r in self.history)
+        return {
+            "calls": len(self.history),
+            "exposed_schema_tokens": exposed,
+            "full_schema_tokens": full,
+            "saved_tokens": full - exposed,
+            "saved_ratio": round((full - exposed) / full, 3) if full else 0.0,
+        }
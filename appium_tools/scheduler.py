@@ -0,0 +1,310 @@
+"""Device-farm scheduler: queue agent tasks onto free devices."""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+from appium.options.android import UiAutomator2Options
+from langchain_core.runnables import RunnableConfig
+from .budget import BudgetExceededError
+from .session import SessionPool, appium_driver, note_foreground_app
+from .token_counter import TiktokenCountCallback
+
+logger = logging.getLogger(__name__)
+
+
+class AgentTask:
+    """One natural-language task for the agent."""
+
+    _ids = itertools.count(1)
+
+    def __init__(
+        self,
+        prompt: str,
+        app_package: Optional[str] = None,
+        capabilities: Optional[Dict[str, Any]] = None,
+        priority: int = 0,
+        max_retries: int = 1,
+        task_id: Optional[str] = None,
+    ) -> None:
+        """
+        Args:
+            prompt: The user message sent to the agent
+            app_package: App brought to the foreground before the agent starts
+            capabilities: Capabilities the device must have, e.g. {"appium:platformVersion": "14"}
+            priority: Higher runs first
+            max_retries: Retries after a failed run (possibly on another device)
+            task_id: Identifier used in results and as the agent thread_id
+        """
+        self.prompt = prompt
+        self.app_package = app_package
+        self.capabilities = capabilities or {}
+        self.priority = priority
+        self.max_retries = max_retries
+        self.task_id = task_id or f"task-{next(self._ids)}"
+        self.attempts = 0
+
+
+class Device:
+    """One device of the farm: the options used to open its session."""
+
+    def __init__(self, name: str, options: UiAutomator2Options, appium_server_url: str = 'http://localhost:4723') -> None:
+        """
+        Args:
+            name: Label used in results and reports
+            options: UiAutomator2Options for this device (e.g. with appium:udid set)
+            appium_server_url: URL of the Appium server the device is attached to
+        """
+        self.name = name
+        self.options = options
+        self.appium_server_url = appium_server_url
+        self.capabilities = options.to_capabilities()
+
+    def matches(self, task: AgentTask) -> bool:
+        """Whether the device has every capability the task requires."""
+        return all(self.capabilities.get(key) == value for key, value in task.capabilities.items())
+
+
+class DeviceScheduler:
+    """Runs a queue of AgentTasks on a set of devices, one task per device at a time.
+
+    Each device has a worker that repeatedly takes the highest-priority task it can run,
+    opens (or reuses from the SessionPool) a session, runs the agent and records the
+    result with its own TiktokenCountCallback metrics. Failed tasks are re-queued until
+    their retries are exhausted; workers stay until the queue is drained and no task is
+    running, so a retry can go to any free matching device.
+
+    Example:
+        scheduler = DeviceScheduler(devices, agent_factory=lambda: create_agent(...))
+        results = await scheduler.run([AgentTask("Turn on Wi-Fi"), AgentTask("Open Battery", priority=1)])
+        print(scheduler.format_report())
+    """
+
+    def __init__(
+        self,
+        devices: List[Device],
+        agent_factory: Callable[[], Any],
+        model: str = "gpt-4.1",
+        pool: Optional[SessionPool] = None,
+        task_timeout: float = 600.0,
+        auto_recover: bool = True,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+        callbacks_factory: Optional[Callable[[AgentTask], List[Any]]] = None,
+    ) -> None:
+        """
+        Args:
+            devices: Devices available to the scheduler
+            agent_factory: Returns an agent with `ainvoke` (e.g. create_agent(...)); called once per device
+            model: Model name for the per-task TiktokenCountCallback
+            pool: SessionPool used to keep one warm session per device between tasks
+                (a private pool is created and closed by run() if omitted)
+            task_timeout: Seconds before a running task is cancelled and counted as failed
+            auto_recover: Recover expired sessions inside a task (see appium_driver)
+            on_result: Called with each final task result as soon as it is known
+                (e.g. to stream results to a file)
+            callbacks_factory: Returns extra callbacks for one run of a task, e.g. a
+                BudgetGuard per task plus one shared by the whole run. A task stopped by
+                BudgetExceededError is not retried.
+        """
+        self.devices = devices
+        self.agent_factory = agent_factory
+        self.model = model
+        self.pool = pool
+        self.task_timeout = task_timeout
+        self.auto_recover = auto_recover
+        self.on_result = on_result
+        self.callbacks_factory = callbacks_factory
+        self.results: List[Dict[str, Any]] = []
+        self.device_stats: Dict[str, Dict[str, Any]] = {}
+        self._queue: List = []
+        self._sequence = itertools.count()
+        # Tasks being run; workers wait for them since a failure re-queues the task
+        self._in_flight = 0
+        self._changed: Optional[asyncio.Condition] = None
+        self._wall_seconds = 0.0
+
+    def _push(self, task: AgentTask) -> None:
+        heapq.heappush(self._queue, (-task.priority, next(self._sequence), task))
+
+    def _pop_for(self, device: Device) -> Optional[AgentTask]:
+        """Remove and return the highest-priority queued task this device can run."""
+        for entry in sorted(self._queue):
+            if device.matches(entry[2]):
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                return entry[2]
+        return None
+
+    async def _next_task(self, device: Device) -> Optional[AgentTask]:
+        """Wait for a task this device can run; None once the queue is drained and nothing is in flight."""
+        async with self._changed:
+            while True:
+                task = self._pop_for(device)
+                if task is not None:
+                    self._in_flight += 1
+                    return task
+                if not self._in_flight:
+                    return None
+                await self._changed.wait()
+
+    async def _task_done(self) -> None:
+        async with self._changed:
+            self._in_flight -= 1
+            self._changed.notify_all()
+
+    async def _run_task(self, device: Device, agent, task: AgentTask, pool: SessionPool) -> Dict[str, Any]:
+        token_counter = TiktokenCountCallback(model=self.model)
+        callbacks = [token_counter] + (self.callbacks_factory(task) if self.callbacks_factory else [])
+        async with appium_driver(
+            device.options, device.appium_server_url, pool=pool, auto_recover=self.auto_recover
+        ) as driver:
+            if task.app_package:
+                await asyncio.to_thread(driver.activate_app, task.app_package)
+                note_foreground_app(task.app_package)
+            response = await asyncio.wait_for(
+                agent.ainvoke(
+                    {"messages": [{"role": "user", "content": task.prompt}]},
+                    config=RunnableConfig(
+                        configurable={"thread_id": f"{task.task_id}-{task.attempts}"},
+                        callbacks=callbacks,
+                    ),
+                ),
+                self.task_timeout,
+            )
+        return {"output": response["messages"][-1].content, "metrics": token_counter.get_metrics()}
+
+    async def _worker(self, device: Device, pool: SessionPool) -> None:
+        stats = self.device_stats.setdefault(device.name, {"tasks": 0, "failures": 0, "busy_seconds": 0.0})
+        agent = self.agent_factory()
+        while True:
+            task = await self._next_task(device)
+            if task is None:
+                return
+            try:
+                await self._attempt(device, agent, task, pool, stats)
+            finally:
+                await self._task_done()
+            # Give devices that were waiting the first chance at a task this one just re-queued
+            await asyncio.sleep(0)
+
+    async def _attempt(self, device: Device, agent, task: AgentTask, pool: SessionPool, stats: Dict[str, Any]) -> None:
+        task.attempts += 1
+        start = time.time()
+        record = {
+            "task_id": task.task_id,
+            "prompt": task.prompt,
+            "device": device.name,
+            "attempt": task.attempts,
+            "priority": task.priority,
+        }
+        retryable = True
+        try:
+            outcome = await self._run_task(device, agent, task, pool)
+            record.update(status="succeeded", output=outcome["output"], metrics=outcome["metrics"], error=None)
+        except asyncio.TimeoutError:
+            record.update(status="failed", output=None, metrics=None, error=f"Timed out after {self.task_timeout}s")
+        except BudgetExceededError as e:
+            # Another attempt would spend the same budget again
+            retryable = False
+            record.update(status="failed", output=None, metrics=None, error=f"{type(e).__name__}: {e}")
+        except Exception as e:
+            record.update(status="failed", output=None, metrics=None, error=f"{type(e).__name__}: {e}")
+        elapsed = time.time() - start
+        record["elapsed_seconds"] = round(elapsed, 2)
+        stats["tasks"] += 1
+        stats["busy_seconds"] += elapsed
+
+        if record["status"] == "failed":
+            stats["failures"] += 1
+            if retryable and task.attempts <= task.max_retries:
+                logger.warning(f"🔧 {task.task_id} failed on {device.name} ({record['error']}), retrying")
+                # Re-queued: any free matching device (including this one) picks it up
+                record["status"] = "retried"
+                self._push(task)
+        logger.info(f"🔧 {task.task_id} on {device.name}: {record['status']} in {elapsed:.1f}s")
+        self.results.append(record)
+        if record["status"] != "retried" and self.on_result:
+            self.on_result(record)
+
+    async def run(self, tasks: List[AgentTask]) -> List[Dict[str, Any]]:
+        """Run all tasks and return one final result per task (in submission order).
+
+        Tasks that no device can run are returned with status "unschedulable".
+
+        Returns:
+            [{"task_id", "prompt", "device", "attempt", "priority", "status",
+              "output", "metrics", "error", "elapsed_seconds"}, ...]
+        """
+        final: Dict[str, Dict[str, Any]] = {}
+        for task in tasks:
+            if any(device.matches(task) for device in self.devices):
+                self._push(task)
+            else:
+                final[task.task_id] = {
+                    "task_id": task.task_id, "prompt": task.prompt, "device": None, "attempt": 0,
+                    "priority": task.priority, "status": "unschedulable", "output": None, "metrics": None,
+                    "error": f"No device matches {task.capabilities}", "elapsed_seconds": 0.0,
+                }
+                if self.on_result:
+                    self.on_result(final[task.task_id])
+
+        pool = self.pool or SessionPool(max_idle_sessions=len(self.devices))
+        self._changed = asyncio.Condition()
+        start = time.time()
+        try:
+            await asyncio.gather(*(self._worker(device, pool) for device in self.devices))
+        finally:
+            self._wall_seconds += time.time() - start
+            if self.pool is None:
+                pool.close()
+
+        for record in self.results:
+            if record["status"] != "retried":
+                final[record["task_id"]] = record
+        return [final[task.task_id] for task in tasks if task.task_id in final]
+
+    def get_report(self) -> Dict[str, Any]:
+        """Throughput, utilization and cost of the tasks run so far.
+
+        Returns:
+            Dict with succeeded/failed/retried counts, wall_seconds, tasks_per_minute,
+            total_cost_usd and per-device {tasks, failures, busy_seconds, utilization}
+        """
+        wall = self._wall_seconds or 1e-9
+        finished = [r for r in self.results if r["status"] != "retried"]
+        succeeded = sum(1 for r in finished if r["status"] == "succeeded")
+        devices = {
+            name: {
+                "tasks": stats["tasks"],
+                "failures": stats["failures"],
+                "busy_seconds": round(stats["busy_seconds"], 2),
+                "utilization": round(min(1.0, stats["busy_seconds"] / wall), 3),
+            }
+            for name, stats in self.device_stats.items()
+        }
+        return {
+            "succeeded": succeeded,
+            "failed": len(finished) - succeeded,
+            "retried": sum(1 for r in self.results if r["status"] == "retried"),
+            "wall_seconds": round(self._wall_seconds, 2),
+            "tasks_per_minute": round(len(finished) * 60 / wall, 2),
+            "total_cost_usd": round(sum(r["metrics"]["total_cost_usd"] for r in finished if r["metrics"]), 6),
+            "devices": devices,
+        }
+
+    def format_report(self, width: int = 70) -> str:
+        """Human-readable version of get_report()."""
+        report = self.get_report()
+        lines = ["=" * width, "🗂️  SCHEDULER REPORT:", "=" * width]
+        lines.append(f"Tasks: {report['succeeded']} succeeded, {report['failed']} failed, {report['retried']} retried")
+        lines.append(f"⏱️  Wall time: {report['wall_seconds']}s ({report['tasks_per_minute']} tasks/min)")
+        lines.append(f"💰 Total Cost: ${report['total_cost_usd']:.6f}")
+        for name, stats in report["devices"].items():
+            lines.append(
+                f"📱 {name}: {stats['tasks']} runs, {stats['failures']} failures, "
+                f"busy {stats['busy_seconds']}s ({stats['utilization']:.0%})"
+            )
+        lines.append("=" * width)
+        return "\n".join(lines)
@@ -0,0 +1,189 @@
+"""Screen-change detection with perceptual hashes of downscaled screenshots.
+
+Requires the optional `vision` extra (numpy, Pillow):
+
+    uv add "appium-tools[vision] @ git+https://github.com/aRaikoFunakami/appium-tools.git"
+"""
+
+import io
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# dHash size (hash_size x hash_size bits)
+HASH_SIZE = 16
+
+# Luminance grid used to locate changed regions (columns, rows)
+GRID_SIZE = (12, 24)
+
+# Mean luminance difference (0-255) for a grid cell to count as changed
+CELL_THRESHOLD = 10.0
+
+# Hamming distance (bits) above which the whole frame counts as changed
+HASH_THRESHOLD = 6
+
+# {session_id: frame} - last captured frame per session
+_frames: Dict[str, Dict[str, Any]] = {}
+
+
+def _require_vision():
+    try:
+        import numpy as np
+        from PIL import Image
+    except ImportError as e:
+        raise ImportError(
+            "Screen-change detection requires numpy and Pillow: install appium-tools[vision]"
+        ) from e
+    return np, Image
+
+
+def compute_frame(png_bytes: bytes) -> Dict[str, Any]:
+    """Downscale a screenshot and compute its dHash and luminance grid.
+
+    Args:
+        png_bytes: Screenshot image bytes (PNG)
+
+    Returns:
+        Frame dict: {"hash": ndarray[bool], "grid": ndarray[float32], "size": (width, height)}
+    """
+    np, Image = _require_vision()
+    image = Image.open(io.BytesIO(png_bytes))
+    size = image.size
+    # Downscale first; everything after works on a few hundred pixels
+    gray = image.convert("L")
+    small = gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    dhash = pixels[:, 1:] > pixels[:, :-1]
+    grid = np.asarray(gray.resize(GRID_SIZE, Image.Resampling.BOX), dtype=np.float32)
+    return {"hash": dhash, "grid": grid, "size": size}
+
+
+def _changed_regions(mask, size: Tuple[int, int]) -> List[Dict[str, int]]:
+    """Group changed grid cells into bounding boxes (in screen pixels)."""
+    rows, cols = mask.shape
+    cell_w = size[0] / cols
+    cell_h = size[1] / rows
+    seen = set()
+    regions = []
+    for r0 in range(rows):
+        for c0 in range(cols):
+            if not mask[r0, c0] or (r0, c0) in seen:
+                continue
+            # Flood fill 8-connected changed cells
+            stack = [(r0, c0)]
+            seen.add((r0, c0))
+            min_r = max_r = r0
+            min_c = max_c = c0
+            while stack:
+                r, c = stack.pop()
+                min_r, max_r = min(min_r, r), max(max_r, r)
+                min_c, max_c = min(min_c, c), max(max_c, c)
+                for dr in (-1, 0, 1):
+                    for dc in (-1, 0, 1):
+                        nr, nc = r + dr, c + dc
+                        if 0 <= nr < rows and 0 <= nc < cols and mask[nr, nc] and (nr, nc) not in seen:
+                            seen.add((nr, nc))
+                            stack.append((nr, nc))
+            regions.append({
+                "x": int(min_c * cell_w),
+                "y": int(min_r * cell_h),
+                "width": int((max_c - min_c + 1) * cell_w),
+                "height": int((max_r - min_r + 1) * cell_h),
+            })
+    return regions
+
+
+def compare_frames(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Compare two frames.
+
+    Returns:
+        {"changed": bool, "hash_distance": int, "changed_ratio": float, "regions": [rect, ...]}
+    """
+    np, _ = _require_vision()
+    distance = int(np.count_nonzero(previous["hash"] != current["hash"]))
+    if previous["size"] != current["size"]:
+        # Rotation or resolution change: the whole screen changed
+        width, height = current["size"]
+        return {
+            "changed": True,
+            "hash_distance": distance,
+            "changed_ratio": 1.0,
+            "regions": [{"x": 0, "y": 0, "width": width, "height": height}],
+        }
+    mask = np.abs(previous["grid"] - current["grid"]) > CELL_THRESHOLD
+    regions = _changed_regions(mask, current["size"])
+    return {
+        "changed": bool(regions) or distance > HASH_THRESHOLD,
+        "hash_distance": distance,
+        "changed_ratio": round(float(mask.mean()), 3),
+        "regions": regions,
+    }
+
+
+def capture_frame(driver) -> Dict[str, Any]:
+    """Take a screenshot and compute its frame (one round-trip)."""
+    return compute_frame(driver.get_screenshot_as_png())
+
+
+def check_screen_change(driver, update: bool = True) -> Optional[Dict[str, Any]]:
+    """Compare the current screen with the last captured frame of this session.
+
+    Args:
+        driver: The Appium driver
+        update: Store the current frame as the new baseline
+
+    Returns:
+        The comparison result, or None if there was no baseline yet
+    """
+    current = capture_frame(driver)
+    previous = _frames.get(driver.session_id)
+    if update:
+        _frames[driver.session_id] = current
+    if previous is None:
+        return None
+    return compare_frames(previous, current)
+
+
+def wait_for_change(driver, baseline: Dict[str, Any], timeout: float = 2.0, interval: float = 0.3) -> Dict[str, Any]:
+    """Poll screenshots until the screen differs from baseline or timeout expires.
+
+    The last captured frame becomes the session baseline.
+
+    Returns:
+        The last comparison result (with "elapsed_seconds")
+    """
+    start = time.time()
+    while True:
+        current = capture_frame(driver)
+        result = compare_frames(baseline, current)
+        elapsed = time.time() - start
+        if result["changed"] or elapsed >= timeout:
+            _frames[driver.session_id] = current
+            result["elapsed_seconds"] = round(elapsed, 2)
+            return result
+        time.sleep(interval)
+
+
+def set_baseline(driver) -> Dict[str, Any]:
+    """Capture and store the current screen as the session baseline."""
+    frame = capture_frame(driver)
+    _frames[driver.session_id] = frame
+    return frame
+
+
+def clear_frames(session_id: Optional[str] = None) -> None:
+    """Forget stored baselines (for one session, or all sessions)."""
+    if session_id is None:
+        _frames.clear()
+    else:
+        _frames.pop(session_id, None)
+
+
+def format_regions(regions: List[Dict[str, int]], limit: int = 5) -> str:
+    """Compact "[x,y w×h]" list of regions for tool output."""
+    parts = [f"[{r['x']},{r['y']} {r['width']}x{r['height']}]" for r in regions[:limit]]
+    if len(regions) > limit:
+        parts.append(f"... +{len(regions) - limit} more")
+    return ", ".join(parts)
@@ -1,23 +1,416 @@
 """Session management tools for Appium."""
 
+import asyncio
+import functools
+import json
 import logging
-from contextlib import asynccontextmanager
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from appium import webdriver
 from appium.options.android import UiAutomator2Options
 from langchain.tools import tool
+from selenium.common.exceptions import InvalidSessionIdException
+from .transport import PooledTransport
+from .hierarchy import clear_screen_cache
+from .screen_diff import clear_frames
 
 logger = logging.getLogger(__name__)
 
-driver = None
+# Driver used by the tools. Bound per context (asyncio task / thread) so several devices
+# can be driven concurrently; tools read it with `from .session import driver`.
+_bound_driver: ContextVar[Optional[Any]] = ContextVar("appium_tools_driver", default=None)
+
+# appium_driver(auto_recover=True) の間だけ設定されるスーパーバイザー
+_bound_supervisor: ContextVar[Optional["SessionSupervisor"]] = ContextVar("appium_tools_supervisor", default=None)
+
+# Sessions currently open through appium_driver() (in any context)
+_open_session_count = 0
+_open_session_lock = threading.Lock()
+
+
+class NoDriverBoundError(RuntimeError):
+    """A tool ran in a context without a driver while sessions are open elsewhere."""
+
+
+def current_driver():
+    """Return the driver bound to the current context (None if no session is open at all).
+
+    There is deliberately no process-wide fallback: with several devices it could be
+    another device's driver.
+
+    Raises:
+        NoDriverBoundError: If sessions are open but none is bound to this context
+            (e.g. a thread started without contextvars.copy_context())
+    """
+    bound = _bound_driver.get()
+    if bound is None and _open_session_count:
+        raise NoDriverBoundError(
+            "No Appium driver is bound to this context. Run the code in the context of "
+            "appium_driver() (threads need contextvars.copy_context()) or wrap it in use_driver(driver)."
+        )
+    return bound
+
+
+def __getattr__(name: str) -> Any:
+    # `from .session import driver` resolves to the driver of the calling context
+    if name == "driver":
+        return current_driver()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@contextmanager
+def use_driver(driver_instance, supervisor: Optional["SessionSupervisor"] = None):
+    """Bind a driver to the current context so the tools operate on it.
+
+    Use this to call tools against several devices concurrently: each asyncio task or
+    thread binds its own driver (threads need contextvars.copy_context()).
+
+    Example:
+        with use_driver(driver_a):
+            is_locked.invoke({})
+    """
+    driver_token = _bound_driver.set(driver_instance)
+    supervisor_token = _bound_supervisor.set(supervisor)
+    try:
+        yield driver_instance
+    finally:
+        _bound_supervisor.reset(supervisor_token)
+        _bound_driver.reset(driver_token)
+
+# Speed-oriented capabilities for repeated runs against an already prepared device.
+# The UiAutomator2 server APKs must already be installed on the device.
+FAST_START_CAPABILITIES: Dict[str, Any] = {
+    "appium:skipServerInstallation": True,
+    "appium:skipDeviceInitialization": True,
+    "appium:disableWindowAnimation": True,
+}
+
+
+def apply_fast_start_profile(options: UiAutomator2Options) -> UiAutomator2Options:
+    """Apply FAST_START_CAPABILITIES to the given options (in place).
+
+    Args:
+        options: UiAutomator2Options instance to update
+
+    Returns:
+        The same options instance, for chaining
+    """
+    for name, value in FAST_START_CAPABILITIES.items():
+        options.set_capability(name, value)
+    return options
+
+
+def _command_executor(appium_server_url: str, transport: Optional[PooledTransport]):
+    """Return the command_executor for webdriver.Remote (pooled if a transport is given)."""
+    return transport.connection(appium_server_url) if transport else appium_server_url
+
+
+class _AttachedRemote(webdriver.Remote):
+    """webdriver.Remote that attaches to an existing session instead of creating a new one."""
+
+    def __init__(self, session_id: str, *args: Any, **kwargs: Any) -> None:
+        self._attach_session_id = session_id
+        super().__init__(*args, **kwargs)
+
+    def start_session(self, capabilities: Any, browser_profile: Optional[str] = None) -> None:
+        self.session_id = self._attach_session_id
+        self.caps = capabilities if isinstance(capabilities, dict) else {}
+
+
+def attach_session(
+    session_id: str,
+    options: UiAutomator2Options,
+    appium_server_url: str = 'http://localhost:4723',
+    transport: Optional[PooledTransport] = None,
+):
+    """Create a driver bound to an existing Appium session without starting a new one.
+
+    Args:
+        session_id: ID of a live session on the Appium server
+        options: UiAutomator2Options the session was created with
+        appium_server_url: URL of the Appium server (default: 'http://localhost:4723')
+        transport: Optional PooledTransport to send commands through
+
+    Returns:
+        A webdriver instance that talks to the existing session
+    """
+    logger.info(f"🔧 Attaching to existing session {session_id}")
+    return _AttachedRemote(session_id, _command_executor(appium_server_url, transport), options=options)
+
+
+def _is_session_alive(driver_instance) -> bool:
+    """Cheap health check: a session-scoped GET that does not touch the UI."""
+    try:
+        _ = driver_instance.timeouts
+        return True
+    except Exception as e:
+        logger.debug("🔧 Session %s failed health check: %s", driver_instance.session_id, e)
+        return False
+
+
+class SessionPool:
+    """Pool of warm Appium sessions keyed by server URL and capabilities.
+
+    Sessions released back to the pool stay alive and are handed out again on the next
+    acquire() with the same options, skipping session creation entirely. Idle sessions are
+    health-checked before reuse and quit after `max_idle_seconds`, which should be shorter
+    than the session's `appium:newCommandTimeout`.
+
+    Example:
+        pool = SessionPool()
+        async with appium_driver(options, pool=pool) as driver:
+            ...
+        async with appium_driver(options, pool=pool) as driver:  # reuses the session
+            ...
+        pool.close()
+    """
+
+    def __init__(
+        self,
+        max_idle_seconds: float = 240.0,
+        max_idle_sessions: int = 4,
+        transport: Optional[PooledTransport] = None,
+    ) -> None:
+        """
+        Args:
+            max_idle_seconds: Idle sessions older than this are quit instead of reused
+            max_idle_sessions: Maximum number of idle sessions kept per key
+            transport: Optional PooledTransport shared by all sessions of the pool
+        """
+        self.max_idle_seconds = max_idle_seconds
+        self.max_idle_sessions = max_idle_sessions
+        self.transport = transport
+        # {key: [(driver, released_at), ...]}
+        self._idle: Dict[Tuple[str, str], List[Tuple[Any, float]]] = {}
+        self._keys: Dict[int, Tuple[str, str]] = {}
+        self.stats = {"created": 0, "reused": 0, "evicted": 0, "unhealthy": 0}
+        # acquire()/release() run in worker threads (see appium_driver); session starts and
+        # quits happen outside the lock
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make_key(options: UiAutomator2Options, appium_server_url: str) -> Tuple[str, str]:
+        return (appium_server_url, json.dumps(options.to_capabilities(), sort_keys=True, default=str))
+
+    def acquire(self, options: UiAutomator2Options, appium_server_url: str = 'http://localhost:4723'):
+        """Return a healthy warm session for the options, or start a new one.
+
+        Args:
+            options: UiAutomator2Options instance with driver configuration
+            appium_server_url: URL of the Appium server
+
+        Returns:
+            A webdriver instance
+        """
+        self.evict_idle()
+        key = self._make_key(options, appium_server_url)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key, [])
+                if not idle:
+                    break
+                driver_instance, _ = idle.pop()
+            if _is_session_alive(driver_instance):
+                with self._lock:
+                    self.stats["reused"] += 1
+                logger.info(f"🔧 Reusing warm session {driver_instance.session_id}")
+                return driver_instance
+            with self._lock:
+                self.stats["unhealthy"] += 1
+            self._forget(driver_instance)
+            self._quit(driver_instance)
+
+        start = time.time()
+        driver_instance = webdriver.Remote(_command_executor(appium_server_url, self.transport), options=options)
+        with self._lock:
+            self.stats["created"] += 1
+            self._keys[id(driver_instance)] = key
+        logger.info(f"🔧 Started new session {driver_instance.session_id} in {time.time() - start:.2f}s")
+        return driver_instance
+
+    def release(self, driver_instance) -> None:
+        """Return a session to the pool instead of quitting it."""
+        with self._lock:
+            key = self._keys.get(id(driver_instance))
+            idle = self._idle.setdefault(key, []) if key is not None else None
+            keep = idle is not None and len(idle) < self.max_idle_sessions
+            if keep:
+                idle.append((driver_instance, time.time()))
+        if not keep:
+            self._forget(driver_instance)
+            self._quit(driver_instance)
+
+    def evict_idle(self) -> int:
+        """Quit sessions that have been idle longer than max_idle_seconds.
+
+        Returns:
+            Number of evicted sessions
+        """
+        now = time.time()
+        expired = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                expired += [d for d, released_at in idle if now - released_at > self.max_idle_seconds]
+                self._idle[key] = [(d, released_at) for d, released_at in idle if now - released_at <= self.max_idle_seconds]
+            self.stats["evicted"] += len(expired)
+        for driver_instance in expired:
+            self._forget(driver_instance)
+            self._quit(driver_instance)
+        return len(expired)
+
+    def close(self) -> None:
+        """Quit all idle sessions."""
+        with self._lock:
+            sessions = [driver_instance for idle in self._idle.values() for driver_instance, _ in idle]
+            self._idle.clear()
+        for driver_instance in sessions:
+            self._forget(driver_instance)
+            self._quit(driver_instance)
+
+    def idle_count(self) -> int:
+        """Number of idle sessions currently held by the pool."""
+        return sum(len(idle) for idle in self._idle.values())
+
+    def _forget(self, driver_instance) -> None:
+        self._keys.pop(id(driver_instance), None)
+
+    @staticmethod
+    def _quit(driver_instance) -> None:
+        try:
+            driver_instance.quit()
+        except Exception as e:
+            logger.debug("🔧 Ignoring error while quitting session: %s", e)
+
+
+class SessionSupervisor:
+    """Recreates an expired session in place and remembers the foreground app.
+
+    The new session is started on the same driver object, so references held by callers
+    (e.g. the driver yielded by appium_driver) stay valid after recovery.
+    """
+
+    def __init__(self, driver_instance, options: UiAutomator2Options) -> None:
+        """
+        Args:
+            driver_instance: The driver whose session should be kept alive
+            options: Options used to create the session, reused on recovery
+        """
+        self.driver = driver_instance
+        self.options = options
+        self.foreground_package: Optional[str] = options.to_capabilities().get("appium:appPackage")
+        self.stats = {"recoveries": 0, "failed_recoveries": 0, "time_lost_seconds": 0.0}
+        # Tools of one agent may run in several worker threads and hit the dead session together
+        self._lock = threading.Lock()
+
+    def recover(self, failed_session_id: Optional[str] = None) -> None:
+        """Start a new session with the same options and restore the foreground app.
+
+        Recoveries are serialized; if another thread already replaced the session the
+        caller saw fail, nothing is done. Caches of the dead session are dropped.
+
+        Args:
+            failed_session_id: Session the caller's command failed on (None: always recover)
+
+        Raises:
+            Exception: Any error raised while creating the new session
+        """
+        with self._lock:
+            old_session_id = self.driver.session_id
+            if failed_session_id is not None and old_session_id != failed_session_id:
+                logger.info(f"🔧 Session {failed_session_id} was already recovered as {old_session_id}")
+                return
+            start = time.time()
+            try:
+                # Bypass _AttachedRemote.start_session so attached sessions get a real new session
+                webdriver.Remote.start_session(self.driver, self.options)
+                if self.foreground_package:
+                    self.driver.activate_app(self.foreground_package)
+            except Exception:
+                self.stats["failed_recoveries"] += 1
+                raise
+            finally:
+                self.stats["time_lost_seconds"] = round(self.stats["time_lost_seconds"] + time.time() - start, 2)
+            self.stats["recoveries"] += 1
+            clear_screen_cache(old_session_id)
+            clear_frames(old_session_id)
+        logger.info(
+            f"🔧 Recovered session {old_session_id} -> {self.driver.session_id} "
+            f"(foreground: {self.foreground_package}) in {time.time() - start:.2f}s"
+        )
+
+
+def note_foreground_app(package: Optional[str]) -> None:
+    """Record the app that should be restored after a session recovery."""
+    supervisor = _bound_supervisor.get()
+    if supervisor is not None:
+        supervisor.foreground_package = package
+
+
+def note_app_terminated(package: str) -> None:
+    """Stop restoring an app after recovery once it has been terminated."""
+    supervisor = _bound_supervisor.get()
+    if supervisor is not None and supervisor.foreground_package == package:
+        supervisor.foreground_package = None
+
+
+def get_recovery_stats() -> Dict[str, Any]:
+    """Return recovery counters of the current supervised session (empty if not supervised)."""
+    supervisor = _bound_supervisor.get()
+    if supervisor is None:
+        return {}
+    return dict(supervisor.stats)
+
+
+def with_session_recovery(func: Callable) -> Callable:
+    """Retry a tool once after transparently recovering an expired session.
+
+    Only active inside appium_driver(auto_recover=True); otherwise
+    InvalidSessionIdException propagates unchanged. Apply below @tool.
+    The tools are synchronous, so under agent.ainvoke() LangChain runs them (and
+    the recovery) in a worker thread, not on the event loop.
+    """
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        supervisor = _bound_supervisor.get()
+        session_id = supervisor.driver.session_id if supervisor is not None else None
+        try:
+            return func(*args, **kwargs)
+        except InvalidSessionIdException:
+            if supervisor is None:
+                raise
+            logger.warning(f"🔧 Session expired during {func.__name__}, recovering...")
+            supervisor.recover(session_id)
+            return func(*args, **kwargs)
+    return wrapper
 
 
 @asynccontextmanager
-async def appium_driver(options: UiAutomator2Options, appium_server_url: str = 'http://localhost:4723'):
+async def appium_driver(
+    options: UiAutomator2Options,
+    appium_server_url: str = 'http://localhost:4723',
+    session_id: Optional[str] = None,
+    pool: Optional[SessionPool] = None,
+    fast_start: bool = False,
+    auto_recover: bool = False,
+    transport: Optional[PooledTransport] = None,
+):
     """Async context manager for initializing and managing the Appium driver.
     
     Args:
         options: UiAutomator2Options instance with driver configuration
         appium_server_url: URL of the Appium server (default: 'http://localhost:4723')
+        session_id: Attach to this existing session instead of creating one. The session
+            is left running on exit.
+        pool: SessionPool to acquire a warm session from. The session is released back
+            to the pool on exit instead of being quit.
+        fast_start: Apply FAST_START_CAPABILITIES to the options before creating a session
+        auto_recover: Recreate the session and retry the tool once when a tool hits
+            InvalidSessionIdException
+        transport: PooledTransport to send commands through (shared keep-alive
+            connections). Ignored when `pool` is given; configure the pool's transport instead.
         
     Yields:
         The initialized webdriver instance
@@ -27,16 +420,46 @@ async def appium_driver(options: UiAutomator2Options, appium_server_url: str = '
             element = driver.find_element(by=AppiumBy.XPATH, value='//*[@text="Battery"]')
             element.click()
     """
+    global _open_session_count
+    if fast_start:
+        apply_fast_start_profile(options)
+
     driver_instance = None
+    supervisor = None
+    binding = None
     try:
-        driver_instance = webdriver.Remote(appium_server_url, options=options)
-        global driver
-        driver = driver_instance
+        # Starting a session takes seconds: run it in a thread so that other devices'
+        # agents keep running on the event loop meanwhile
+        if session_id:
+            driver_instance = await asyncio.to_thread(attach_session, session_id, options, appium_server_url, transport)
+        elif pool is not None:
+            driver_instance = await asyncio.to_thread(pool.acquire, options, appium_server_url)
+        else:
+            driver_instance = await asyncio.to_thread(
+                webdriver.Remote, _command_executor(appium_server_url, transport), options=options
+            )
+        if auto_recover:
+            supervisor = SessionSupervisor(driver_instance, options)
+        binding = use_driver(driver_instance, supervisor)
+        binding.__enter__()
+        with _open_session_lock:
+            _open_session_count += 1
         yield driver_instance
     finally:
+        recovered = supervisor is not None and supervisor.stats["recoveries"] > 0
+        if binding is not None:
+            binding.__exit__(None, None, None)
+            with _open_session_lock:
+                _open_session_count -= 1
         if driver_instance:
-            driver_instance.quit()
-            driver = None
+            clear_screen_cache(driver_instance.session_id)
+            clear_frames(driver_instance.session_id)
+            if session_id and not recovered:
+                pass  # Attached sessions are owned by someone else
+            elif pool is not None:
+                await asyncio.to_thread(pool.release, driver_instance)
+            else:
+                await asyncio.to_thread(driver_instance.quit)
 
 
 @tool
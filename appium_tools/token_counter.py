@@ -2,10 +2,117 @@
 Token counting and cost calculation functionality using tiktoken
 OpenAI APIのトークン数計算と費用計算機能
 """
+import json
+import logging
+import time
 from typing import Any, Dict, List, Optional, Tuple
 from contextlib import contextmanager
 from langchain_core.callbacks.base import BaseCallbackHandler
 
+logger = logging.getLogger(__name__)
+
+# モデル名 -> tiktoken encoding（取得できなかった場合は None をキャッシュ）
+_encodings: Dict[str, Any] = {}
+
+# tiktoken のエンコーディングを取得できない環境での概算（1トークンあたりの文字数）
+APPROX_CHARS_PER_TOKEN = 4
+
+
+def _get_encoding(model: str):
+    if model not in _encodings:
+        try:
+            import tiktoken
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # オフライン環境ではBPEファイルをダウンロードできないため概算にフォールバック
+            logger.debug("🔧 tiktoken encoding for %s unavailable, estimating tokens: %s", model, e)
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4.1") -> int:
+    """
+    テキストのトークン数を tiktoken で数える
+    
+    エンコーディングを読み込めない場合（オフラインなど）は文字数から概算する
+    
+    Args:
+        text: 対象のテキスト
+        model: エンコーディングを選ぶためのモデル名
+        
+    Returns:
+        トークン数
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // APPROX_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+# OpenAIのチャット形式のオーバーヘッド（メッセージごと・name付き・応答の開始）
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+REPLY_PRIMING_TOKENS = 3
+
+# (モデル名, メッセージのキー) -> トークン数。長い会話でも過去のメッセージを毎回数え直さない
+_message_tokens: Dict[Tuple[str, Any], int] = {}
+MAX_CACHED_MESSAGES = 20_000
+
+
+def _message_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    # マルチモーダルのcontentはテキスト部分のみ数える（画像はトークン化の方式が異なるため対象外）
+    parts = []
+    for part in content or []:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and part.get("type") == "text":
+            parts.append(part.get("text", ""))
+    return "".join(parts)
+
+
+def count_message_tokens(message: Any, model: str = "gpt-4.1") -> int:
+    """
+    1メッセージのトークン数（チャット形式のオーバーヘッドとツール呼び出しの引数を含む）
+    
+    同じ内容のメッセージの結果はキャッシュされる（strのハッシュはオブジェクトに保持されるため、キーの計算は軽い）
+    """
+    content = message.content
+    tool_calls = getattr(message, "tool_calls", None) or []
+    key = (
+        model,
+        (
+            message.type,
+            getattr(message, "name", None),
+            hash(content) if isinstance(content, str) else hash(json.dumps(content, sort_keys=True, default=str)),
+            hash(json.dumps(tool_calls, sort_keys=True, default=str)) if tool_calls else 0,
+        ),
+    )
+    tokens = _message_tokens.get(key)
+    if tokens is None:
+        tokens = TOKENS_PER_MESSAGE + count_tokens(_message_text(content), model)
+        if getattr(message, "name", None):
+            tokens += TOKENS_PER_NAME + count_tokens(message.name, model)
+        for call in tool_calls:
+            tokens += count_tokens(call["name"], model) + count_tokens(json.dumps(call["args"], ensure_ascii=False), model)
+        if len(_message_tokens) >= MAX_CACHED_MESSAGES:
+            _message_tokens.clear()
+        _message_tokens[key] = tokens
+    return tokens
+
+
+def count_messages_tokens(messages: List[Any], model: str = "gpt-4.1") -> int:
+    """
+    チャットリクエスト全体の入力トークン数の見積もり（APIのusageが返らない場合の代わり）
+    """
+    return sum(count_message_tokens(message, model) for message in messages) + REPLY_PRIMING_TOKENS
+
 
 class OpenAIPricingCalculator:
     """OpenAI APIの料金計算クラス"""
@@ -189,7 +296,7 @@ class OpenAIPricingCalculator:
     }
     
     @classmethod
-    def calculate_cost(cls, model_name: str, input_tokens: int, output_tokens: int) -> Dict[str, float]:
+    def calculate_cost(cls, model_name: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> Dict[str, float]:
         """
         トークン数から費用を計算する
         
@@ -197,6 +304,7 @@ class OpenAIPricingCalculator:
             model_name: OpenAIモデル名
             input_tokens: 入力トークン数
             output_tokens: 出力トークン数
+            cached_tokens: 入力トークンのうちキャッシュヒットした数（キャッシュ料金で計算）
             
         Returns:
             Dict containing input_cost, output_cost, total_cost in USD
@@ -208,7 +316,7 @@ class OpenAIPricingCalculator:
         pricing = cls.PRICING.get(normalized_model, cls.PRICING["default"])
         
         # 費用計算（1K tokens単位での料金なので、1000で割る）
-        input_cost = (input_tokens / 1000) * pricing["input"]
+        input_cost = ((input_tokens - cached_tokens) / 1000) * pricing["input"] + (cached_tokens / 1000) * pricing["cached"]
         output_cost = (output_tokens / 1000) * pricing["output"]
         total_cost = input_cost + output_cost
         
@@ -336,53 +444,237 @@ class TiktokenCountCallback(BaseCallbackHandler):
         # ainvokeごとの履歴を保存するリスト（セッション単位）
         self.invocation_history: List[Dict[str, Any]] = []
         self._current_invocation_id = 0
+        
+        # ストリーミングのタイミング（run_idごと）とツール実行時間の履歴
+        self._run_timings: Dict[Any, Dict[str, Any]] = {}
+        self.tool_history: List[Dict[str, Any]] = []
+        self._tool_runs: Dict[Any, Dict[str, Any]] = {}
     
     def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
         """LLM開始時に呼び出される - 新しいinvocationの開始を記録"""
+        prompt_tokens = sum(count_tokens(prompt, self.model) for prompt in prompts)
+        self._start_run(kwargs, prompt_tokens)
+    
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any) -> None:
+        """チャットモデル開始時に呼び出される - メッセージをtiktokenで数えて入力トークンを見積もる"""
+        prompt_tokens = sum(count_messages_tokens(batch, self.model) for batch in messages)
+        self._start_run(kwargs, prompt_tokens)
+    
+    def _start_run(self, kwargs: Dict[str, Any], prompt_tokens: int) -> None:
         self._current_invocation_id += 1
-        self._current_invocation_start_time = __import__('time').time()
+        self._current_invocation_start_time = time.time()
+        # このリクエストで送られたツール定義（スキーマ）のトークン数
+        tool_schema_tokens = self._tool_schema_tokens(kwargs.get("invocation_params") or {})
+        estimated_input_tokens = prompt_tokens + tool_schema_tokens
+        self._run_timings[kwargs.get("run_id")] = {
+            "start": self._current_invocation_start_time,
+            "first_token": None,
+            "last_token": None,
+            "chunks": 0,
+            "tool_schema_tokens": tool_schema_tokens,
+            "estimated_input_tokens": estimated_input_tokens,
+            # 送信前の入力費用の予測（出力トークン数は送信前には分からない）
+            "predicted_input_cost_usd": self._calculate_invocation_cost(estimated_input_tokens, 0, 0)["input_cost"],
+        }
+    
+    def _tool_schema_tokens(self, invocation_params: Dict[str, Any]) -> int:
+        tools = invocation_params.get("tools")
+        if not tools:
+            return 0
+        schemas = json.dumps(tools, ensure_ascii=False, default=str)
+        key = (self.model, ("tools", hash(schemas)))
+        if key not in _message_tokens:
+            _message_tokens[key] = count_tokens(schemas, self.model)
+        return _message_tokens[key]
+    
+    def predict_cost(self, messages: List[Any], tools: Optional[List[Any]] = None, expected_output_tokens: int = 0) -> Dict[str, Any]:
+        """
+        送信前にリクエストの入力トークン数と費用を予測
+        
+        Args:
+            messages: 送信するメッセージ（BaseMessageのリスト）
+            tools: 送信するツール定義（OpenAI形式のdictのリスト）
+            expected_output_tokens: 見込みの出力トークン数
+            
+        Returns:
+            {"input_tokens", "output_tokens", "input_cost_usd", "output_cost_usd", "total_cost_usd"}
+        """
+        input_tokens = count_messages_tokens(messages, self.model) + self._tool_schema_tokens({"tools": tools})
+        cost = self._calculate_invocation_cost(input_tokens, 0, expected_output_tokens)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": expected_output_tokens,
+            "input_cost_usd": cost["input_cost"],
+            "output_cost_usd": cost["output_cost"],
+            "total_cost_usd": cost["total_cost"],
+        }
     
     def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
-        """ストリーミング時に呼び出される（何もしない）"""
-        pass
+        """ストリーミング時に呼び出される - 最初のトークンまでの時間とトークン間隔を記録"""
+        timing = self._run_timings.get(kwargs.get("run_id"))
+        if timing is None:
+            return
+        now = time.time()
+        if timing["first_token"] is None:
+            timing["first_token"] = now
+        timing["last_token"] = now
+        timing["chunks"] += 1
+    
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        """ツール開始時に呼び出される - モデルのレイテンシとツールのレイテンシを分けるために記録"""
+        self._tool_runs[kwargs.get("run_id")] = {
+            "tool": (serialized or {}).get("name") or kwargs.get("name", "unknown"),
+            "start": time.time(),
+            "invocation_id": self._current_invocation_id,
+        }
+    
+    def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        """ツール完了時に呼び出される - 出力のトークン数（次のLLM呼び出しの入力になる）も記録"""
+        content = getattr(output, "content", output)
+        self._record_tool_run(kwargs.get("run_id"), error=False, output=content if isinstance(content, str) else str(content))
+    
+    def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        """ツール失敗時に呼び出される"""
+        self._record_tool_run(kwargs.get("run_id"), error=True, output=str(error))
+    
+    def _record_tool_run(self, run_id: Any, error: bool, output: str = "") -> None:
+        run = self._tool_runs.pop(run_id, None)
+        if run is None:
+            return
+        self.tool_history.append({
+            "tool": run["tool"],
+            "invocation_id": run["invocation_id"],
+            "elapsed_seconds": round(time.time() - run["start"], 3),
+            "output_tokens": count_tokens(output, self.model),
+            "error": error,
+        })
+    
+    def _tool_input_tokens(self, invocation_id: int) -> Dict[str, int]:
+        """このinvocationの入力に含まれるツール出力のトークン数（直前のLLM呼び出し後に実行されたツール）"""
+        attribution: Dict[str, int] = {}
+        for run in self.tool_history:
+            if run["invocation_id"] == invocation_id - 1:
+                attribution[run["tool"]] = attribution.get(run["tool"], 0) + run["output_tokens"]
+        return attribution
+    
+    @staticmethod
+    def _extract_token_usage(response) -> Tuple[int, int, int]:
+        """
+        レスポンスから (prompt_tokens, completion_tokens, cached_tokens) を取得
+        
+        llm_output の token_usage を優先し、ストリーミング時（llm_output なし）は
+        メッセージの usage_metadata を使用する
+        """
+        llm_output = getattr(response, 'llm_output', None) or {}
+        token_usage = llm_output.get('token_usage')
+        if token_usage:
+            # キャッシュされたトークンを取得（50%割引適用）
+            prompt_details = token_usage.get('prompt_tokens_details') or {}
+            return (
+                token_usage.get('prompt_tokens', 0),
+                token_usage.get('completion_tokens', 0),
+                prompt_details.get('cached_tokens', 0) or 0,
+            )
+        
+        for generation_list in getattr(response, 'generations', None) or []:
+            for generation in generation_list:
+                usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+                if usage:
+                    details = usage.get('input_token_details') or {}
+                    return (
+                        usage.get('input_tokens', 0),
+                        usage.get('output_tokens', 0),
+                        details.get('cache_read', 0) or 0,
+                    )
+        
+        if not llm_output:
+            raise ValueError("APIレスポンスにllm_outputが含まれていません")
+        raise ValueError("APIレスポンスにtoken_usageが含まれていません")
+    
+    def _estimate_output_tokens(self, response) -> int:
+        """
+        生成されたテキストとツール呼び出しをtiktokenで数える（usageが返らない場合）
+        """
+        tokens = 0
+        for generation_list in getattr(response, 'generations', None) or []:
+            for generation in generation_list:
+                message = getattr(generation, 'message', None)
+                if message is not None:
+                    tokens += count_message_tokens(message, self.model) - TOKENS_PER_MESSAGE
+                else:
+                    tokens += count_tokens(getattr(generation, 'text', ''), self.model)
+        return tokens
+    
+    @staticmethod
+    def _response_model_name(response) -> Optional[str]:
+        """
+        レスポンスから実際に応答したモデル名を取得（モデルルーティング時は呼び出しごとに異なる）
+        """
+        llm_output = getattr(response, 'llm_output', None) or {}
+        if llm_output.get('model_name'):
+            return llm_output['model_name']
+        for generation_list in getattr(response, 'generations', None) or []:
+            for generation in generation_list:
+                metadata = getattr(getattr(generation, 'message', None), 'response_metadata', None) or {}
+                if metadata.get('model_name'):
+                    return metadata['model_name']
+        return None
     
     def on_llm_end(self, response, **kwargs: Any) -> None:
         """
         Called when LLM completes - count tokens from actual API response
         LLM完了時に呼び出され、実際のAPIレスポンスからトークン数を取得し、履歴に記録
         """
-        if not (hasattr(response, 'llm_output') and response.llm_output):
-            raise ValueError("APIレスポンスにllm_outputが含まれていません")
-        
-        token_usage = response.llm_output.get('token_usage')
-        if not token_usage:
-            raise ValueError("APIレスポンスにtoken_usageが含まれていません")
-        
-        # OpenAI APIの実際の使用量を使用
-        prompt_tokens = token_usage.get('prompt_tokens', 0)
-        completion_tokens = token_usage.get('completion_tokens', 0)
-        
-        # キャッシュされたトークンを取得（50%割引適用）
-        prompt_details = token_usage.get('prompt_tokens_details', {})
-        cached_tokens = prompt_details.get('cached_tokens', 0)
+        timing = self._run_timings.pop(kwargs.get("run_id"), None)
+        
+        # OpenAI APIの実際の使用量を使用（usageが返らない場合はtiktokenでの見積もり）
+        usage_estimated = False
+        try:
+            prompt_tokens, completion_tokens, cached_tokens = self._extract_token_usage(response)
+        except ValueError:
+            if timing is None:
+                raise
+            prompt_tokens = timing["estimated_input_tokens"]
+            completion_tokens = self._estimate_output_tokens(response)
+            cached_tokens = 0
+            usage_estimated = True
+            logger.debug("🔧 No token usage in the response, using the tiktoken estimate")
         
         # 通常トークンとキャッシュトークンを分けて記録
         self.input_tokens += prompt_tokens
         self.cached_tokens = getattr(self, 'cached_tokens', 0) + cached_tokens
         self.output_tokens += completion_tokens
         
-        # このinvocationの費用を計算
+        # このinvocationの費用を計算（実際に応答したモデルの料金で）
+        model = self._response_model_name(response) or self.model
         invocation_cost = self._calculate_invocation_cost(
-            prompt_tokens, cached_tokens, completion_tokens
+            prompt_tokens, cached_tokens, completion_tokens, model
         )
         
+        # ストリーミング時: 最初のトークンまでの時間（TTFT）とトークン生成速度
+        end_time = time.time()
+        ttft_seconds = None
+        tokens_per_second = None
+        if timing is not None and timing["first_token"] is not None:
+            ttft_seconds = round(timing["first_token"] - timing["start"], 3)
+            generation_time = timing["last_token"] - timing["first_token"]
+            if timing["chunks"] > 1 and generation_time > 0:
+                tokens_per_second = round((timing["chunks"] - 1) / generation_time, 1)
+        
         # 履歴に記録
-        elapsed_time = __import__('time').time() - getattr(self, '_current_invocation_start_time', __import__('time').time())
+        elapsed_time = end_time - (timing["start"] if timing else getattr(self, '_current_invocation_start_time', end_time))
         invocation_record = {
             "invocation_id": self._current_invocation_id,
             "timestamp": __import__('datetime').datetime.now().isoformat(),
             "elapsed_seconds": round(elapsed_time, 2),
-            "model": self.model,
+            "ttft_seconds": ttft_seconds,
+            "tokens_per_second": tokens_per_second,
+            "tool_input_tokens": self._tool_input_tokens(self._current_invocation_id),
+            "tool_schema_tokens": timing["tool_schema_tokens"] if timing else 0,
+            "estimated_input_tokens": timing["estimated_input_tokens"] if timing else None,
+            "predicted_input_cost_usd": timing["predicted_input_cost_usd"] if timing else None,
+            "usage_estimated": usage_estimated,
+            "model": model,
             "input_tokens": prompt_tokens,
             "cached_tokens": cached_tokens,
             "output_tokens": completion_tokens,
@@ -394,31 +686,39 @@ class TiktokenCountCallback(BaseCallbackHandler):
         }
         self.invocation_history.append(invocation_record)
     
-    def _calculate_invocation_cost(self, input_tokens: int, cached_tokens: int, output_tokens: int) -> Dict[str, float]:
+    def _model_cost(self, model: str, input_tokens: int, cached_tokens: int, output_tokens: int) -> Dict[str, float]:
         """
-        単一invocationの費用を計算
+        指定モデルの料金で費用を計算（丸めなし）
         """
-        normalized_model = self.pricing_calculator._normalize_model_name(self.model)
+        normalized_model = self.pricing_calculator._normalize_model_name(model)
         pricing = self.pricing_calculator.PRICING.get(normalized_model, self.pricing_calculator.PRICING["default"])
         
         # 通常の入力トークン（キャッシュされていない部分）
         non_cached_tokens = input_tokens - cached_tokens
         
         # 費用計算
+        # 通常の入力トークン: 通常料金
         non_cached_cost = (non_cached_tokens / 1000) * pricing["input"]
+        # キャッシュヒットトークン: キャッシュ料金（モデルごとに異なる）
         cached_cost = (cached_tokens / 1000) * pricing["cached"]
+        # 出力トークン: 通常料金
         output_cost = (output_tokens / 1000) * pricing["output"]
         
         input_cost = non_cached_cost + cached_cost
-        total_cost = input_cost + output_cost
-        
         return {
-            "input_cost": round(input_cost, 6),
-            "output_cost": round(output_cost, 6),
-            "cached_cost": round(cached_cost, 6),
-            "total_cost": round(total_cost, 6),
+            "input_cost": input_cost,
+            "output_cost": output_cost,
+            "cached_cost": cached_cost,
+            "total_cost": input_cost + output_cost,
         }
     
+    def _calculate_invocation_cost(self, input_tokens: int, cached_tokens: int, output_tokens: int, model: Optional[str] = None) -> Dict[str, float]:
+        """
+        単一invocationの費用を計算
+        """
+        cost = self._model_cost(model or self.model, input_tokens, cached_tokens, output_tokens)
+        return {key: round(value, 6) for key, value in cost.items()}
+    
     @property
     def total_tokens(self) -> int:
         """Total tokens used (input + output)"""
@@ -428,31 +728,24 @@ class TiktokenCountCallback(BaseCallbackHandler):
         """
         Calculate the cost breakdown for the tokens used
         使用されたトークンの費用内訳を計算（キャッシュ割引を考慮）
-        """
-        # モデル名を正規化
-        normalized_model = self.pricing_calculator._normalize_model_name(self.model)
-        pricing = self.pricing_calculator.PRICING.get(normalized_model, self.pricing_calculator.PRICING["default"])
         
-        # 通常の入力トークン（キャッシュされていない部分）
-        non_cached_tokens = self.input_tokens - self.cached_tokens
-        
-        # 費用計算
-        # 通常の入力トークン: 通常料金
-        non_cached_cost = (non_cached_tokens / 1000) * pricing["input"]
-        # キャッシュヒットトークン: キャッシュ料金（モデルごとに異なる）
-        cached_cost = (self.cached_tokens / 1000) * pricing["cached"]
-        # 出力トークン: 通常料金
-        output_cost = (self.output_tokens / 1000) * pricing["output"]
-        
-        input_cost = non_cached_cost + cached_cost
-        total_cost = input_cost + output_cost
-        
-        return {
-            "input_cost": round(input_cost, 6),
-            "output_cost": round(output_cost, 6),
-            "total_cost": round(total_cost, 6),
-            "cached_cost": round(cached_cost, 6),
-        }
+        複数のモデルが使われた場合（モデルルーティング）は、モデルごとの料金で計算して合算する
+        """
+        tokens_by_model: Dict[str, List[int]] = {}
+        for record in self.invocation_history:
+            totals = tokens_by_model.setdefault(record["model"], [0, 0, 0])
+            totals[0] += record["input_tokens"]
+            totals[1] += record["cached_tokens"]
+            totals[2] += record["output_tokens"]
+        if not tokens_by_model:
+            tokens_by_model[self.model] = [self.input_tokens, self.cached_tokens, self.output_tokens]
+        
+        breakdown = {"input_cost": 0.0, "output_cost": 0.0, "total_cost": 0.0, "cached_cost": 0.0}
+        for model, (input_tokens, cached_tokens, output_tokens) in tokens_by_model.items():
+            cost = self._model_cost(model, input_tokens, cached_tokens, output_tokens)
+            for key in breakdown:
+                breakdown[key] += cost[key]
+        return {key: round(value, 6) for key, value in breakdown.items()}
     
     def get_metrics(self) -> Dict[str, Any]:
         """
@@ -485,6 +778,9 @@ class TiktokenCountCallback(BaseCallbackHandler):
         self.output_tokens = 0
         self.invocation_history.clear()
         self._current_invocation_id = 0
+        self._run_timings.clear()
+        self.tool_history.clear()
+        self._tool_runs.clear()
     
     def get_invocation_history(self) -> List[Dict[str, Any]]:
         """
@@ -557,6 +853,73 @@ class TiktokenCountCallback(BaseCallbackHandler):
             "average_cost_per_invocation": round(total_cost / count, 6),
         }
     
+    def get_latency_breakdown(self, start_index: int = 0) -> Dict[str, Any]:
+        """
+        モデルのレイテンシとツールのレイテンシを分けて集計
+        
+        Args:
+            start_index: この位置以降のinvocation（とその後のツール呼び出し）のみを集計
+            
+        Returns:
+            model_seconds, tool_seconds, tool_calls, average_ttft_seconds, per-tool seconds
+        """
+        history = self.invocation_history[start_index:]
+        first_id = history[0]["invocation_id"] if history else self._current_invocation_id + 1
+        tools = [t for t in self.tool_history if t["invocation_id"] >= first_id]
+        ttfts = [inv["ttft_seconds"] for inv in history if inv.get("ttft_seconds") is not None]
+        per_tool: Dict[str, float] = {}
+        for t in tools:
+            per_tool[t["tool"]] = round(per_tool.get(t["tool"], 0.0) + t["elapsed_seconds"], 3)
+        return {
+            "model_seconds": round(sum(inv["elapsed_seconds"] for inv in history), 2),
+            "tool_seconds": round(sum(t["elapsed_seconds"] for t in tools), 2),
+            "tool_calls": len(tools),
+            "average_ttft_seconds": round(sum(ttfts) / len(ttfts), 3) if ttfts else None,
+            "tools": per_tool,
+        }
+    
+    def get_model_breakdown(self, start_index: int = 0) -> Dict[str, Dict[str, Any]]:
+        """
+        モデルごとの呼び出し数・トークン数・費用・レイテンシを集計（モデルルーティングの調整用）
+        
+        Args:
+            start_index: この位置以降のinvocationのみを集計
+            
+        Returns:
+            {model: {calls, input_tokens, cached_tokens, output_tokens, total_cost_usd,
+                     model_seconds, average_latency_seconds, average_ttft_seconds}}
+        """
+        breakdown: Dict[str, Dict[str, Any]] = {}
+        ttfts: Dict[str, List[float]] = {}
+        for inv in self.invocation_history[start_index:]:
+            stats = breakdown.setdefault(inv["model"], {
+                "calls": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0,
+                "total_cost_usd": 0.0, "model_seconds": 0.0,
+            })
+            stats["calls"] += 1
+            stats["input_tokens"] += inv["input_tokens"]
+            stats["cached_tokens"] += inv["cached_tokens"]
+            stats["output_tokens"] += inv["output_tokens"]
+            stats["total_cost_usd"] += inv["total_cost_usd"]
+            stats["model_seconds"] += inv["elapsed_seconds"]
+            if inv.get("ttft_seconds") is not None:
+                ttfts.setdefault(inv["model"], []).append(inv["ttft_seconds"])
+        for model, stats in breakdown.items():
+            stats["total_cost_usd"] = round(stats["total_cost_usd"], 6)
+            stats["model_seconds"] = round(stats["model_seconds"], 2)
+            stats["average_latency_seconds"] = round(stats["model_seconds"] / stats["calls"], 2)
+            model_ttfts = ttfts.get(model)
+            stats["average_ttft_seconds"] = round(sum(model_ttfts) / len(model_ttfts), 3) if model_ttfts else None
+        return breakdown
+    
+    @staticmethod
+    def _format_model_lines(breakdown: Dict[str, Dict[str, Any]]) -> List[str]:
+        return [
+            f"🤖 {model}: {stats['calls']} calls, ${stats['total_cost_usd']:.6f}, "
+            f"avg {stats['average_latency_seconds']}s/call"
+            for model, stats in breakdown.items()
+        ]
+    
     def format_invocation_details(self, width: int = 70) -> str:
         """
         各LLM呼び出しの詳細を整形された文字列で返す
@@ -666,10 +1029,19 @@ class TiktokenCountCallback(BaseCallbackHandler):
         for inv in loop_history:
             lines.append(f"\n🔹 Call #{inv['invocation_id']} ({inv['elapsed_seconds']}s)")
             lines.append(f"   Model: {inv['model']}")
-            lines.append(f"   Tokens: {inv['input_tokens']} input + {inv['output_tokens']} output = {inv['total_tokens']} total")
+            estimated = " (estimated, no usage in response)" if inv.get('usage_estimated') else ""
+            lines.append(f"   Tokens: {inv['input_tokens']} input + {inv['output_tokens']} output = {inv['total_tokens']} total{estimated}")
             if inv['cached_tokens'] > 0:
                 lines.append(f"   💾 Cache Hit: {inv['cached_tokens']} tokens saved ${inv['cached_cost_usd']:.6f}")
             lines.append(f"   💰 Cost: ${inv['total_cost_usd']:.6f}")
+            if inv.get('tool_input_tokens'):
+                attribution = ", ".join(f"{name}: {tokens}" for name, tokens in inv['tool_input_tokens'].items())
+                lines.append(f"   🧰 Tool output tokens: {attribution}")
+            if inv.get('tool_schema_tokens'):
+                lines.append(f"   🧩 Tool schemas: ~{inv['tool_schema_tokens']} tokens")
+            if inv.get('ttft_seconds') is not None:
+                rate = f", {inv['tokens_per_second']} tokens/s" if inv.get('tokens_per_second') else ""
+                lines.append(f"   ⚡ TTFT: {inv['ttft_seconds']}s{rate}")
             
             loop_input_tokens += inv['input_tokens']
             loop_cached_tokens += inv['cached_tokens']
@@ -678,6 +1050,12 @@ class TiktokenCountCallback(BaseCallbackHandler):
         
         lines.append("\n" + "-" * width)
         lines.append(f"📊 This Query Total: {len(loop_history)} calls, {loop_input_tokens + loop_output_tokens} tokens, ${loop_cost:.6f}")
+        models = self.get_model_breakdown(start_index)
+        if len(models) > 1:
+            lines.extend(self._format_model_lines(models))
+        latency = self.get_latency_breakdown(start_index)
+        if latency["tool_calls"]:
+            lines.append(f"⏱️  Model: {latency['model_seconds']}s | Tools: {latency['tool_seconds']}s ({latency['tool_calls']} calls)")
         lines.append("=" * width)
         
         return "\n".join(lines)
@@ -707,6 +1085,9 @@ class TiktokenCountCallback(BaseCallbackHandler):
             lines.append(f"💾 Total Cached: {summary['total_cached_tokens']} tokens")
         lines.append(f"💰 Total Cost: ${summary['total_cost_usd']:.6f}")
         lines.append(f"📊 Average: {summary['average_tokens_per_invocation']:.1f} tokens/call, ${summary['average_cost_per_invocation']:.6f}/call")
+        models = self.get_model_breakdown()
+        if len(models) > 1:
+            lines.extend(self._format_model_lines(models))
         lines.append("=" * width)
         
         return "\n".join(lines)
@@ -0,0 +1,150 @@
+"""Pooled HTTP transport for the Appium client."""
+
+import logging
+import socket
+from typing import Any, Dict, List, Tuple
+import urllib3
+from urllib3.connection import HTTPConnection
+from appium.webdriver.appium_connection import AppiumConnection
+from appium.webdriver.client_config import AppiumClientConfig
+from selenium.webdriver.common.proxy import Proxy, ProxyType
+
+logger = logging.getLogger(__name__)
+
+
+def _keepalive_socket_options(idle_seconds: int, interval_seconds: int) -> List[Tuple[int, int, int]]:
+    """TCP_NODELAY (urllib3 default) plus TCP keep-alive probes where the platform supports them."""
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle_seconds))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval_seconds))
+    return options
+
+
+class PooledAppiumConnection(AppiumConnection):
+    """AppiumConnection that sends every command through a shared PooledTransport."""
+
+    def __init__(self, client_config: AppiumClientConfig, transport: "PooledTransport") -> None:
+        # _get_connection_manager() is called from the base __init__
+        self._transport = transport
+        super().__init__(client_config=client_config)
+
+    def _get_connection_manager(self):
+        return self._transport.pool_manager
+
+    def close(self) -> None:
+        """Keep shared connections open when a driver quits; PooledTransport.close() releases them."""
+        pass
+
+
+class PooledTransport:
+    """Shared, keep-alive urllib3 connection pool for one or more Appium sessions.
+
+    By default every webdriver.Remote owns a private connection manager. Passing the
+    same PooledTransport to appium_driver() / SessionPool lets all sessions (and all
+    devices behind the same Appium server or grid) reuse warm TCP/TLS connections.
+
+    Example:
+        transport = PooledTransport(maxsize=16)
+        async with appium_driver(options, transport=transport) as driver:
+            ...
+        print(transport.get_stats())
+        transport.close()
+    """
+
+    def __init__(
+        self,
+        num_pools: int = 10,
+        maxsize: int = 8,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        block: bool = False,
+        tcp_keepalive: bool = True,
+        keepalive_idle_seconds: int = 30,
+        keepalive_interval_seconds: int = 10,
+        http2: bool = False,
+    ) -> None:
+        """
+        Args:
+            num_pools: Number of per-host connection pools to keep (one per Appium server)
+            maxsize: Connections kept alive per host; raise this when driving many devices
+                concurrently through one server
+            connect_timeout: TCP/TLS connect timeout in seconds
+            read_timeout: Response timeout in seconds (long enough for slow commands
+                such as page_source on big screens)
+            block: Wait for a free connection instead of opening extra ones beyond maxsize
+            tcp_keepalive: Enable TCP keep-alive probes on pooled sockets
+            keepalive_idle_seconds: Idle time before the first keep-alive probe
+            keepalive_interval_seconds: Interval between keep-alive probes
+            http2: Negotiate HTTP/2 with https:// grids (requires the `h2` package).
+                This switches urllib3 to HTTP/2 for the whole process.
+        """
+        if http2:
+            try:
+                from urllib3.http2 import inject_into_urllib3
+                inject_into_urllib3()
+            except ImportError as e:
+                raise ImportError("HTTP/2 transport requires the 'h2' package: pip install h2") from e
+
+        socket_options = (
+            _keepalive_socket_options(keepalive_idle_seconds, keepalive_interval_seconds)
+            if tcp_keepalive else HTTPConnection.default_socket_options
+        )
+        self.timeout = urllib3.Timeout(connect=connect_timeout, read=read_timeout)
+        self.pool_manager = urllib3.PoolManager(
+            num_pools=num_pools,
+            maxsize=maxsize,
+            block=block,
+            timeout=self.timeout,
+            socket_options=socket_options,
+        )
+        self.http2 = http2
+
+    def connection(self, appium_server_url: str) -> PooledAppiumConnection:
+        """Create a command executor for webdriver.Remote that uses this transport.
+
+        Args:
+            appium_server_url: URL of the Appium server or grid
+
+        Returns:
+            A PooledAppiumConnection to pass as webdriver.Remote's command_executor
+        """
+        client_config = AppiumClientConfig(
+            remote_server_addr=appium_server_url,
+            keep_alive=True,
+            timeout=self.timeout,
+            proxy=Proxy(raw={"proxyType": ProxyType.DIRECT}),
+        )
+        return PooledAppiumConnection(client_config=client_config, transport=self)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return connections opened vs reused across all hosts.
+
+        Returns:
+            Dict with connections_opened, requests, connections_reused and per-host details
+        """
+        hosts = {}
+        opened = 0
+        requests = 0
+        for key in list(self.pool_manager.pools.keys()):
+            pool = self.pool_manager.pools.get(key)
+            if pool is None:
+                continue
+            hosts[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+            }
+            opened += pool.num_connections
+            requests += pool.num_requests
+        return {
+            "connections_opened": opened,
+            "requests": requests,
+            "connections_reused": max(0, requests - opened),
+            "hosts": hosts,
+        }
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        self.pool_manager.clear()
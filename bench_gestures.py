@@ -0,0 +1,146 @@
+"""
+Microbenchmark: HTTP commands per gesture for the W3C Actions gesture engine
+ジェスチャーごとのAppiumコマンド数（HTTPラウンドトリップ数）を計測するベンチマーク
+
+Offline (default): a recording driver counts the commands each gesture sends and
+simulates a fixed round-trip time per command.
+
+    uv run python bench_gestures.py
+    uv run python bench_gestures.py --rtt-ms 50
+
+Live: run the gestures against a real device and count the commands actually sent.
+
+    uv run python bench_gestures.py --server http://localhost:4723
+"""
+
+import argparse
+import time
+
+from appium_tools import gestures
+
+
+class RecordingDriver:
+    """Appium driver stand-in that records commands and sleeps rtt per command."""
+
+    def __init__(self, rtt_ms: float):
+        self.rtt = rtt_ms / 1000
+        self.commands = []
+        self.session_id = "bench"
+
+    def execute(self, command, params=None):
+        self.commands.append(command)
+        time.sleep(self.rtt)
+        return {"value": None}
+
+    def execute_script(self, script, *args):
+        return self.execute(f"executeScript({script})", args)
+
+    def find_element(self, by, value):
+        self.execute("findElement", {"using": by, "value": value})
+        return RecordingElement(self)
+
+
+class RecordingElement:
+    id = "element-1"
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    @property
+    def rect(self):
+        self.driver.execute("getElementRect")
+        return {"x": 100, "y": 500, "width": 800, "height": 60}
+
+
+def legacy_double_tap(driver):
+    """Previous implementation: find_element + two separate TouchAction.perform() calls."""
+    driver.find_element("xpath", "//*[@text='Battery']")
+    driver.execute("touchPerform")
+    driver.execute("touchPerform")
+
+
+def engine_double_tap(driver):
+    element = driver.find_element("xpath", "//*[@text='Battery']")
+    gestures.double_tap(driver, element=element)
+
+
+def engine_double_tap_cached(driver):
+    """Bounds already known from the page-source cache: no element lookup."""
+    gestures.double_tap(driver, point=(500, 530))
+
+
+SCENARIOS = [
+    ("double_tap (legacy TouchAction)", legacy_double_tap),
+    ("double_tap (engine)", engine_double_tap),
+    ("double_tap (engine, cached bounds)", engine_double_tap_cached),
+    ("long_press", lambda d: gestures.long_press(d, (500, 530), 1000)),
+    ("pinch", lambda d: gestures.pinch(d, (540, 1200), 200, 800)),
+    ("swipe (1 finger)", lambda d: gestures.swipe(d, (540, 1800), (540, 600))),
+    ("swipe (3 fingers)", lambda d: gestures.swipe(d, (540, 1800), (540, 600), fingers=3)),
+    ("drag", lambda d: gestures.drag(d, (300, 500), (300, 1500))),
+]
+
+
+def run_offline(rtt_ms: float, repeat: int) -> None:
+    print(f"{'gesture':<38} {'commands':>8} {'client ms':>10}  (simulated rtt {rtt_ms}ms)")
+    print("-" * 70)
+    for name, scenario in SCENARIOS:
+        driver = RecordingDriver(rtt_ms)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            scenario(driver)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+        print(f"{name:<38} {len(driver.commands) // repeat:>8} {elapsed_ms:>10.1f}")
+
+
+def run_live(server_url: str, repeat: int) -> None:
+    from appium import webdriver
+    from appium.options.android import UiAutomator2Options
+
+    options = UiAutomator2Options()
+    options.set_capability("platformName", "Android")
+    options.set_capability("appium:automationName", "uiautomator2")
+    options.set_capability("appium:appPackage", "com.android.settings")
+    options.set_capability("appium:appActivity", ".Settings")
+    driver = webdriver.Remote(server_url, options=options)
+    commands = []
+    original_execute = driver.execute
+
+    def counting_execute(command, params=None):
+        commands.append(command)
+        return original_execute(command, params)
+
+    driver.execute = counting_execute
+    try:
+        size = driver.get_window_size()
+        cx, cy = size["width"] // 2, size["height"] // 2
+        live = [
+            ("double_tap (engine)", lambda: gestures.double_tap(driver, point=(cx, cy))),
+            ("long_press", lambda: gestures.long_press(driver, (cx, cy), 800)),
+            ("swipe (1 finger)", lambda: gestures.swipe(driver, (cx, cy + 400), (cx, cy - 400))),
+            ("swipe (2 fingers)", lambda: gestures.swipe(driver, (cx, cy + 400), (cx, cy - 400), fingers=2)),
+        ]
+        print(f"{'gesture':<38} {'commands':>8} {'ms':>10}")
+        print("-" * 60)
+        for name, scenario in live:
+            commands.clear()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                scenario()
+            elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+            print(f"{name:<38} {len(commands) // repeat:>8} {elapsed_ms:>10.1f}")
+    finally:
+        driver.quit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", help="Appium server URL for a live run")
+    parser.add_argument("--rtt-ms", type=float, default=30.0, help="Simulated round-trip time per command (offline)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.server:
+        run_live(args.server, args.repeat)
+    else:
+        run_offline(args.rtt_ms, args.repeat)
@@ -0,0 +1,72 @@
+"""
+Benchmark: per-character cost of each send_keys input mode
+send_keys の入力モードごとの1文字あたりのコストを実機で計測するベンチマーク
+
+Requires a running Appium server and a device with the Settings app (search field).
+
+    uv run python bench_send_keys.py
+    uv run python bench_send_keys.py --lengths 10 100 400 --modes type paste
+"""
+
+import argparse
+import asyncio
+import time
+
+from appium.options.android import UiAutomator2Options
+from appium_tools import appium_driver, click_element, press_keycode
+from appium_tools.interaction import SEND_KEYS_MODES, send_keys
+
+SEARCH_TITLE = "com.android.settings:id/search_bar_title"
+SEARCH_FIELD = "com.google.android.settings.intelligence:id/open_search_view_edit_text"
+
+
+def open_search() -> bool:
+    result = click_element.invoke({"by": "id", "value": SEARCH_TITLE})
+    time.sleep(1)
+    return "successfully clicked" in result.lower()
+
+
+def close_search() -> None:
+    press_keycode.invoke({"keycode": 4})
+    press_keycode.invoke({"keycode": 4})
+    time.sleep(0.5)
+
+
+async def main(server: str, lengths, modes, repeat: int) -> None:
+    options = UiAutomator2Options()
+    options.set_capability("platformName", "Android")
+    options.set_capability("appium:automationName", "uiautomator2")
+    options.set_capability("appium:appPackage", "com.android.settings")
+    options.set_capability("appium:appActivity", ".Settings")
+    options.set_capability("appium:language", "en")
+    options.set_capability("appium:locale", "US")
+
+    async with appium_driver(options, server):
+        print(f"{'mode':<14} {'chars':>6} {'total ms':>10} {'ms/char':>9}  result")
+        print("-" * 70)
+        for mode in modes:
+            for length in lengths:
+                text = ("abcdefghij" * (length // 10 + 1))[:length]
+                timings = []
+                result = ""
+                for _ in range(repeat):
+                    if not open_search():
+                        print("Search bar not found; is the Settings app in the foreground?")
+                        return
+                    start = time.perf_counter()
+                    result = send_keys.invoke({"by": "id", "value": SEARCH_FIELD, "text": text, "mode": mode})
+                    timings.append((time.perf_counter() - start) * 1000)
+                    close_search()
+                avg = sum(timings) / len(timings)
+                note = "fallback" if "fallback" in result else ("ok" if "successfully" in result.lower() else result[:30])
+                print(f"{mode:<14} {length:>6} {avg:>10.1f} {avg / length:>9.2f}  {note}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default="http://localhost:4723")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 400])
+    parser.add_argument("--modes", nargs="+", default=list(SEND_KEYS_MODES), choices=SEND_KEYS_MODES)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.server, args.lengths, args.modes, args.repeat))
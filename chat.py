@@ -1,40 +1,29 @@
+import argparse
 import asyncio
+import json
 import os
+import sys
+from contextlib import nullcontext
 from appium.options.android import UiAutomator2Options
 from langchain.agents import create_agent
+from langchain_core.messages import AIMessageChunk, ToolMessage
 from langgraph.checkpoint.memory import InMemorySaver 
-from appium_tools import appium_driver, appium_tools
+from appium_tools import appium_driver, appium_tools, AgentTask, Device, DeviceScheduler, OutputGovernor, ToolRouter, ModelRouter, LoopGuard
+from appium_tools.budget import Budget, BudgetExceededError, BudgetGuard
+from appium_tools.replay import CachedChatModel, ReplayCache, ToolReplayMiddleware
+from appium_tools.locators import get_locator_stats
+from appium_tools.session import get_recovery_stats
 from appium_tools.token_counter import TiktokenCountCallback
 
 LLM_MODEL="gpt-4.1"
+# 定型的なステップ（ツール実行後の次の一手）に使う安価なモデル
+LLM_CHEAP_MODEL="gpt-4.1-nano"
 
-async def main():
-    # OpenAI API キーの確認
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        print("Error: OPENAI_API_KEY environment variable is not set")
-        return
-    
-    # Set up Appium options
-    options = UiAutomator2Options()
-    options.set_capability("platformName", "Android")
-    options.set_capability("appium:automationName", "uiautomator2")
-    options.set_capability("appium:deviceName", "Android")
-    options.set_capability("appium:appPackage", "com.android.settings")
-    options.set_capability("appium:appWaitActivity", "*")
-    options.set_capability("appium:language", "en")
-    options.set_capability("appium:locale", "US")
-    options.set_capability("appium:newCommandTimeout", 300)  # 5分（300秒）に設定
-    
-    # トークンカウンターコールバックを作成
-    token_counter = TiktokenCountCallback(model=LLM_MODEL)
-    
-    # エージェントの作成（LangChain v1 API）
-    agent = create_agent(
-        model=LLM_MODEL,
-        tools=appium_tools(),
-        checkpointer=InMemorySaver(),
-        system_prompt="""You are a helpful assistant that controls an Android device using Appium.
+# ループするエージェントが費用と時間を使い続けないように、1クエリごと・セッション全体の上限を設ける
+QUERY_BUDGET = Budget(max_cost_usd=0.20, max_seconds=300, max_tool_calls=40)
+SESSION_BUDGET = Budget(max_cost_usd=2.00)
+
+SYSTEM_PROMPT = """You are a helpful assistant that controls an Android device using Appium.
 You can help users interact with the Android Settings app.
 
 Available actions:
@@ -49,19 +38,109 @@ Available actions:
 When the user asks you to interact with the device, use the appropriate tools.
 For finding elements, use XPath like '//*[@text="Battery"]' or '//*[@resource-id="com.android.settings:id/search"]'.
 Always check the driver status first before attempting operations."""
+
+
+def build_options(udid: str = None) -> UiAutomator2Options:
+    """Appium options for the Settings app (optionally pinned to one device)."""
+    options = UiAutomator2Options()
+    options.set_capability("platformName", "Android")
+    options.set_capability("appium:automationName", "uiautomator2")
+    options.set_capability("appium:deviceName", "Android")
+    options.set_capability("appium:appPackage", "com.android.settings")
+    options.set_capability("appium:appWaitActivity", "*")
+    options.set_capability("appium:language", "en")
+    options.set_capability("appium:locale", "US")
+    options.set_capability("appium:newCommandTimeout", 300)  # 5分（300秒）に設定
+    if udid:
+        options.set_capability("appium:udid", udid)
+    return options
+
+
+def build_model(name: str, cache: ReplayCache = None):
+    """モデル名、または記録・再生時はキャッシュ付きのモデル（再生時はAPIを呼ばない）"""
+    if cache is None:
+        return name
+    from langchain.chat_models import init_chat_model
+    inner = None if cache.mode == "replay" else init_chat_model(name, model_provider="openai")
+    return CachedChatModel(model_name=name, inner=inner, replay_cache=cache)
+
+
+def build_agent(cache: ReplayCache = None, loop_guard: LoopGuard = None):
+    """エージェントの作成（LangChain v1 API）"""
+    # 毎回すべてのツール定義を送らず、コアのツールと必要なグループだけを公開する
+    # 計画・失敗時は LLM_MODEL、定型的なステップは LLM_CHEAP_MODEL で処理する
+    middleware = [ToolRouter(model=LLM_MODEL), ModelRouter(cheap_model=build_model(LLM_CHEAP_MODEL, cache))]
+    if cache is not None:
+        # ツールの出力も記録・再生する（再生時はデバイスに触れない）
+        middleware.append(ToolReplayMiddleware(cache))
+    # 変化していない画面での同じ呼び出しを省略し、同じ操作の繰り返し（ループ）を警告する
+    middleware.append(loop_guard or LoopGuard(model=LLM_MODEL))
+    return create_agent(
+        model=build_model(LLM_MODEL, cache),
+        # 大きなツール出力（ページソース等）はトークン予算内に縮約してからLLMに渡す
+        tools=appium_tools(output_governor=OutputGovernor(model=LLM_MODEL)),
+        middleware=middleware,
+        checkpointer=InMemorySaver(),
+        system_prompt=SYSTEM_PROMPT,
     )
+
+
+async def stream_agent_reply(agent, user_input: str, config) -> None:
+    """エージェントの応答をトークン単位で表示し、ツールの進捗も逐次表示する"""
+    print("\nAssistant: ", end="", flush=True)
+    async for chunk, metadata in agent.astream(
+        {"messages": [{"role": "user", "content": user_input}]},
+        config=config,
+        stream_mode="messages",
+    ):
+        if isinstance(chunk, AIMessageChunk):
+            if chunk.text:
+                print(chunk.text, end="", flush=True)
+            for tool_call in chunk.tool_call_chunks:
+                if tool_call.get("name"):
+                    print(f"\n   🔧 {tool_call['name']} ...", flush=True)
+        elif isinstance(chunk, ToolMessage):
+            status = "❌" if chunk.status == "error" or str(chunk.content).startswith("❌") else "✅"
+            print(f"   {status} {chunk.name}", flush=True)
+    print("\n")
+
+
+async def main(stream: bool = False, cache: ReplayCache = None):
+    # 再生モードでは記録済みの応答とツール出力を使うため、APIキーもデバイスも不要
+    replaying = cache is not None and cache.mode == "replay"
+    
+    # OpenAI API キーの確認
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key and not replaying:
+        print("Error: OPENAI_API_KEY environment variable is not set")
+        return
+    
+    # Set up Appium options
+    options = build_options()
+    
+    # トークンカウンターコールバックを作成
+    token_counter = TiktokenCountCallback(model=LLM_MODEL)
+    budget_guard = BudgetGuard(query=QUERY_BUDGET, session=SESSION_BUDGET, model=LLM_MODEL)
+    
+    # エージェントの作成（LangChain v1 API）
+    loop_guard = LoopGuard(model=LLM_MODEL)
+    agent = build_agent(cache, loop_guard)
     
     print("=== Appium Chat Assistant ===")
     print("チャットを開始します。'quit' または 'exit' で終了します。\n")
     
-    # Appium driver を起動
-    async with appium_driver(options) as driver:
-        print("Appium driver が起動しました。Android Settings アプリに接続しています...\n")
+    # Appium driver を起動（セッション切れは自動で再接続してツールを再実行）
+    async with (nullcontext() if replaying else appium_driver(options, auto_recover=True)) as driver:
+        if replaying:
+            print(f"記録を再生します: {cache.path}\n")
+        else:
+            print("Appium driver が起動しました。Android Settings アプリに接続しています...\n")
         
         while True:
-            # セッションが有効かチェック
+            # セッションが有効かチェック（再生時はドライバーなし）
             try:
-                _ = driver.session_id
+                if driver is not None:
+                    _ = driver.session_id
             except Exception as session_error:
                 print(f"\n⚠️  セッションが切れています: {session_error}")
                 print("プログラムを再起動してください。\n")
@@ -78,26 +157,42 @@ Always check the driver status first before attempting operations."""
                     continue
                 
                 # クエリを追跡（自動的にこの処理の開始地点を記録）
-                with token_counter.track_query() as query:
+                budget_exceeded = None
+                with token_counter.track_query() as query, budget_guard.track_query():
                     # エージェントを実行(LangChain v1 API)
                     from langchain_core.runnables import RunnableConfig
                     
-                    response = await agent.ainvoke(
-                        {"messages": [{"role": "user", "content": user_input}]},
-                        config=RunnableConfig(
-                            configurable={"thread_id": "1"},
-                            callbacks=[token_counter]
-                        )
+                    config = RunnableConfig(
+                        configurable={"thread_id": "1"},
+                        callbacks=[token_counter, budget_guard]
                     )
+                    try:
+                        if stream:
+                            # 応答とツールの進捗を届いた順に表示
+                            await stream_agent_reply(agent, user_input, config)
+                        else:
+                            response = await agent.ainvoke(
+                                {"messages": [{"role": "user", "content": user_input}]},
+                                config=config
+                            )
+                            
+                            print(f"\nAssistant: {response['messages'][-1].content}\n")
+                    except BudgetExceededError as e:
+                        # 予算超過: エージェントを中断し、ここまでの使用量を表示
+                        budget_exceeded = e
+                        print(f"\n⛔ {e}\n")
+                        print(budget_guard.format_usage())
                     
-                    print(f"\nAssistant: {response['messages'][-1].content}\n")
-                    
-                    # このクエリのレポートを表示
+                    # このクエリのレポートを表示（中断時はそこまでの部分レポート）
                     report = query.report()
                     if report:
                         print(report)
                         print()  # 空行
                 
+                if budget_exceeded is not None and budget_exceeded.scope == "session":
+                    print("セッションの予算を超えたため、チャットを終了します。")
+                    break
+                
                 
             except KeyboardInterrupt:
                 print("\n\nチャットを終了します。")
@@ -109,7 +204,148 @@ Always check the driver status first before attempting operations."""
         session_summary = token_counter.format_session_summary()
         if session_summary:
             print("\n" + session_summary + "\n")
+        
+        loop_stats = loop_guard.get_stats()
+        if loop_stats["short_circuited"] or loop_stats["loops_flagged"]:
+            print(f"🔂 Redundant calls skipped: {loop_stats['short_circuited']} "
+                  f"({loop_stats['tokens_saved']} tokens saved), loops flagged: {loop_stats['loops_flagged']}\n")
+        
+        recovery_stats = get_recovery_stats()
+        if recovery_stats.get("recoveries") or recovery_stats.get("failed_recoveries"):
+            print(f"🔁 Session recoveries: {recovery_stats['recoveries']} "
+                  f"(failed: {recovery_stats['failed_recoveries']}, "
+                  f"time lost: {recovery_stats['time_lost_seconds']}s)\n")
+        
+        locator_stats = get_locator_stats()
+        if locator_stats:
+            print("🔎 Element lookups: " + ", ".join(
+                f"{strategy} {stats['calls']}x (avg {stats['avg_seconds']}s)" for strategy, stats in locator_stats.items()
+            ) + "\n")
+
+
+def _batch_task(entry, line_number: int) -> AgentTask:
+    """Build an AgentTask from one parsed JSONL entry, or raise ValueError describing the problem."""
+    if isinstance(entry, str):
+        entry = {"prompt": entry}
+    if not isinstance(entry, dict):
+        raise ValueError("expected a JSON object or string")
+    prompt = entry.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise ValueError('"prompt" must be a non-empty string')
+    for key, kind in (("priority", int), ("max_retries", int), ("capabilities", dict), ("app_package", str)):
+        if entry.get(key) is not None and not isinstance(entry[key], kind):
+            raise ValueError(f'"{key}" must be of type {kind.__name__}')
+    return AgentTask(
+        prompt,
+        app_package=entry.get("app_package"),
+        capabilities=entry.get("capabilities"),
+        priority=entry.get("priority") or 0,
+        max_retries=entry["max_retries"] if entry.get("max_retries") is not None else 1,
+        task_id=str(entry.get("id", f"line-{line_number}")),
+    )
+
+
+def read_batch_tasks(path: str) -> tuple:
+    """Read prompts from a JSONL file ("-" for stdin).
+
+    Each line is either a JSON object {"prompt", "id"?, "priority"?, "app_package"?,
+    "capabilities"?, "max_retries"?} or a JSON string; blank lines are skipped.
+    Invalid lines do not stop the batch: they are returned with their line number.
+
+    Returns:
+        (tasks, [(line_number, error message), ...])
+    """
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    tasks, errors = [], []
+    try:
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                tasks.append(_batch_task(json.loads(line), line_number))
+            except json.JSONDecodeError as e:
+                errors.append((line_number, f"invalid JSON: {e.msg}"))
+            except ValueError as e:
+                errors.append((line_number, str(e)))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return tasks, errors
+
+
+async def run_batch(input_path: str, output_path: str, udids: list) -> None:
+    """Non-interactive mode: run every prompt and stream one JSON record per prompt."""
+    if not os.getenv("OPENAI_API_KEY"):
+        print("Error: OPENAI_API_KEY environment variable is not set", file=sys.stderr)
+        return
+    
+    tasks, errors = read_batch_tasks(input_path)
+    # 1台につき同時に1プロンプト。--udid を複数指定するとデバイス数だけ並列に実行
+    devices = [Device(udid or "default", build_options(udid)) for udid in (udids or [None])]
+    out = sys.stdout if output_path == "-" else open(output_path, "a", encoding="utf-8")
+    
+    # 対話モードと同じ上限: クエリの予算はプロンプトごと、セッションの予算はバッチ全体で共有
+    session_guard = BudgetGuard(session=SESSION_BUDGET, model=LLM_MODEL)
+    
+    def budget_guards(task: AgentTask) -> list:
+        return [BudgetGuard(query=QUERY_BUDGET, model=LLM_MODEL), session_guard]
+    
+    def write_result(result: dict) -> None:
+        metrics = result["metrics"] or {}
+        record = {
+            "id": result["task_id"],
+            "prompt": result["prompt"],
+            "status": result["status"],
+            "output": result["output"],
+            "error": result["error"],
+            "device": result["device"],
+            "attempts": result["attempt"],
+            "latency_seconds": result["elapsed_seconds"],
+            "input_tokens": metrics.get("input_tokens", 0),
+            "cached_tokens": metrics.get("cached_tokens", 0),
+            "output_tokens": metrics.get("output_tokens", 0),
+            "total_cost_usd": metrics.get("total_cost_usd", 0.0),
+        }
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+    
+    # 不正な行は実行せず、行番号付きで結果に記録する
+    for line_number, error in errors:
+        print(f"⚠️  {input_path}:{line_number}: {error}", file=sys.stderr)
+        record = {"id": f"line-{line_number}", "prompt": None, "status": "invalid", "output": None, "error": error}
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    out.flush()
+    
+    scheduler = DeviceScheduler(devices, agent_factory=build_agent, model=LLM_MODEL, on_result=write_result,
+                                callbacks_factory=budget_guards)
+    try:
+        await scheduler.run(tasks)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(scheduler.format_report(), file=sys.stderr)
+    if session_guard.breaches:
+        print(session_guard.format_usage(), file=sys.stderr)
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Appium Chat Assistant")
+    parser.add_argument("--batch", metavar="PROMPTS_JSONL", help='Run prompts from a JSONL file ("-" for stdin) without interaction')
+    parser.add_argument("--output", default="-", metavar="RESULTS_JSONL", help='Where to append result records (default: stdout)')
+    parser.add_argument("--stream", action="store_true", help="Print the assistant reply token by token with tool progress (interactive mode)")
+    parser.add_argument("--udid", action="append", default=[], help="Device to use in batch mode; repeat to run prompts on several devices in parallel")
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument("--record", metavar="DIR", help="Record LLM responses and tool outputs to DIR (interactive mode)")
+    recording.add_argument("--replay", metavar="DIR", help="Replay a recording from DIR without the API or a device (interactive mode)")
+    args = parser.parse_args()
+    
+    if args.batch:
+        asyncio.run(run_batch(args.batch, args.output, args.udid))
+    else:
+        cache = None
+        if args.record:
+            cache = ReplayCache(args.record, mode="record")
+        elif args.replay:
+            cache = ReplayCache(args.replay, mode="replay")
+        asyncio.run(main(stream=args.stream, cache=cache))
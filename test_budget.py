@@ -0,0 +1,105 @@
+"""
+Test program for query/session budgets
+Appiumサーバー・LLMなしで、フェイクのチャットモデルとツールを使って予算超過時の中断と部分レポートをテスト
+"""
+
+import time
+import pytest
+from langchain.agents import create_agent
+from langchain.tools import tool
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from appium_tools.budget import Budget, BudgetExceededError, BudgetGuard
+from appium_tools.token_counter import TiktokenCountCallback
+
+
+class LoopingFakeChatModel(GenericFakeChatModel):
+    """ツールを呼び続ける（ループする）エージェントを再現するフェイク"""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def looping_model(calls=50, input_tokens=1000):
+    return LoopingFakeChatModel(messages=iter([
+        AIMessage(
+            content="",
+            tool_calls=[{"name": "click_element", "args": {}, "id": str(i)}],
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": 10, "total_tokens": input_tokens + 10},
+            response_metadata={"model_name": "gpt-4.1"},
+        )
+        for i in range(calls)
+    ]))
+
+
+executed = []
+
+
+@tool
+def click_element() -> str:
+    """Click the element."""
+    executed.append(1)
+    return "Element clicked"
+
+
+def run(guard, model, counter=None):
+    agent = create_agent(model=model, tools=[click_element])
+    callbacks = [counter, guard] if counter else [guard]
+    return agent.invoke({"messages": [{"role": "user", "content": "Tap OK"}]}, config={"callbacks": callbacks})
+
+
+def test_tool_call_budget_aborts_before_the_tool_runs():
+    executed.clear()
+    guard = BudgetGuard(query=Budget(max_tool_calls=3))
+    with guard.track_query():
+        with pytest.raises(BudgetExceededError) as error:
+            run(guard, looping_model())
+
+    assert error.value.scope == "query" and error.value.limit == "max_tool_calls"
+    assert len(executed) == 3
+    # 部分レポート: 中断時点までの使用量
+    assert error.value.usage["query"]["llm_calls"] == 4
+    assert "⛔ query max_tool_calls" in guard.format_usage()
+
+
+def test_cost_budget_counts_actual_usage():
+    counter = TiktokenCountCallback(model="gpt-4.1")
+    guard = BudgetGuard(session=Budget(max_cost_usd=0.01))
+    with pytest.raises(BudgetExceededError) as error:
+        run(guard, looping_model(input_tokens=2000), counter)
+
+    # gpt-4.1: 2000入力トークン = $0.004 + 出力 → 3回目で超過
+    assert error.value.limit == "max_cost_usd"
+    assert error.value.usage["session"]["llm_calls"] == 3
+    assert len(counter.invocation_history) == 3
+
+
+def test_pre_call_estimate_refuses_oversized_prompt():
+    guard = BudgetGuard(query=Budget(max_tokens=100))
+    model = looping_model()
+    with guard.track_query(), pytest.raises(BudgetExceededError):
+        model.invoke("x" * 4000, config={"callbacks": [guard]})
+    assert guard.get_usage()["query"]["llm_calls"] == 0
+
+
+def test_query_scope_resets_but_session_accumulates():
+    guard = BudgetGuard(query=Budget(max_tool_calls=2), session=Budget(max_tool_calls=3))
+    for _ in range(2):
+        with guard.track_query():
+            guard.on_tool_start({"name": "click_element"}, "{}")
+    with guard.track_query(), pytest.raises(BudgetExceededError) as error:
+        guard.on_tool_start({"name": "click_element"}, "{}")
+        guard.on_tool_start({"name": "click_element"}, "{}")
+    assert error.value.scope == "session"
+
+
+def test_wall_time_budget():
+    guard = BudgetGuard(query=Budget(max_seconds=0.01))
+    with guard.track_query(), pytest.raises(BudgetExceededError) as error:
+        time.sleep(0.05)
+        guard.on_tool_start({"name": "click_element"}, "{}")
+    assert error.value.limit == "max_seconds"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,99 @@
+"""
+Test program for the fleet fan-out API
+Appiumサーバーなしで、フェイクドライバーを使って並列実行・タイムアウト・ドライバーの分離をテスト
+"""
+
+import time
+import pytest
+from selenium.common.exceptions import InvalidSessionIdException
+from appium_tools import session as session_module
+from appium_tools.device_info import is_locked, get_orientation
+from appium_tools.fleet import fleet_sweep, format_fleet_table
+
+
+class FakeDriver:
+    """is_locked/orientation だけを持つフェイク（呼び出しごとに delay 秒かかる）"""
+
+    def __init__(self, session_id, delay=0.0, locked=False, alive=True):
+        self.session_id = session_id
+        self.delay = delay
+        self.locked = locked
+        self.alive = alive
+
+    def is_locked(self):
+        time.sleep(self.delay)
+        if not self.alive:
+            raise InvalidSessionIdException("expired")
+        return self.locked
+
+    @property
+    def orientation(self):
+        time.sleep(self.delay)
+        return "PORTRAIT"
+
+
+TOOLS = [is_locked, get_orientation]
+
+
+@pytest.mark.asyncio
+async def test_each_device_uses_its_own_driver():
+    drivers = {"a": FakeDriver("s-a", locked=True), "b": FakeDriver("s-b", locked=False)}
+    rows = await fleet_sweep(drivers, tools=TOOLS)
+
+    assert [r["device"] for r in rows] == ["a", "b"]
+    assert rows[0]["results"]["is_locked"] == "Device is locked"
+    assert rows[1]["results"]["is_locked"] == "Device is unlocked"
+    assert all(r["ok"] for r in rows)
+    assert set(rows[0]["tool_latency_ms"]) == {"is_locked", "get_orientation"}
+    # 呼び出し元のコンテキストにはドライバーが残らない
+    assert session_module.driver is None
+
+
+@pytest.mark.asyncio
+async def test_devices_run_concurrently():
+    drivers = [FakeDriver(f"s-{i}", delay=0.1) for i in range(10)]
+    start = time.perf_counter()
+    rows = await fleet_sweep(drivers, tools=TOOLS, max_concurrency=10)
+    elapsed = time.perf_counter() - start
+
+    assert len(rows) == 10
+    # 直列なら 10台 × 2ツール × 0.1秒 = 2秒
+    assert elapsed < 1.0
+
+
+@pytest.mark.asyncio
+async def test_timeout_and_errors_are_reported_per_device():
+    drivers = {
+        "slow": FakeDriver("s-slow", delay=1.0),
+        "expired": FakeDriver("s-expired", alive=False),
+        "fine": FakeDriver("s-fine"),
+    }
+    rows = {r["device"]: r for r in await fleet_sweep(drivers, tools=[is_locked], timeout=0.2)}
+
+    assert rows["slow"]["error"].startswith("Timed out")
+    assert not rows["expired"]["ok"]
+    assert rows["expired"]["results"]["is_locked"].startswith("❌")
+    assert rows["fine"]["ok"]
+
+    table = format_fleet_table(list(rows.values()))
+    assert table.splitlines()[0] == "device | ok | latency_ms | is_locked"
+    assert len(table.splitlines()) == 4
+
+
+@pytest.mark.asyncio
+async def test_hung_device_does_not_starve_the_others():
+    """max_concurrency=1 でも、タイムアウトした端末のスレッドが後続の端末を塞がない"""
+    drivers = {
+        "hung": FakeDriver("s-hung", delay=1.0),
+        "a": FakeDriver("s-a", delay=0.05),
+        "b": FakeDriver("s-b", delay=0.05),
+    }
+    rows = {r["device"]: r for r in await fleet_sweep(drivers, tools=[is_locked], max_concurrency=1, timeout=0.3)}
+
+    assert rows["hung"]["error"].startswith("Timed out")
+    assert rows["a"]["ok"] and rows["b"]["ok"]
+    assert rows["a"]["results"]["is_locked"] == "Device is unlocked"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,73 @@
+"""
+Test program for the W3C Actions gesture engine
+各ジェスチャーが1コマンドで送信され、正しいポインタ列になることをテスト
+"""
+
+import pytest
+from selenium.common.exceptions import UnknownMethodException
+from appium_tools import gestures
+
+
+class RecordingDriver:
+    """送信されたコマンドを記録するフェイク"""
+    
+    def __init__(self, support_mobile_gestures: bool = True):
+        self.commands = []
+        self.support_mobile_gestures = support_mobile_gestures
+    
+    def execute(self, command, params=None):
+        self.commands.append((command, params))
+        return {"value": None}
+    
+    def execute_script(self, script, args):
+        if not self.support_mobile_gestures:
+            raise UnknownMethodException(f"{script} is not supported")
+        return self.execute(script, args)
+
+
+def test_double_tap_uses_mobile_gesture():
+    driver = RecordingDriver()
+    gestures.double_tap(driver, point=(10, 20))
+    assert driver.commands == [("mobile: doubleClickGesture", {"x": 10, "y": 20})]
+
+
+def test_double_tap_falls_back_to_single_w3c_sequence():
+    driver = RecordingDriver(support_mobile_gestures=False)
+    gestures.double_tap(driver, point=(10, 20), interval_ms=80)
+    
+    assert len(driver.commands) == 1
+    command, payload = driver.commands[0]
+    assert command == "actions"
+    (finger,) = payload["actions"]
+    types = [a["type"] for a in finger["actions"]]
+    assert types.count("pointerDown") == 2
+    assert types.count("pointerUp") == 2
+    assert {"type": "pause", "duration": 80} in finger["actions"]
+
+
+@pytest.mark.parametrize("gesture, fingers", [
+    (lambda d: gestures.long_press(d, (1, 2), 500), 1),
+    (lambda d: gestures.pinch(d, (500, 500), 100, 400), 2),
+    (lambda d: gestures.swipe(d, (500, 1500), (500, 500), fingers=3), 3),
+    (lambda d: gestures.drag(d, (1, 2), (3, 4)), 1),
+])
+def test_gesture_is_one_command(gesture, fingers):
+    driver = RecordingDriver()
+    gesture(driver)
+    assert len(driver.commands) == 1
+    _, payload = driver.commands[0]
+    assert len(payload["actions"]) == fingers
+    assert all(seq["parameters"]["pointerType"] == "touch" for seq in payload["actions"])
+
+
+def test_pinch_moves_fingers_apart():
+    driver = RecordingDriver()
+    gestures.pinch(driver, (500, 500), 100, 400)
+    _, payload = driver.commands[0]
+    left, right = payload["actions"]
+    assert left["actions"][0]["x"] == 450 and left["actions"][2]["x"] == 300
+    assert right["actions"][0]["x"] == 550 and right["actions"][2]["x"] == 700
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
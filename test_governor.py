@@ -0,0 +1,88 @@
+"""
+Test program for the tool-output token governor
+Appiumサーバーなしで、ツール出力のトークン予算・縮約戦略・トークン集計をテスト
+"""
+
+import pytest
+from langchain.tools import tool
+from appium_tools import appium_tools
+from appium_tools.governor import OutputGovernor, STRATEGIES
+
+
+def count(text):
+    """テスト用のトークン数（4文字=1トークン）"""
+    return -(-len(text) // 4)
+
+
+BIG_SOURCE = "Page source retrieved successfully:\n<hierarchy>" + "".join(
+    f'<android.widget.TextView class="android.widget.TextView" text="Item {i}" '
+    f'resource-id="p:id/title" bounds="[0,{i}][1080,{i + 1}]"><android.view.View class="android.view.View" bounds="[0,0][1,1]"/></android.widget.TextView>'
+    for i in range(500)
+) + "</hierarchy>"
+
+
+@tool
+def echo(text: str) -> str:
+    """Return the text unchanged."""
+    return text
+
+
+class TestStrategies:
+
+    @pytest.mark.parametrize("name", ["head", "head_tail", "lines"])
+    def test_text_strategies_fit_budget(self, name):
+        text = "\n".join(f"line {i} " + "x" * 40 for i in range(200))
+        result = STRATEGIES[name](text, 300, count)
+        assert count(result) <= 300
+        assert result.startswith("line 0 ")
+
+    def test_head_tail_keeps_end(self):
+        text = "start " + "x" * 5000 + " ERROR at the end"
+        result = STRATEGIES["head_tail"](text, 100, count)
+        assert result.startswith("start") and result.endswith("ERROR at the end")
+
+    def test_xml_strategy_reduces_to_labelled_elements(self):
+        result = STRATEGIES["xml"](BIG_SOURCE, 2000, count)
+        assert count(result) <= 2000
+        assert 'text="Item 0"' in result
+        assert "android.view.View" not in result
+        assert "more elements omitted" in result
+
+
+class TestOutputGovernor:
+
+    def test_small_output_passes_through_and_is_counted(self):
+        governor = OutputGovernor()
+        governed = governor.wrap(echo)
+        assert governed.invoke({"text": "hello"}) == "hello"
+        assert governor.history[0]["strategy"] is None
+        assert governor.history[0]["raw_tokens"] == governor.history[0]["returned_tokens"] > 0
+
+    def test_budget_enforced_per_tool(self):
+        governor = OutputGovernor(default_budget=50, budgets={"echo": (20, "head")})
+        governed = governor.wrap(echo)
+        result = governed.invoke({"text": "word " * 500})
+        assert governor.count(result) <= 20
+        stats = governor.get_stats()
+        assert stats["tools"]["echo"]["reduced"] == 1
+        assert stats["saved_tokens"] > 0
+
+    def test_wrapped_tool_keeps_schema(self):
+        governed = OutputGovernor().wrap(echo)
+        assert governed.name == "echo"
+        assert governed.description == echo.description
+        assert governed.args == echo.args
+
+    def test_unknown_strategy_rejected(self):
+        with pytest.raises(ValueError):
+            OutputGovernor(budgets={"echo": (10, "magic")})
+
+    def test_appium_tools_with_governor(self):
+        governor = OutputGovernor()
+        tools = appium_tools(output_governor=governor)
+        assert [t.name for t in tools] == [t.name for t in appium_tools()]
+        assert all(t is not original for t, original in zip(tools, appium_tools()))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
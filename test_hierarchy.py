@@ -0,0 +1,172 @@
+"""
+Test program for the parsed page-source hierarchy and geometry cache
+Appiumサーバーなしで、ページソースの解析・ロケータ評価・矩形キャッシュをテスト
+"""
+
+import pytest
+from appium_tools import hierarchy
+from appium_tools.hierarchy import (
+    HierarchySnapshot,
+    parse_bounds,
+    store_snapshot,
+    get_element_rect,
+    invalidate_screen,
+    diff_snapshots,
+    format_diff,
+    get_last_seen,
+    iter_nodes,
+    compact_hierarchy,
+    compact_source,
+)
+
+
+SAMPLE_SOURCE = """<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>
+<hierarchy index="0" rotation="0">
+  <android.widget.FrameLayout index="0" package="com.android.settings" class="android.widget.FrameLayout" text="" resource-id="" content-desc="" bounds="[0,0][1080,2400]">
+    <androidx.recyclerview.widget.RecyclerView index="0" package="com.android.settings" class="androidx.recyclerview.widget.RecyclerView" text="" resource-id="com.android.settings:id/recycler_view" content-desc="" scrollable="true" bounds="[0,200][1080,2400]">
+      <android.widget.TextView index="0" package="com.android.settings" class="android.widget.TextView" text="Network &amp; internet" resource-id="android:id/title" content-desc="" bounds="[100,300][900,360]" />
+      <android.widget.TextView index="1" package="com.android.settings" class="android.widget.TextView" text="Battery" resource-id="android:id/title" content-desc="Battery settings" bounds="[100,500][900,560]" />
+    </androidx.recyclerview.widget.RecyclerView>
+  </android.widget.FrameLayout>
+</hierarchy>
+"""
+
+
+class FakeElement:
+    rect = {"x": 1, "y": 2, "width": 3, "height": 4}
+
+
+class FakeDriver:
+    """find_element の呼び出し回数を数えるフェイク"""
+    
+    def __init__(self):
+        self.session_id = "fake-session"
+        self.find_calls = 0
+    
+    def find_element(self, by, value):
+        self.find_calls += 1
+        return FakeElement()
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    hierarchy.clear_screen_cache()
+    yield
+    hierarchy.clear_screen_cache()
+
+
+def test_parse_bounds():
+    assert parse_bounds("[0,200][1080,2400]") == {"x": 0, "y": 200, "width": 1080, "height": 2200}
+    assert parse_bounds("") is None
+
+
+class TestHierarchySnapshot:
+    
+    def test_nodes_parsed(self):
+        snapshot = HierarchySnapshot(SAMPLE_SOURCE)
+        assert len(snapshot.nodes) == 4
+    
+    def test_find_by_supported_locators(self):
+        snapshot = HierarchySnapshot(SAMPLE_SOURCE)
+        assert snapshot.find_unique("xpath", "//*[@text='Battery']")["rect"]["y"] == 500
+        assert snapshot.find_unique("xpath", '//*[@scrollable="true"]')["attrs"]["resource-id"] == "com.android.settings:id/recycler_view"
+        assert snapshot.find_unique("accessibility_id", "Battery settings") is not None
+        assert snapshot.find_unique("id", "com.android.settings:id/recycler_view") is not None
+    
+    def test_ambiguous_and_unsupported_locators(self):
+        snapshot = HierarchySnapshot(SAMPLE_SOURCE)
+        assert len(snapshot.find_all("id", "android:id/title")) == 2
+        assert snapshot.find_unique("id", "android:id/title") is None
+        assert [n["attrs"]["text"] for n in snapshot.find_all("xpath", "//*[contains(@text, 'Bat')]")] == ["Battery"]
+        assert snapshot.find_all("xpath", "//*[@text='Battery']/..") is None
+
+    def test_streaming_parse_matches_in_small_chunks(self):
+        nodes = list(iter_nodes(SAMPLE_SOURCE, chunk_size=16))
+        assert [depth for depth, _, _ in nodes] == [0, 1, 2, 2]
+        assert nodes[3][2]["text"] == "Battery"
+    
+    def test_streaming_parse_rejects_malformed_xml(self):
+        with pytest.raises(Exception):
+            list(iter_nodes("<hierarchy><a></hierarchy>"))
+    
+    def test_compact_view_skips_layout_nodes_and_caps_size(self):
+        snapshot = HierarchySnapshot(SAMPLE_SOURCE)
+        compact, omitted = compact_hierarchy(snapshot, max_chars=10_000)
+        assert omitted == 0
+        assert "FrameLayout" not in compact
+        assert '    <TextView resource-id="android:id/title" text="Battery"' in compact
+        
+        compact, omitted = compact_hierarchy(snapshot, max_chars=150)
+        assert omitted == 2
+        
+        # Streaming compaction gives the same view without building a snapshot
+        assert compact_source(SAMPLE_SOURCE, max_chars=150) == (compact, omitted)
+
+
+class TestGeometryCache:
+    
+    def test_rect_from_snapshot_needs_no_round_trip(self):
+        driver = FakeDriver()
+        store_snapshot(driver, SAMPLE_SOURCE)
+        rect = get_element_rect(driver, "xpath", "//*[@scrollable='true']")
+        assert rect == {"x": 0, "y": 200, "width": 1080, "height": 2200}
+        assert driver.find_calls == 0
+    
+    def test_rect_cached_after_lookup(self):
+        driver = FakeDriver()
+        get_element_rect(driver, "id", "foo")
+        get_element_rect(driver, "id", "foo")
+        assert driver.find_calls == 1
+    
+    def test_scroll_keeps_only_the_container_rect(self):
+        driver = FakeDriver()
+        get_element_rect(driver, "id", "list")
+        get_element_rect(driver, "id", "item")
+        invalidate_screen(driver, keep_rect=("id", "list"))
+        get_element_rect(driver, "id", "list")
+        assert driver.find_calls == 2
+        # Elements inside the scrolled container may have moved
+        get_element_rect(driver, "id", "item")
+        assert driver.find_calls == 3
+    
+    def test_navigation_drops_all_rects(self):
+        driver = FakeDriver()
+        get_element_rect(driver, "id", "foo")
+        invalidate_screen(driver)
+        get_element_rect(driver, "id", "foo")
+        assert driver.find_calls == 2
+
+
+class TestHierarchyDiff:
+    
+    def test_identical_sources_have_no_changes(self):
+        diff = diff_snapshots(HierarchySnapshot(SAMPLE_SOURCE), HierarchySnapshot(SAMPLE_SOURCE))
+        assert diff == {"added": [], "removed": [], "changed": []}
+    
+    def test_text_change_is_reported_as_changed(self):
+        new_source = SAMPLE_SOURCE.replace('text="Battery"', 'text="Battery 80%"')
+        diff = diff_snapshots(HierarchySnapshot(SAMPLE_SOURCE), HierarchySnapshot(new_source))
+        assert diff["added"] == [] and diff["removed"] == []
+        assert len(diff["changed"]) == 1
+        assert diff["changed"][0][2] == {"text": ("Battery", "Battery 80%")}
+        assert format_diff(diff).startswith('~ <TextView resource-id="android:id/title" text="Battery 80%"')
+    
+    def test_added_and_removed_nodes(self):
+        new_source = SAMPLE_SOURCE.replace('bounds="[100,300][900,360]"', 'bounds="[100,300][900,400]"')
+        diff = diff_snapshots(HierarchySnapshot(SAMPLE_SOURCE), HierarchySnapshot(new_source))
+        assert [n["rect"]["height"] for n in diff["added"]] == [100]
+        assert [n["rect"]["height"] for n in diff["removed"]] == [60]
+        lines = format_diff(diff).splitlines()
+        assert lines[0].startswith("+ ") and lines[1].startswith("- ")
+    
+    def test_last_seen_survives_invalidation(self):
+        driver = FakeDriver()
+        snapshot = store_snapshot(driver, SAMPLE_SOURCE)
+        invalidate_screen(driver)
+        assert get_last_seen(driver) is snapshot
+        hierarchy.clear_screen_cache(driver.session_id)
+        assert get_last_seen(driver) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
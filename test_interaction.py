@@ -0,0 +1,210 @@
+"""
+Test program for the element interaction tools
+Appiumサーバーなしで、find_elements の表形式の結果と、send_keys の高速入力のフォールバックをテスト
+"""
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+from appium_tools import hierarchy
+from appium_tools.interaction import find_elements, send_keys
+from appium_tools.navigation import LARGE_PAGE_SOURCE_CHARS
+from appium_tools.session import use_driver
+
+
+SOURCE = """<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>
+<hierarchy index="0" rotation="0">
+  <android.widget.LinearLayout class="android.widget.LinearLayout" text="" resource-id="" bounds="[0,0][1080,2400]">
+    <android.widget.Switch class="android.widget.Switch" text="Wi-Fi" resource-id="com.example:id/toggle" checked="true" enabled="true" bounds="[0,100][1080,200]" />
+    <android.widget.Switch class="android.widget.Switch" text="Bluetooth" resource-id="com.example:id/toggle" checked="false" enabled="true" bounds="[0,200][1080,300]" />
+    <android.widget.Switch class="android.widget.Switch" text="Airplane | mode" resource-id="com.example:id/toggle" checked="false" enabled="false" bounds="[0,300][1080,400]" />
+  </android.widget.LinearLayout>
+</hierarchy>
+"""
+
+
+class FakeElement:
+    def __init__(self, attrs):
+        self.attrs = attrs
+        self.requests = 0
+
+    def get_attribute(self, name):
+        self.requests += 1
+        return self.attrs.get(name)
+
+
+class FakeDriver:
+    """page_source と find_elements の呼び出しを数えるフェイク"""
+
+    def __init__(self):
+        self.session_id = "bulk-session"
+        self.page_source_calls = 0
+        self.source = SOURCE
+        self.find_calls = []
+        self.elements = [FakeElement({"text": "Wi-Fi", "checked": "true"})]
+
+    @property
+    def page_source(self):
+        self.page_source_calls += 1
+        return self.source
+
+    def find_elements(self, by, value):
+        self.find_calls.append((by, value))
+        return self.elements
+
+
+class FakeInput:
+    """ヒント表示中は text にヒントを返す入力欄（入力するとヒントは消える）"""
+
+    id = "input-1"
+
+    def __init__(self, content="", hint=None):
+        self.content = content
+        self.hint = hint
+        self.typed = []
+
+    @property
+    def text(self):
+        return self.content or self.hint or ""
+
+    def get_attribute(self, name):
+        return self.hint if name == "hint" else None
+
+    def click(self):
+        pass
+
+    def clear(self):
+        self.content = ""
+
+    def send_keys(self, text):
+        self.typed.append(text)
+        self.content += text
+
+
+class FastInputDriver:
+    """高速入力で先頭 accepted 文字だけ反映し、fail なら途中で例外を出すフェイク"""
+
+    def __init__(self, field, accepted, fail=False):
+        self.session_id = "input-session"
+        self.field = field
+        self.accepted = accepted
+        self.fail = fail
+        self.clipboard = ""
+
+    def find_element(self, by, value):
+        return self.field
+
+    def _apply(self, text):
+        self.field.content += text[:self.accepted]
+        if self.fail:
+            raise WebDriverException("input interrupted")
+
+    def execute_script(self, script, args):
+        self._apply(args["text"])
+
+    def set_clipboard_text(self, text):
+        self.clipboard = text
+
+    def press_keycode(self, keycode):
+        self._apply(self.clipboard)
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    hierarchy.clear_screen_cache()
+    yield
+    hierarchy.clear_screen_cache()
+
+
+def test_all_matches_from_one_page_source():
+    driver = FakeDriver()
+    with use_driver(driver):
+        result = find_elements.invoke({"by": "id", "value": "com.example:id/toggle"})
+        second = find_elements.invoke({"by": "xpath", "value": "//*[@checked='false' and contains(@text, 'o')]",
+                                       "attributes": "text,enabled", "max_results": 1})
+
+    lines = result.splitlines()
+    assert lines[0] == "Found 3 element(s) by id with value com.example:id/toggle:"
+    assert lines[1] == "# | text | resource-id | bounds | checked | enabled"
+    assert lines[2] == "1 | Wi-Fi | com.example:id/toggle | [0,100][1080,200] | true | true"
+    assert lines[4].startswith("3 | Airplane \\| mode |")
+    assert second.splitlines()[2:] == ["1 | Bluetooth | true", "... 1 more (increase max_results or narrow the locator)"]
+    # One page source per call, no per-element requests
+    assert driver.page_source_calls == 2
+    assert driver.find_calls == []
+
+
+def test_state_change_without_a_tool_is_seen():
+    driver = FakeDriver()
+    with use_driver(driver):
+        before = find_elements.invoke({"by": "id", "value": "com.example:id/toggle", "attributes": "text,checked"})
+        # Bluetooth toggled by the app itself (no screen-changing tool in between)
+        driver.source = SOURCE.replace('text="Bluetooth" resource-id="com.example:id/toggle" checked="false"',
+                                       'text="Bluetooth" resource-id="com.example:id/toggle" checked="true"')
+        after = find_elements.invoke({"by": "id", "value": "com.example:id/toggle", "attributes": "text,checked"})
+
+    assert before.splitlines()[3] == "2 | Bluetooth | false"
+    assert after.splitlines()[3] == "2 | Bluetooth | true"
+    # Fetched for matching only, never shown to the agent as a page source
+    assert hierarchy.get_last_seen(driver) is None
+
+
+def test_complex_locator_falls_back_to_driver():
+    driver = FakeDriver()
+    with use_driver(driver):
+        result = find_elements.invoke({"by": "xpath", "value": "(//android.widget.Switch)[1]", "attributes": "text,checked"})
+
+    assert driver.find_calls == [("xpath", "(//android.widget.Switch)[1]")]
+    assert result.splitlines()[2] == "1 | Wi-Fi | true"
+
+
+def test_short_id_and_large_screen_fall_back_to_driver():
+    driver = FakeDriver()
+    driver.source = SOURCE.replace("</hierarchy>", "<!--" + "x" * LARGE_PAGE_SOURCE_CHARS + "--></hierarchy>")
+    with use_driver(driver):
+        large = find_elements.invoke({"by": "id", "value": "com.example:id/toggle", "attributes": "text,checked"})
+        # The large dump was not indexed
+        assert hierarchy.get_snapshot(driver) is None
+
+        # The page source only has full resource-ids; UiAutomator2 also accepts the short form
+        driver.source = SOURCE
+        short = find_elements.invoke({"by": "id", "value": "toggle", "attributes": "text,checked"})
+
+    assert large.splitlines()[2] == "1 | Wi-Fi | true"
+    assert short.splitlines()[2] == "1 | Wi-Fi | true"
+    assert driver.find_calls == [("id", "com.example:id/toggle"), ("id", "toggle")]
+
+
+def type_fast(driver, text, mode):
+    with use_driver(driver):
+        return send_keys.invoke({"by": "id", "value": "input", "text": text, "mode": mode})
+
+
+def test_fast_input_applied_in_full_is_not_typed():
+    field = FakeInput("Hi ")
+    result = type_fast(FastInputDriver(field, accepted=100), "hello world", "mobile_type")
+    assert result.endswith("(mode: mobile_type)")
+    assert field.content == "Hi hello world"
+    assert field.typed == []
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_partial_fast_input_is_undone_before_typing(fail):
+    field = FakeInput("Hi ")
+    result = type_fast(FastInputDriver(field, accepted=5, fail=fail), "hello world", "mobile_type")
+    assert result.endswith("(mode: type (fallback))")
+    assert field.content == "Hi hello world"
+
+
+def test_hint_is_not_restored_as_content():
+    field = FakeInput(hint="Search")
+    type_fast(FastInputDriver(field, accepted=3), "hello", "paste")
+    assert field.content == "hello"
+
+    # set_value replaces the content, so the fallback starts from an empty field
+    field = FakeInput("old")
+    type_fast(FastInputDriver(field, accepted=2), "new value", "set_value")
+    assert field.content == "new value"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,88 @@
+"""
+Test program for the XPath to UiAutomator2 locator optimizer
+Appiumサーバーなしで、XPathの書き換えとフォールバック、戦略ごとの計測をテスト
+"""
+
+import pytest
+from selenium.common.exceptions import InvalidSelectorException
+from appium_tools import locators
+from appium_tools.locators import find_element, get_locator_stats, optimize_locator
+
+
+ANDROID_CAPS = {"platformName": "Android", "automationName": "UiAutomator2"}
+
+
+class FakeDriver:
+    """受け取ったロケータを記録し、reject に含まれる戦略を拒否するフェイク"""
+
+    def __init__(self, capabilities=None, reject=()):
+        self.capabilities = capabilities if capabilities is not None else ANDROID_CAPS
+        self.reject = reject
+        self.calls = []
+
+    def find_element(self, by, value):
+        self.calls.append((by, value))
+        if by in self.reject:
+            raise InvalidSelectorException("unsupported")
+        return object()
+
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    locators.reset_locator_stats()
+    yield
+    locators.reset_locator_stats()
+
+
+@pytest.mark.parametrize("xpath, expected", [
+    ('//*[@text="Battery"]', ("-android uiautomator", 'new UiSelector().text("Battery")')),
+    ("//*[@resource-id='com.android.settings:id/search']", ("id", "com.android.settings:id/search")),
+    ("//*[@resource-id='search']", ("-android uiautomator", 'new UiSelector().resourceId("search")')),
+    ("//*[@content-desc='Navigate up']", ("accessibility_id", "Navigate up")),
+    ("//*[contains(@text, 'Wi')]", ("-android uiautomator", 'new UiSelector().textContains("Wi")')),
+    (
+        "//android.widget.Button[@text='OK' and starts-with(@content-desc, \"Con\")]",
+        ("-android uiautomator",
+         'new UiSelector().className("android.widget.Button").text("OK").descriptionStartsWith("Con")'),
+    ),
+    ('//*[@text=\'Say "hi"\']', ("-android uiautomator", 'new UiSelector().text("Say \\"hi\\"")')),
+])
+def test_common_xpaths_are_rewritten(xpath, expected):
+    assert optimize_locator("xpath", xpath) == expected
+
+
+@pytest.mark.parametrize("xpath", [
+    "//*[@text='A' or @text='B']",
+    "//*[@checked='true']",
+    "(//android.widget.TextView)[2]",
+    "//*[@text='Battery']/..",
+    "//*[@resource-id='list']//*[@text='Item']",
+])
+def test_other_xpaths_are_kept(xpath):
+    assert optimize_locator("xpath", xpath) == ("xpath", xpath)
+    assert optimize_locator("id", "foo") == ("id", "foo")
+
+
+def test_find_element_rewrites_only_on_uiautomator2_and_records_latency():
+    android = FakeDriver()
+    find_element(android, "xpath", '//*[@text="Battery"]')
+    assert android.calls == [("-android uiautomator", 'new UiSelector().text("Battery")')]
+
+    ios = FakeDriver(capabilities={"platformName": "iOS", "automationName": "XCUITest"})
+    find_element(ios, "xpath", '//*[@text="Battery"]')
+    assert ios.calls == [("xpath", '//*[@text="Battery"]')]
+
+    stats = get_locator_stats()
+    assert stats["-android uiautomator"]["calls"] == 1
+    assert stats["xpath"]["found"] == 1
+
+
+def test_rejected_selector_falls_back_to_xpath():
+    driver = FakeDriver(reject=("-android uiautomator",))
+    find_element(driver, "xpath", '//*[@text="Battery"]')
+    assert [by for by, _ in driver.calls] == ["-android uiautomator", "xpath"]
+    assert get_locator_stats()["-android uiautomator"]["found"] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
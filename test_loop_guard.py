@@ -0,0 +1,151 @@
+"""
+Test program for the loop / redundant-call guard
+Appiumサーバーなしで、フェイクのドライバーとツール呼び出しを使って重複呼び出しの省略とループ検出をテスト
+"""
+
+import io
+import pytest
+from types import SimpleNamespace
+from langchain_core.messages import ToolMessage
+from appium_tools.hierarchy import invalidate_screen, clear_screen_cache
+from appium_tools.loop_guard import LoopGuard, _normalize_args
+from appium_tools.session import use_driver
+
+PAGE_SOURCE = "Page source retrieved successfully:\n" + "<node text='Wi-Fi'/>" * 400
+
+
+class FakeDevice:
+    """ツール名 -> 出力を返し、呼ばれたツールを記録するハンドラー"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.calls = []
+
+    def __call__(self, request):
+        call = request.tool_call
+        self.calls.append(call["name"])
+        content = self.outputs[call["name"]]
+        return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"],
+                           status="error" if content.startswith("❌") else "success")
+
+
+def request(name, **args):
+    return SimpleNamespace(tool_call={"name": name, "args": args, "id": f"{name}-{len(args)}"})
+
+
+@pytest.fixture
+def driver():
+    fake = SimpleNamespace(session_id="loop-guard-session")
+    with use_driver(fake):
+        yield fake
+    clear_screen_cache(fake.session_id)
+
+
+def test_repeated_page_source_on_unchanged_screen_is_short_circuited(driver):
+    guard = LoopGuard()
+    device = FakeDevice({"get_page_source": PAGE_SOURCE, "click_element": "Element clicked"})
+
+    first = guard.wrap_tool_call(request("get_page_source"), device)
+    second = guard.wrap_tool_call(request("get_page_source"), device)
+    assert first.content == PAGE_SOURCE
+    assert "has not changed" in second.content
+    assert device.calls == ["get_page_source"]
+
+    # 画面を変える操作の後は、デバイスに問い合わせる
+    guard.wrap_tool_call(request("click_element", by="id", value="ok"), device)
+    invalidate_screen(driver)
+    guard.wrap_tool_call(request("get_page_source"), device)
+    assert device.calls == ["get_page_source", "click_element", "get_page_source"]
+
+    stats = guard.get_stats()
+    assert stats["short_circuited"] == 1 and stats["tokens_saved"] > 1000
+
+
+def test_near_identical_failed_locator_returns_previous_failure(driver):
+    guard = LoopGuard()
+    device = FakeDevice({"find_element": "❌ Element not found"})
+
+    guard.wrap_tool_call(request("find_element", by="xpath", value="//*[@text='Wi-Fi']"), device)
+    retry = guard.wrap_tool_call(request("find_element", by="xpath", value='//*[@text="Wi-Fi"] '), device)
+    assert device.calls == ["find_element"]
+    assert retry.status == "error" and "already failed" in retry.content
+
+    # 読み込みを待った後は、画面が変わっている可能性があるので再試行する
+    device.outputs["wait_short_loading"] = "Waited 1 seconds for loading"
+    guard.wrap_tool_call(request("wait_short_loading"), device)
+    guard.wrap_tool_call(request("find_element", by="xpath", value="//*[@text='Wi-Fi']"), device)
+    assert device.calls == ["find_element", "wait_short_loading", "find_element"]
+
+
+def test_oscillation_flagged(driver):
+    guard = LoopGuard()
+    device = FakeDevice({"click_element": "Element clicked", "press_keycode": "Pressed"})
+    results = []
+    for _ in range(2):
+        results.append(guard.wrap_tool_call(request("click_element", by="id", value="next"), device))
+        invalidate_screen(driver)
+        results.append(guard.wrap_tool_call(request("press_keycode", keycode=4), device))
+        invalidate_screen(driver)
+
+    assert "Possible loop" in results[-1].content
+    assert "Possible loop" not in results[1].content
+    assert guard.get_stats()["loops_flagged"] >= 1
+
+
+def test_repeated_scrolls_are_not_a_loop(driver):
+    guard = LoopGuard()
+    device = FakeDevice({"scroll_element": "Successfully scrolled down in element"})
+    for _ in range(5):
+        result = guard.wrap_tool_call(request("scroll_element", direction="down"), device)
+        invalidate_screen(driver)
+    assert "Possible loop" not in result.content
+    assert len(device.calls) == 5
+
+
+def test_failed_action_is_retried_on_the_device(driver):
+    """読み込み完了などで画面が変わった可能性があるため、失敗したクリックの再試行は省略しない"""
+    guard = LoopGuard()
+    device = FakeDevice({"click_element": "❌ Element not found"})
+    guard.wrap_tool_call(request("click_element", by="id", value="ok"), device)
+    device.outputs["click_element"] = "Successfully clicked on element by id with value ok"
+    retry = guard.wrap_tool_call(request("click_element", by="id", value="ok"), device)
+
+    assert device.calls == ["click_element", "click_element"]
+    assert retry.content.startswith("Successfully clicked")
+
+
+def test_page_source_reread_after_external_screen_change():
+    """スクリーンショットが変わっていれば、操作がなくても前回の結果を使わない"""
+    Image = pytest.importorskip("PIL.Image")
+
+    def png(shade):
+        buffer = io.BytesIO()
+        image = Image.new("L", (108, 240), 255)
+        image.paste(shade, (0, 0, 108, 120))
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    screen = {"png": png(255)}
+    fake = SimpleNamespace(session_id="loop-guard-vision", get_screenshot_as_png=lambda: screen["png"])
+    guard = LoopGuard()
+    device = FakeDevice({"get_page_source": PAGE_SOURCE})
+    with use_driver(fake):
+        guard.wrap_tool_call(request("get_page_source"), device)
+        guard.wrap_tool_call(request("get_page_source"), device)
+        assert device.calls == ["get_page_source"]
+
+        # 画面が非同期に変化（ダイアログ表示など）
+        screen["png"] = png(0)
+        guard.wrap_tool_call(request("get_page_source"), device)
+        assert device.calls == ["get_page_source", "get_page_source"]
+    clear_screen_cache(fake.session_id)
+
+
+def test_only_locator_arguments_are_normalized():
+    assert _normalize_args({"by": "xpath", "value": "//*[@text='A']  "}) == _normalize_args({"by": "xpath", "value": '//*[@text="A"]'})
+    assert _normalize_args({"text": "it's"}) != _normalize_args({"text": 'it"s'})
+    assert _normalize_args({"text": "a  b"}) != _normalize_args({"text": "a b"})
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
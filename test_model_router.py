@@ -0,0 +1,129 @@
+"""
+Test program for the cost-aware model router
+Appiumサーバー・LLMなしで、フェイクのチャットモデルを使ってモデルの振り分けとモデルごとの費用集計をテスト
+"""
+
+import pytest
+from langchain.agents import create_agent
+from langchain.tools import tool
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from appium_tools.budget import BudgetExceededError
+from appium_tools.model_router import ModelRouter
+from appium_tools.replay import ReplayMissError
+from appium_tools.token_counter import TiktokenCountCallback
+
+
+class NamedFakeChatModel(GenericFakeChatModel):
+    """bind_toolsに対応し、response_metadataにモデル名を入れて応答するフェイク"""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def reply(model_name, content="", tool_calls=None):
+    return AIMessage(
+        content=content,
+        tool_calls=tool_calls or [],
+        usage_metadata={"input_tokens": 1000, "output_tokens": 100, "total_tokens": 1100},
+        response_metadata={"model_name": model_name},
+    )
+
+
+def call(name, call_id):
+    return [{"name": name, "args": {}, "id": call_id}]
+
+
+@tool
+def click_element() -> str:
+    """Click the element."""
+    return "Element clicked"
+
+
+@tool
+def get_page_source() -> str:
+    """Get the page source."""
+    return "Page source retrieved successfully:\n<hierarchy/>"
+
+
+class TestChoose:
+
+    def test_planning_and_routine_steps(self):
+        router = ModelRouter()
+        assert router.choose([HumanMessage("Open Wi-Fi")]) == ("strong", "planning")
+        messages = [HumanMessage("x"), AIMessage(content="", tool_calls=call("click_element", "1")),
+                    ToolMessage("Element clicked", name="click_element", tool_call_id="1")]
+        assert router.choose(messages)[0] == "cheap"
+
+    def test_failures_escalate(self):
+        router = ModelRouter(escalate_after_failures=2)
+        failed = ToolMessage("❌ Element not found", name="click_element", tool_call_id="1")
+        ok = ToolMessage("Element clicked", name="click_element", tool_call_id="2")
+        assert router.choose([HumanMessage("x"), failed]) == ("strong", "tool failure")
+        # 2回失敗したターンは、成功が続いても大きいモデルのまま
+        assert router.choose([HumanMessage("x"), failed, failed, ok])[0] == "strong"
+        # 新しいターンではリセット
+        assert router.choose([HumanMessage("x"), failed, failed, HumanMessage("y"), ok])[0] == "cheap"
+
+
+def test_agent_steps_routed_and_cost_reported_per_model():
+    strong = NamedFakeChatModel(messages=iter([
+        reply("gpt-4.1", tool_calls=call("click_element", "1")),
+        reply("gpt-4.1", content="done"),
+    ]))
+    cheap = NamedFakeChatModel(messages=iter([
+        reply("gpt-4.1-nano", tool_calls=call("get_page_source", "2")),
+    ]))
+    router = ModelRouter(cheap_model=cheap)
+    agent = create_agent(model=strong, tools=[click_element, get_page_source], middleware=[router])
+    counter = TiktokenCountCallback(model="gpt-4.1")
+    agent.invoke({"messages": [{"role": "user", "content": "Open Wi-Fi"}]}, config={"callbacks": [counter]})
+
+    # 計画 → クリック後の定型ステップ → ページソースを読むステップ
+    assert [r["tier"] for r in router.history] == ["strong", "cheap", "strong"]
+    breakdown = counter.get_model_breakdown()
+    assert breakdown["gpt-4.1"]["calls"] == 2 and breakdown["gpt-4.1-nano"]["calls"] == 1
+    assert breakdown["gpt-4.1-nano"]["total_cost_usd"] < breakdown["gpt-4.1"]["total_cost_usd"] / 2
+    # 合計費用はモデルごとの料金で計算される
+    assert counter.get_metrics()["total_cost_usd"] == pytest.approx(
+        sum(stats["total_cost_usd"] for stats in breakdown.values()), abs=1e-6)
+
+
+def test_cheap_model_error_retried_on_large_model():
+    class BrokenModel(NamedFakeChatModel):
+        def _generate(self, *args, **kwargs):
+            raise RuntimeError("rate limited")
+
+    strong = NamedFakeChatModel(messages=iter([
+        reply("gpt-4.1", tool_calls=call("click_element", "1")),
+        reply("gpt-4.1", content="done"),
+    ]))
+    router = ModelRouter(cheap_model=BrokenModel(messages=iter([])))
+    agent = create_agent(model=strong, tools=[click_element], middleware=[router])
+    result = agent.invoke({"messages": [{"role": "user", "content": "Tap OK"}]})
+
+    assert result["messages"][-1].content == "done"
+    assert router.get_stats()["escalated"] == 1
+
+
+@pytest.mark.parametrize("error", [
+    BudgetExceededError("query", "max_cost_usd", 0.02, 0.01, {}),
+    ReplayMissError("not recorded"),
+])
+def test_budget_and_replay_errors_are_not_escalated(error):
+    class RefusingModel(NamedFakeChatModel):
+        def _generate(self, *args, **kwargs):
+            raise error
+
+    # 大きいモデルは最初のステップの分だけ応答を持つ（再試行されると StopIteration になる）
+    strong = NamedFakeChatModel(messages=iter([reply("gpt-4.1", tool_calls=call("click_element", "1"))]))
+    router = ModelRouter(cheap_model=RefusingModel(messages=iter([])))
+    agent = create_agent(model=strong, tools=[click_element], middleware=[router])
+    with pytest.raises(type(error)):
+        agent.invoke({"messages": [{"role": "user", "content": "Tap OK"}]})
+
+    assert router.get_stats()["escalated"] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,110 @@
+"""
+Test program for the navigation tools
+Appiumサーバーなしで、wait_for_element の待機・タイムアウト、待機後のキャッシュ破棄、巨大なページソースの縮約をテスト
+"""
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+from appium_tools import hierarchy
+from appium_tools.navigation import LARGE_PAGE_SOURCE_CHARS, get_page_changes, get_page_source, wait_for_element, wait_short_loading
+from appium_tools.session import use_driver
+
+
+class FakeElement:
+    def __init__(self, text="", displayed=True):
+        self.text = text
+        self.displayed = displayed
+
+    def is_displayed(self):
+        return self.displayed
+
+
+class FakeDriver:
+    """find_element の n 回目以降に states[n] の要素を返すフェイク（None は見つからない）"""
+
+    def __init__(self, states):
+        self.session_id = "wait-session"
+        self.states = states
+        self.find_calls = 0
+
+    def find_element(self, by, value):
+        state = self.states[min(self.find_calls, len(self.states) - 1)]
+        self.find_calls += 1
+        if state is None:
+            raise NoSuchElementException(value)
+        return state
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    hierarchy.clear_screen_cache()
+    yield
+    hierarchy.clear_screen_cache()
+
+
+def wait(driver, **args):
+    with use_driver(driver):
+        return wait_for_element.invoke({"by": "id", "value": "android:id/title", "interval": 0.01, **args})
+
+
+def test_returns_as_soon_as_visible():
+    driver = FakeDriver([None, None, FakeElement(displayed=False), FakeElement()])
+    result = wait(driver, timeout=5)
+    assert result.startswith("Element by id with value android:id/title is visible after")
+    assert driver.find_calls == 4
+    # Waiting may change the screen, so cached hierarchies are dropped
+    assert hierarchy.screen_epoch(driver) == 1
+
+
+def test_gone_and_text_equals():
+    assert "is gone" in wait(FakeDriver([FakeElement(), FakeElement(displayed=False)]), condition="gone")
+    assert "is gone" in wait(FakeDriver([FakeElement(), None]), condition="gone")
+
+    driver = FakeDriver([FakeElement("Connecting"), FakeElement("Connected")])
+    assert "showing text 'Connected'" in wait(driver, condition="text_equals", text="Connected")
+
+
+def test_timeout_and_invalid_condition():
+    result = wait(FakeDriver([None]), timeout=0.05)
+    assert result.startswith("❌ Timed out after")
+    assert "is not visible" in result
+
+    with pytest.raises(ValueError):
+        wait(FakeDriver([None]), condition="clickable")
+
+
+def test_short_loading_drops_cached_geometry():
+    driver = FakeDriver([None])
+    hierarchy.store_snapshot(driver, '<hierarchy><android.widget.Button resource-id="a:id/ok" bounds="[0,0][10,10]" /></hierarchy>')
+    assert hierarchy.peek_element_rect(driver, "id", "a:id/ok") is not None
+    with use_driver(driver):
+        assert wait_short_loading.invoke({"seconds": "0"}) == "Waited 0 seconds for loading"
+
+    # Bounds from before the load are not reused by scroll/long_press/double_tap
+    assert hierarchy.peek_element_rect(driver, "id", "a:id/ok") is None
+    assert hierarchy.screen_epoch(driver) == 1
+
+
+def test_large_page_source_is_compacted_without_a_snapshot():
+    row = '<android.widget.TextView class="android.widget.TextView" text="Item {i}" resource-id="" bounds="[0,0][10,10]" />'
+    padding = '<android.view.View class="android.view.View" text="" resource-id="" bounds="[0,0][1,1]" />'
+    rows = "".join(row.format(i=i) + padding * 20 for i in range(200))
+    source = f"<hierarchy>{rows}</hierarchy>"
+    assert len(source) > LARGE_PAGE_SOURCE_CHARS
+
+    driver = FakeDriver([None])
+    driver.page_source = source
+    with use_driver(driver):
+        result = get_page_source.invoke({})
+        changes = get_page_changes.invoke({})
+
+    assert result.startswith("Page source retrieved successfully (large screen")
+    assert '<TextView text="Item 199"' in result and "<View" not in result
+    # The dump is neither indexed nor kept as the diff baseline
+    assert hierarchy.get_snapshot(driver) is None
+    assert hierarchy.get_last_seen(driver) is None
+    assert changes == result
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,85 @@
+"""
+Test program for LLM/tool record and replay
+Appiumサーバー・LLMなしで、フェイクのモデルとツールを使って記録・再生・パススルーをテスト
+"""
+
+import pytest
+from langchain.agents import create_agent
+from langchain.tools import tool
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from appium_tools.replay import CachedChatModel, ReplayCache, ReplayMissError, ToolReplayMiddleware
+from appium_tools.token_counter import TiktokenCountCallback
+
+
+def fake_llm():
+    usage = {"input_tokens": 800, "output_tokens": 20, "total_tokens": 820}
+    return GenericFakeChatModel(messages=iter([
+        AIMessage(content="", tool_calls=[{"name": "get_page_source", "args": {}, "id": "call-1"}],
+                  usage_metadata=usage, response_metadata={"model_name": "gpt-4.1"}),
+        AIMessage(content="Wi-Fi is on", usage_metadata=usage, response_metadata={"model_name": "gpt-4.1"}),
+    ]))
+
+
+device_calls = []
+
+
+@tool
+def get_page_source() -> str:
+    """Get the page source."""
+    device_calls.append("get_page_source")
+    return "Page source retrieved successfully:\n<hierarchy/>"
+
+
+def run(cache, inner):
+    model = CachedChatModel(model_name="gpt-4.1", inner=inner, replay_cache=cache)
+    agent = create_agent(model=model, tools=[get_page_source], middleware=[ToolReplayMiddleware(cache)])
+    counter = TiktokenCountCallback(model="gpt-4.1")
+    result = agent.invoke({"messages": [{"role": "user", "content": "Is Wi-Fi on?"}]}, config={"callbacks": [counter]})
+    return result, counter
+
+
+def test_record_then_replay_offline(tmp_path):
+    device_calls.clear()
+    recorded, _ = run(ReplayCache(str(tmp_path), mode="record"), fake_llm())
+    assert device_calls == ["get_page_source"]
+    assert len(list((tmp_path / "llm").iterdir())) == 2
+    assert len(list((tmp_path / "tools").iterdir())) == 1
+
+    # 再生: モデルなし（APIキー不要）、デバイスにも触れない
+    cache = ReplayCache(str(tmp_path), mode="replay")
+    replayed, counter = run(cache, inner=None)
+    assert device_calls == ["get_page_source"]
+    assert [m.content for m in replayed["messages"]] == [m.content for m in recorded["messages"]]
+    assert cache.stats["hits"] == 3
+    # 記録された使用量がトークンカウンターに報告される
+    assert counter.get_metrics()["input_tokens"] == 1600
+
+
+def test_replay_miss_raises(tmp_path):
+    with pytest.raises(ReplayMissError):
+        run(ReplayCache(str(tmp_path), mode="replay"), inner=None)
+
+
+def test_passthrough_writes_nothing(tmp_path):
+    device_calls.clear()
+    run(ReplayCache(str(tmp_path), mode="passthrough"), fake_llm())
+    assert device_calls == ["get_page_source"]
+    assert not any(tmp_path.iterdir())
+
+
+def test_repeated_tool_calls_replayed_in_order(tmp_path):
+    recorder = ReplayCache(str(tmp_path), mode="record")
+    first, second = recorder.tool_key("get_page_source", {}), recorder.tool_key("get_page_source", {})
+    assert first != second
+    replayer = ReplayCache(str(tmp_path), mode="replay")
+    assert replayer.tool_key("get_page_source", {}) == first
+
+
+def test_unknown_mode_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ReplayCache(str(tmp_path), mode="rewind")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
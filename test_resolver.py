@@ -0,0 +1,157 @@
+"""
+Test program for the locator fallback resolver
+Appiumサーバーなしで、見つからないロケータに対する候補提示と自動クリックをテスト
+"""
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+from appium_tools import hierarchy
+from appium_tools.hierarchy import HierarchySnapshot, get_last_seen
+from appium_tools.interaction import click_element, find_element
+from appium_tools.resolver import confident_match, similarity, suggest_locators
+from appium_tools.session import use_driver
+
+
+SOURCE = """<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>
+<hierarchy index="0" rotation="0">
+  <android.widget.FrameLayout class="android.widget.FrameLayout" text="" resource-id="" content-desc="" bounds="[0,0][1080,2400]">
+    <android.widget.TextView class="android.widget.TextView" text="Wi-Fi" resource-id="android:id/title" content-desc="" bounds="[100,300][900,360]" />
+    <android.widget.TextView class="android.widget.TextView" text="Bluetooth" resource-id="android:id/title" content-desc="" bounds="[100,400][900,460]" />
+    <android.widget.Button class="android.widget.Button" text="OK" resource-id="com.example:id/button_ok" content-desc="Confirm" bounds="[100,500][900,560]" />
+  </android.widget.FrameLayout>
+</hierarchy>
+"""
+
+# The same screen after a search result row appeared: "Wi-Fi" is no longer unique
+LIVE_SOURCE = SOURCE.replace(
+    '    <android.widget.Button',
+    '    <android.widget.TextView class="android.widget.TextView" text="Wi-Fi" resource-id="com.example:id/result" content-desc="" bounds="[100,600][900,660]" />\n'
+    '    <android.widget.Button',
+)
+
+# A label with a double quote cannot be put into an XPath literal, so only a positional locator is left
+QUOTED_SOURCE = SOURCE.replace('text="Bluetooth"', 'text="Say &quot;hello!&quot;"')
+
+
+class FakeElement:
+    def __init__(self, driver, locator):
+        self.driver = driver
+        self.locator = locator
+
+    def click(self):
+        self.driver.clicked.append(self.locator)
+
+
+class FakeDriver:
+    """source に一致するロケータだけ見つかる（複数なら先頭、評価できないロケータは常に見つかる）フェイク"""
+
+    def __init__(self, source=SOURCE):
+        self.session_id = "resolver-session"
+        self.page_source_calls = 0
+        self.clicked = []
+        self.source = source
+        self._snapshot = HierarchySnapshot(source)
+
+    @property
+    def page_source(self):
+        self.page_source_calls += 1
+        return self.source
+
+    def find_element(self, by, value):
+        if self._snapshot.find_all(by, value) == []:
+            raise NoSuchElementException(f"{by}={value}")
+        return FakeElement(self, (by, value))
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    hierarchy.clear_screen_cache()
+    yield
+    hierarchy.clear_screen_cache()
+
+
+def test_similarity_ignores_case_and_whitespace():
+    assert similarity("  wi-fi ", "Wi-Fi") == 1.0
+    assert similarity("WiFi", "Wi-Fi") == pytest.approx(0.8)
+    assert similarity("", "Wi-Fi") == 0.0
+
+
+def test_suggestions_rank_nearest_and_give_unique_locators():
+    snapshot = HierarchySnapshot(SOURCE)
+
+    suggestions = suggest_locators(snapshot, "xpath", "//*[@text='Wifi']")
+    assert suggestions[0]["label"] == "Wi-Fi"
+    # resource-id is shared with Bluetooth, so the locator falls back to the text
+    assert (suggestions[0]["by"], suggestions[0]["value"]) == ("xpath", '//*[@text="Wi-Fi"]')
+
+    # Short ids match the package-qualified resource-id, but an id match is only suggested
+    suggestions = suggest_locators(snapshot, "id", "button_ok")
+    assert (suggestions[0]["by"], suggestions[0]["value"], suggestions[0]["score"]) == ("id", "com.example:id/button_ok", 1.0)
+    assert confident_match(suggestions) is None
+
+    assert suggest_locators(snapshot, "xpath", "//*[@text='Display']") == []
+
+
+def test_click_uses_single_confident_match():
+    driver = FakeDriver()
+    with use_driver(driver):
+        result = click_element.invoke({"by": "xpath", "value": "//*[@text='wi-fi ']"})
+
+    assert "Successfully clicked" in result
+    assert "closest element" in result
+    assert driver.clicked == [("xpath", '//*[@text="Wi-Fi"]')]
+    # The page source was fetched once for matching but never shown to the agent
+    assert driver.page_source_calls == 1
+    assert get_last_seen(driver) is None
+
+
+def test_shared_package_prefix_does_not_make_ids_similar():
+    snapshot = HierarchySnapshot(SOURCE)
+    # "com.example:id/button_no" vs ".../button_ok" is 0.92 on the full string
+    suggestions = suggest_locators(snapshot, "id", "com.example:id/button_no")
+    assert suggestions[0]["score"] == pytest.approx(0.78)
+
+    driver = FakeDriver()
+    with use_driver(driver):
+        result = click_element.invoke({"by": "xpath", "value": "//*[@resource-id='com.example:id/button_no']"})
+    assert result.startswith("❌ Element not found")
+    assert driver.clicked == []
+
+
+def test_ambiguous_miss_lists_candidates_without_clicking():
+    driver = FakeDriver()
+    with use_driver(driver):
+        result = click_element.invoke({"by": "id", "value": "android:id/titel"})
+        found = find_element.invoke({"by": "id", "value": "android:id/titel"})
+
+    assert result.startswith("❌ Element not found")
+    assert "Closest elements on the current screen" in result
+    assert "get_page_source()" not in result
+    assert driver.clicked == []
+    assert found.count("- by=") == 2
+    assert driver.page_source_calls == 1
+
+
+def test_auto_click_decides_on_the_live_screen():
+    driver = FakeDriver(source=LIVE_SOURCE)
+    # Cached before the extra "Wi-Fi" row appeared
+    hierarchy.store_snapshot(driver, SOURCE, seen=False)
+    with use_driver(driver):
+        result = click_element.invoke({"by": "xpath", "value": "//*[@text='wi-fi ']"})
+
+    assert result.startswith("❌ Element not found")
+    assert driver.clicked == []
+    assert driver.page_source_calls == 1
+
+
+def test_positional_candidate_is_suggested_but_not_clicked():
+    driver = FakeDriver(source=QUOTED_SOURCE)
+    with use_driver(driver):
+        result = click_element.invoke({"by": "xpath", "value": """//*[@text='Say "hello"']"""})
+
+    assert "by='xpath' value='(//android.widget.TextView)[2]'" in result
+    assert driver.clicked == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
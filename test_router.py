@@ -0,0 +1,83 @@
+"""
+Test program for the tool router
+Appiumサーバー・LLMなしで、フェイクのチャットモデルを使ってツールの動的な公開とスキーマトークンの削減をテスト
+"""
+
+import pytest
+from langchain.agents import create_agent
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from appium_tools import appium_tools
+from appium_tools.router import CORE_TOOLS, ToolRouter, select_groups
+from appium_tools.token_counter import TiktokenCountCallback
+
+
+class ToolRecordingFakeChatModel(GenericFakeChatModel):
+    """bind_toolsで渡されたツール名を呼び出しごとに記録するフェイク"""
+
+    exposed: list = []
+
+    def bind_tools(self, tools, **kwargs):
+        schemas = [convert_to_openai_tool(t) for t in tools]
+        self.exposed.append([s["function"]["name"] for s in schemas])
+        return self.bind(tools=schemas, **kwargs)
+
+
+USAGE = {"input_tokens": 10, "output_tokens": 2, "total_tokens": 12}
+
+
+def make_agent(responses, router):
+    model = ToolRecordingFakeChatModel(messages=iter(responses), exposed=[])
+    agent = create_agent(model=model, tools=appium_tools(), middleware=[router])
+    return agent, model
+
+
+def test_select_groups_from_task():
+    assert select_groups("Rotate the screen to landscape") == {"device_info"}
+    assert select_groups("設定アプリを開いてWi-Fiまでスクロール") == {"app_management", "navigation"}
+    assert select_groups("Tap OK") == set()
+
+
+def test_only_core_tools_for_plain_task():
+    router = ToolRouter()
+    agent, model = make_agent([AIMessage(content="done")], router)
+    agent.invoke({"messages": [{"role": "user", "content": "Tap OK"}]})
+
+    assert set(model.exposed[0]) == set(CORE_TOOLS) | {"request_tools"}
+    stats = router.get_stats()
+    assert stats["calls"] == 1
+    assert 0 < stats["exposed_schema_tokens"] < stats["full_schema_tokens"]
+    assert stats["saved_ratio"] > 0.3
+
+
+def test_agent_can_request_a_group():
+    router = ToolRouter()
+    responses = [
+        AIMessage(content="", tool_calls=[{"name": "request_tools", "args": {"groups": "device_info"}, "id": "1"}],
+                  usage_metadata=USAGE),
+        AIMessage(content="done", usage_metadata=USAGE),
+    ]
+    agent, model = make_agent(responses, router)
+    counter = TiktokenCountCallback(model="gpt-4.1")
+    result = agent.invoke(
+        {"messages": [{"role": "user", "content": "Tap OK"}]},
+        config={"callbacks": [counter]},
+    )
+
+    assert "set_orientation" not in model.exposed[0]
+    assert "set_orientation" in model.exposed[1]
+    assert "Enabled tool groups: device_info" in result["messages"][2].content
+    assert router.history[1]["groups"] == ["device_info"]
+    # 実際に送られたスキーマのトークン数はコールバック側でも記録される
+    first, second = counter.invocation_history
+    assert 0 < first["tool_schema_tokens"] < second["tool_schema_tokens"]
+
+
+def test_unknown_always_enabled_group_rejected():
+    with pytest.raises(ValueError):
+        ToolRouter(always_enabled=["camera"])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
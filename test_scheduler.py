@@ -0,0 +1,215 @@
+"""
+Test program for the device-farm scheduler
+Appiumサーバー・LLMなしで、フェイクのドライバーとエージェントを使って優先度・デバイス割り当て・リトライ・レポートをテスト
+"""
+
+import asyncio
+import time
+import pytest
+from types import SimpleNamespace
+from appium.options.android import UiAutomator2Options
+import appium_tools.session as session_module
+from appium_tools.budget import BudgetExceededError
+from appium_tools.scheduler import AgentTask, Device, DeviceScheduler
+
+
+class FakeDriver:
+    def __init__(self, url, options=None):
+        self.session_id = f"session-{id(self)}"
+        self.activated = []
+
+    def activate_app(self, app_id):
+        self.activated.append(app_id)
+
+    @property
+    def timeouts(self):
+        return {}
+
+    def quit(self):
+        pass
+
+
+class FakeAgent:
+    """プロンプトを記録し、failures で指定したプロンプトを指定回数だけ失敗させるフェイク"""
+
+    def __init__(self, log, failures):
+        self.log = log
+        self.failures = failures
+
+    async def ainvoke(self, inputs, config=None):
+        prompt = inputs["messages"][0]["content"]
+        self.log.append((prompt, session_module.current_driver().session_id))
+        await asyncio.sleep(0.01)
+        if self.failures.get(prompt, 0) > 0:
+            self.failures[prompt] -= 1
+            raise RuntimeError("agent failed")
+        return {"messages": [SimpleNamespace(content=f"done: {prompt}")]}
+
+
+@pytest.fixture(autouse=True)
+def fake_remote(monkeypatch):
+    monkeypatch.setattr(session_module.webdriver, "Remote", FakeDriver)
+
+
+def make_device(name, version="14"):
+    options = UiAutomator2Options()
+    options.set_capability("appium:udid", name)
+    options.set_capability("appium:platformVersion", version)
+    return Device(name, options)
+
+
+def make_scheduler(devices, failures=None):
+    log = []
+    scheduler = DeviceScheduler(devices, agent_factory=lambda: FakeAgent(log, failures or {}))
+    return scheduler, log
+
+
+@pytest.mark.asyncio
+async def test_priority_order_on_single_device():
+    scheduler, log = make_scheduler([make_device("d1")])
+    tasks = [AgentTask("low"), AgentTask("high", priority=5), AgentTask("mid", priority=1)]
+    results = await scheduler.run(tasks)
+
+    assert [prompt for prompt, _ in log] == ["high", "mid", "low"]
+    # 結果は投入順
+    assert [r["prompt"] for r in results] == ["low", "high", "mid"]
+    assert all(r["status"] == "succeeded" for r in results)
+    assert results[0]["metrics"]["total_tokens"] == 0
+
+
+@pytest.mark.asyncio
+async def test_tasks_go_to_matching_devices_only():
+    scheduler, _ = make_scheduler([make_device("old", "12"), make_device("new", "14")])
+    tasks = [
+        AgentTask("needs 14", capabilities={"appium:platformVersion": "14"}),
+        AgentTask("needs 15", capabilities={"appium:platformVersion": "15"}),
+        AgentTask("any"),
+    ]
+    results = {r["prompt"]: r for r in await scheduler.run(tasks)}
+
+    assert results["needs 14"]["device"] == "new"
+    assert results["needs 15"]["status"] == "unschedulable"
+    assert results["any"]["status"] == "succeeded"
+
+
+@pytest.mark.asyncio
+async def test_failed_task_is_retried_then_gives_up():
+    scheduler, log = make_scheduler([make_device("d1")], failures={"flaky": 1, "broken": 5})
+    results = {r["prompt"]: r for r in await scheduler.run([
+        AgentTask("flaky", max_retries=1),
+        AgentTask("broken", max_retries=1),
+    ])}
+
+    assert results["flaky"]["status"] == "succeeded"
+    assert results["flaky"]["attempt"] == 2
+    assert results["broken"]["status"] == "failed"
+    assert "agent failed" in results["broken"]["error"]
+
+    report = scheduler.get_report()
+    assert report["succeeded"] == 1 and report["failed"] == 1 and report["retried"] == 2
+    assert report["devices"]["d1"]["tasks"] == 4
+    assert 0 < report["devices"]["d1"]["utilization"] <= 1
+    assert "SCHEDULER REPORT" in scheduler.format_report()
+
+
+@pytest.mark.asyncio
+async def test_devices_run_in_parallel_with_their_own_driver():
+    scheduler, log = make_scheduler([make_device("d1"), make_device("d2")])
+    await scheduler.run([AgentTask(f"t{i}") for i in range(4)])
+
+    sessions = {session_id for _, session_id in log}
+    # 2台それぞれのセッションがプールから再利用される
+    assert len(sessions) == 2
+    assert scheduler.get_report()["devices"]["d1"]["tasks"] == 2
+
+
+@pytest.mark.asyncio
+async def test_on_result_streams_final_results_only():
+    streamed = []
+    log = []
+    scheduler = DeviceScheduler(
+        [make_device("d1")],
+        agent_factory=lambda: FakeAgent(log, {"flaky": 1}),
+        on_result=streamed.append,
+    )
+    await scheduler.run([AgentTask("flaky"), AgentTask("x", capabilities={"appium:udid": "nope"})])
+
+    # リトライ中の失敗は流さず、最終結果だけを1件ずつ通知する
+    assert [(r["prompt"], r["status"]) for r in streamed] == [("x", "unschedulable"), ("flaky", "succeeded")]
+
+
+@pytest.mark.asyncio
+async def test_task_callbacks_and_budget_breach_is_not_retried():
+    class OverBudgetAgent:
+        def __init__(self):
+            self.callbacks = []
+
+        async def ainvoke(self, inputs, config=None):
+            self.callbacks.append(config["callbacks"])
+            raise BudgetExceededError("query", "max_cost_usd", 0.3, 0.2, {})
+
+    agent = OverBudgetAgent()
+    shared = object()
+    scheduler = DeviceScheduler(
+        [make_device("d1")],
+        agent_factory=lambda: agent,
+        callbacks_factory=lambda task: [f"guard-{task.task_id}", shared],
+    )
+    results = await scheduler.run([AgentTask("expensive", max_retries=3, task_id="t1")])
+
+    # 予算超過は再試行しない（同じ予算をもう一度使うだけ）
+    assert results[0]["status"] == "failed" and results[0]["attempt"] == 1
+    assert results[0]["error"].startswith("BudgetExceededError: query budget exceeded")
+    assert agent.callbacks[0][1:] == ["guard-t1", shared]
+
+
+@pytest.mark.asyncio
+async def test_retry_goes_to_a_device_that_finished_earlier():
+    class SlowFailureAgent(FakeAgent):
+        async def ainvoke(self, inputs, config=None):
+            if inputs["messages"][0]["content"] == "flaky" and self.failures.get("flaky"):
+                await asyncio.sleep(0.1)
+            return await super().ainvoke(inputs, config)
+
+    log = []
+    failures = {"flaky": 1}
+    scheduler = DeviceScheduler([make_device("d1"), make_device("d2")],
+                                agent_factory=lambda: SlowFailureAgent(log, failures))
+    results = {r["prompt"]: r for r in await scheduler.run([AgentTask("flaky", priority=1), AgentTask("quick")])}
+
+    # d2 は quick を終えた後も待機し、d1 で失敗した flaky の再試行を引き受ける
+    assert results["flaky"]["status"] == "succeeded"
+    assert results["flaky"]["device"] == "d2"
+    assert sorted(prompt for prompt, _ in log) == ["flaky", "flaky", "quick"]
+
+
+class SlowStartDriver(FakeDriver):
+    """セッション開始と activate_app がブロッキングで時間のかかるフェイク"""
+
+    def __init__(self, url, options=None):
+        time.sleep(0.3)
+        super().__init__(url, options)
+
+    def activate_app(self, app_id):
+        time.sleep(0.2)
+        super().activate_app(app_id)
+
+
+@pytest.mark.asyncio
+async def test_session_start_does_not_block_other_devices(monkeypatch):
+    """あるデバイスのセッション開始中も、他のデバイスの処理がイベントループ上で進む"""
+    monkeypatch.setattr(session_module.webdriver, "Remote", SlowStartDriver)
+    scheduler, log = make_scheduler([make_device(f"d{i}") for i in range(3)])
+    tasks = [AgentTask(f"t{i}", app_package="com.android.settings") for i in range(3)]
+
+    start = time.perf_counter()
+    results = await scheduler.run(tasks)
+    elapsed = time.perf_counter() - start
+
+    assert all(r["status"] == "succeeded" for r in results)
+    # イベントループ上で直列に実行されると 3台 × (0.3 + 0.2) 秒 = 1.5秒
+    assert elapsed < 1.0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,105 @@
+"""
+Test program for screenshot-based screen-change detection
+Appiumサーバーなしで、合成画像を使って知覚ハッシュ・変化領域検出をテスト
+"""
+
+import io
+import pytest
+
+pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+from appium_tools import screen_diff
+
+
+def make_png(size=(1080, 2400), box=None, color=(255, 255, 255)):
+    """白背景（グラデーション付き）に任意の矩形を描いたPNGを生成"""
+    image = Image.new("RGB", size, color)
+    draw = ImageDraw.Draw(image)
+    for y in range(0, size[1], 100):
+        draw.rectangle([0, y, size[0], y + 10], fill=(200, 200, 200))
+    if box is not None:
+        draw.rectangle(box, fill=(0, 0, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeDriver:
+    def __init__(self, frames):
+        self.session_id = "fake-session"
+        self.frames = list(frames)
+        self.calls = 0
+
+    def get_screenshot_as_png(self):
+        self.calls += 1
+        return self.frames[min(self.calls - 1, len(self.frames) - 1)]
+
+
+@pytest.fixture(autouse=True)
+def clear_frames():
+    screen_diff.clear_frames()
+    yield
+    screen_diff.clear_frames()
+
+
+def test_identical_frames_unchanged():
+    frame = screen_diff.compute_frame(make_png())
+    result = screen_diff.compare_frames(frame, screen_diff.compute_frame(make_png()))
+    assert result["changed"] is False
+    assert result["hash_distance"] == 0
+    assert result["regions"] == []
+
+
+def test_changed_region_is_located_in_screen_coordinates():
+    before = screen_diff.compute_frame(make_png())
+    after = screen_diff.compute_frame(make_png(box=[800, 100, 1000, 300]))
+    result = screen_diff.compare_frames(before, after)
+    assert result["changed"] is True
+    assert len(result["regions"]) == 1
+    region = result["regions"][0]
+    # 変化した矩形を含む（グリッドセル単位で拡張される）
+    assert region["x"] <= 800 and region["x"] + region["width"] >= 1000
+    assert region["y"] <= 100 and region["y"] + region["height"] >= 300
+
+
+def test_separate_changes_produce_separate_regions():
+    before = screen_diff.compute_frame(make_png())
+    image = Image.open(io.BytesIO(make_png(box=[0, 0, 200, 200])))
+    ImageDraw.Draw(image).rectangle([800, 2000, 1000, 2300], fill=(0, 0, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    result = screen_diff.compare_frames(before, screen_diff.compute_frame(buffer.getvalue()))
+    assert len(result["regions"]) == 2
+
+
+def test_size_change_counts_as_full_change():
+    before = screen_diff.compute_frame(make_png(size=(1080, 2400)))
+    after = screen_diff.compute_frame(make_png(size=(2400, 1080)))
+    result = screen_diff.compare_frames(before, after)
+    assert result["changed"] is True
+    assert result["regions"] == [{"x": 0, "y": 0, "width": 2400, "height": 1080}]
+
+
+def test_check_screen_change_uses_previous_frame_per_session():
+    driver = FakeDriver([make_png(), make_png(), make_png(box=[0, 0, 500, 500])])
+    assert screen_diff.check_screen_change(driver) is None
+    assert screen_diff.check_screen_change(driver)["changed"] is False
+    assert screen_diff.check_screen_change(driver)["changed"] is True
+
+
+def test_wait_for_change_stops_at_first_changed_frame():
+    driver = FakeDriver([make_png(), make_png(), make_png(box=[0, 0, 500, 500])])
+    baseline = screen_diff.set_baseline(driver)
+    result = screen_diff.wait_for_change(driver, baseline, timeout=5, interval=0)
+    assert result["changed"] is True
+    assert driver.calls == 3
+
+
+def test_wait_for_change_times_out_when_nothing_changes():
+    driver = FakeDriver([make_png()])
+    baseline = screen_diff.set_baseline(driver)
+    result = screen_diff.wait_for_change(driver, baseline, timeout=0.05, interval=0.01)
+    assert result["changed"] is False
+    assert "elapsed_seconds" in result
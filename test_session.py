@@ -0,0 +1,236 @@
+"""
+Test program for session management (SessionPool, auto recovery)
+Appiumサーバーなしでセッション再利用・ヘルスチェック・アイドル破棄・自動復旧をテスト
+"""
+
+import contextvars
+import threading
+from types import SimpleNamespace
+import pytest
+from appium.options.android import UiAutomator2Options
+from selenium.common.exceptions import InvalidSessionIdException
+import appium_tools.session as session_module
+from appium_tools.session import SessionPool, apply_fast_start_profile, FAST_START_CAPABILITIES
+from appium_tools import hierarchy, is_locked, activate_app, terminate_app
+
+
+class FakeDriver:
+    """webdriver.Remote の代わりに使う最小限のフェイク"""
+    
+    created = 0
+    
+    def __init__(self, url, options=None):
+        FakeDriver.created += 1
+        self.session_id = f"session-{FakeDriver.created}"
+        self.alive = True
+        self.quit_called = False
+        self.activated = []
+    
+    def start_session(self, capabilities, browser_profile=None):
+        """セッションの再作成（SessionSupervisor.recoverから呼ばれる）"""
+        self.session_id = f"{self.session_id}-recovered"
+        self.alive = True
+    
+    def is_locked(self):
+        if not self.alive:
+            raise InvalidSessionIdException("session is gone")
+        return False
+    
+    def activate_app(self, app_id):
+        self.activated.append(app_id)
+    
+    def terminate_app(self, app_id):
+        return True
+    
+    @property
+    def timeouts(self):
+        if not self.alive:
+            raise RuntimeError("session is gone")
+        return {}
+    
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture(autouse=True)
+def fake_remote(monkeypatch):
+    FakeDriver.created = 0
+    monkeypatch.setattr(session_module.webdriver, "Remote", FakeDriver)
+
+
+def make_options(package: str = "com.android.settings") -> UiAutomator2Options:
+    options = UiAutomator2Options()
+    options.set_capability("appium:appPackage", package)
+    return options
+
+
+class TestSessionPool:
+    
+    def test_release_and_reuse(self):
+        """解放したセッションは同じオプションで再利用される"""
+        pool = SessionPool()
+        first = pool.acquire(make_options())
+        pool.release(first)
+        second = pool.acquire(make_options())
+        
+        assert second is first
+        assert pool.stats["created"] == 1
+        assert pool.stats["reused"] == 1
+    
+    def test_different_options_not_shared(self):
+        """異なるcapabilitiesのセッションは共有されない"""
+        pool = SessionPool()
+        first = pool.acquire(make_options("com.a"))
+        pool.release(first)
+        second = pool.acquire(make_options("com.b"))
+        
+        assert second is not first
+        assert pool.stats["created"] == 2
+    
+    def test_unhealthy_session_replaced(self):
+        """ヘルスチェックに失敗したセッションは破棄される"""
+        pool = SessionPool()
+        first = pool.acquire(make_options())
+        pool.release(first)
+        first.alive = False
+        
+        second = pool.acquire(make_options())
+        assert second is not first
+        assert first.quit_called
+        assert pool.stats["unhealthy"] == 1
+    
+    def test_idle_eviction(self):
+        """max_idle_secondsを超えたセッションは終了される"""
+        pool = SessionPool(max_idle_seconds=0)
+        first = pool.acquire(make_options())
+        pool.release(first)
+        
+        assert pool.evict_idle() == 1
+        assert first.quit_called
+        assert pool.idle_count() == 0
+    
+    def test_close_quits_idle_sessions(self):
+        pool = SessionPool()
+        drivers = [pool.acquire(make_options()) for _ in range(2)]
+        for d in drivers:
+            pool.release(d)
+        pool.close()
+        
+        assert all(d.quit_called for d in drivers)
+        assert pool.idle_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_appium_driver_releases_to_pool():
+    """appium_driver(pool=...) は終了時にquitせずプールへ戻す"""
+    pool = SessionPool()
+    async with session_module.appium_driver(make_options(), pool=pool) as d:
+        assert session_module.driver is d
+    assert not d.quit_called
+    assert session_module.driver is None
+    assert pool.idle_count() == 1
+
+
+@pytest.mark.asyncio
+async def test_thread_without_context_gets_no_driver():
+    """コンテキストを引き継がないスレッドは、他の端末のドライバーを使わずにエラーになる"""
+    errors = []
+
+    def run_tool():
+        try:
+            is_locked.invoke({})
+        except Exception as e:
+            errors.append(e)
+
+    async with session_module.appium_driver(make_options()) as d:
+        assert session_module.current_driver() is d
+        thread = threading.Thread(target=run_tool)
+        thread.start()
+        thread.join()
+    
+    assert isinstance(errors[0], session_module.NoDriverBoundError)
+    # セッションがひとつも開いていなければ従来通り None
+    assert session_module.current_driver() is None
+
+
+class TestSessionRecovery:
+    
+    @pytest.mark.asyncio
+    async def test_tool_retried_after_recovery(self):
+        """InvalidSessionIdExceptionで自動復旧し、ツールを1回だけ再実行する"""
+        async with session_module.appium_driver(make_options(), auto_recover=True) as d:
+            d.alive = False
+            result = is_locked.invoke({})
+            
+            assert "unlocked" in result
+            assert d.session_id == "session-1-recovered"
+            assert d.activated == ["com.android.settings"]  # 前面アプリを復元
+            assert session_module.get_recovery_stats()["recoveries"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_restores_last_activated_app(self):
+        async with session_module.appium_driver(make_options(), auto_recover=True) as d:
+            activate_app.invoke({"app_id": "com.android.chrome"})
+            d.activated.clear()
+            d.alive = False
+            is_locked.invoke({})
+            assert d.activated == ["com.android.chrome"]
+            
+            # 終了したアプリは復元しない
+            terminate_app.invoke({"app_id": "com.android.chrome"})
+            d.activated.clear()
+            d.alive = False
+            is_locked.invoke({})
+            assert d.activated == []
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_failures_recover_once(self):
+        """2つのスレッドが同時に失効を検知しても再作成は1回だけで、古いセッションのキャッシュは破棄される"""
+        async with session_module.appium_driver(make_options(), auto_recover=True) as d:
+            hierarchy.store_snapshot(d, "<hierarchy><node text='old' /></hierarchy>")
+            both_failed = threading.Barrier(2)
+            original = d.is_locked
+
+            def is_locked_after_both_fail():
+                if not d.alive:
+                    both_failed.wait(timeout=5)
+                return original()
+
+            d.is_locked = is_locked_after_both_fail
+            d.alive = False
+            results = []
+            threads = [
+                threading.Thread(target=contextvars.copy_context().run,
+                                 args=(lambda: results.append(is_locked.invoke({})),))
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            assert len(results) == 2 and all("unlocked" in r for r in results)
+            assert d.session_id == "session-1-recovered"
+            assert session_module.get_recovery_stats()["recoveries"] == 1
+            # 古いセッションIDのキャッシュが残らない
+            assert hierarchy.get_snapshot(SimpleNamespace(session_id="session-1")) is None
+    
+    @pytest.mark.asyncio
+    async def test_no_recovery_without_auto_recover(self):
+        """auto_recoverなしでは従来通り例外を再送出する"""
+        async with session_module.appium_driver(make_options()) as d:
+            d.alive = False
+            with pytest.raises(InvalidSessionIdException):
+                is_locked.invoke({})
+        assert session_module.get_recovery_stats() == {}
+
+
+def test_apply_fast_start_profile():
+    options = apply_fast_start_profile(make_options())
+    caps = options.to_capabilities()
+    for name, value in FAST_START_CAPABILITIES.items():
+        assert caps[name] == value
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
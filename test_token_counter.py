@@ -0,0 +1,160 @@
+"""
+Test program for TiktokenCountCallback streaming/latency metrics
+ストリーミング時のTTFT・トークン生成速度、usage_metadataからの使用量取得、ツールのレイテンシ集計をテスト
+"""
+
+import time
+import uuid
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, LLMResult
+from appium_tools.token_counter import TiktokenCountCallback, count_message_tokens, count_messages_tokens
+
+
+def usage_response(input_tokens, output_tokens, cache_read=0):
+    """llm_outputを持たない（ストリーミング時の）レスポンス"""
+    message = AIMessage(content="ok", usage_metadata={
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "input_token_details": {"cache_read": cache_read},
+    })
+    return LLMResult(generations=[[ChatGeneration(message=message)]])
+
+
+class UsageStreamingFakeChatModel(GenericFakeChatModel):
+    """最後のチャンクでusage_metadataを返す（OpenAIのstream_usageと同じ）フェイク"""
+
+    def _stream(self, *args, **kwargs):
+        yield from super()._stream(*args, **kwargs)
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata={
+            "input_tokens": 12, "output_tokens": 3, "total_tokens": 15,
+        }))
+
+
+class TestStreamingMetrics:
+
+    def test_ttft_and_token_rate_recorded_per_run(self):
+        counter = TiktokenCountCallback(model="gpt-4.1")
+        run_id = uuid.uuid4()
+        counter.on_llm_start({}, ["prompt"], run_id=run_id)
+        time.sleep(0.05)
+        for token in ["a", "b", "c", "d", "e"]:
+            counter.on_llm_new_token(token, run_id=run_id)
+            time.sleep(0.01)
+        counter.on_llm_end(usage_response(100, 5), run_id=run_id)
+
+        record = counter.get_latest_invocation()
+        assert record["ttft_seconds"] >= 0.05
+        assert record["tokens_per_second"] > 0
+        assert record["input_tokens"] == 100 and record["output_tokens"] == 5
+
+    def test_non_streaming_call_has_no_ttft(self):
+        counter = TiktokenCountCallback(model="gpt-4.1")
+        counter.on_llm_start({}, ["prompt"])
+        counter.on_llm_end(usage_response(10, 2, cache_read=4))
+
+        record = counter.get_latest_invocation()
+        assert record["ttft_seconds"] is None
+        assert record["cached_tokens"] == 4
+
+    def test_missing_usage_falls_back_to_estimate(self):
+        counter = TiktokenCountCallback(model="gpt-4.1")
+        counter.on_llm_start({}, ["prompt " * 40])
+        counter.on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content="x" * 40))]]))
+
+        record = counter.get_latest_invocation()
+        assert record["usage_estimated"] is True
+        assert record["input_tokens"] == record["estimated_input_tokens"] > 0
+        assert record["output_tokens"] > 0
+
+    def test_missing_usage_without_start_raises(self):
+        counter = TiktokenCountCallback(model="gpt-4.1")
+        with pytest.raises(ValueError):
+            counter.on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content="x"))]]))
+
+    @pytest.mark.asyncio
+    async def test_streaming_chat_model_reports_tokens(self):
+        """実際のチャットモデルのストリーミングでon_llm_new_tokenが呼ばれ、TTFTと使用量が記録される"""
+        counter = TiktokenCountCallback(model="gpt-4.1")
+        model = UsageStreamingFakeChatModel(messages=iter([AIMessage(content="hello streaming world")]))
+        chunks = [chunk async for chunk in model.astream("hi", config={"callbacks": [counter]})]
+
+        assert len(chunks) > 1
+        record = counter.get_latest_invocation()
+        assert record["ttft_seconds"] is not None
+        assert record["input_tokens"] == 12
+
+
+class TestEstimator:
+
+    def test_chat_messages_and_tool_schemas_counted_before_the_call(self):
+        counter = TiktokenCountCallback(model="gpt-4.1")
+        messages = [HumanMessage(content="Open Wi-Fi settings"), AIMessage(content="", tool_calls=[
+            {"name": "click_element", "args": {"by": "xpath", "value": '//*[@text="Wi-Fi"]'}, "id": "1"}])]
+        tools = [{"type": "function", "function": {"name": "click_element", "parameters": {}}}]
+        run_id = uuid.uuid4()
+        counter.on_chat_model_start({}, [messages], run_id=run_id, invocation_params={"tools": tools})
+        counter.on_llm_end(usage_response(500, 5), run_id=run_id)
+
+        record = counter.get_latest_invocation()
+        assert record["estimated_input_tokens"] == count_messages_tokens(messages) + record["tool_schema_tokens"]
+        assert record["predicted_input_cost_usd"] > 0
+        # usageが返った場合は実際の値を使う
+        assert record["input_tokens"] == 500 and record["usage_estimated"] is False
+
+    def test_predict_cost(self):
+        counter = TiktokenCountCallback(model="gpt-4.1")
+        prediction = counter.predict_cost([HumanMessage(content="hello " * 1000)], expected_output_tokens=100)
+        assert prediction["input_tokens"] > 1000
+        assert prediction["total_cost_usd"] == pytest.approx(
+            prediction["input_tokens"] / 1000 * 0.002 + 100 / 1000 * 0.008, abs=1e-6)
+
+    def test_message_counts_are_memoized(self):
+        message = HumanMessage(content="memoized " * 500)
+        first = count_message_tokens(message)
+        started = time.perf_counter()
+        for _ in range(1000):
+            assert count_message_tokens(message) == first
+        # 1000回の再計算がキャッシュで軽い（エンコードし直していない）
+        assert time.perf_counter() - started < 0.5
+
+
+class TestLatencyBreakdown:
+
+    def test_tool_time_separated_from_model_time(self):
+        counter = TiktokenCountCallback(model="gpt-4.1")
+        counter.on_llm_start({}, ["prompt"])
+        counter.on_llm_end(usage_response(10, 2))
+
+        tool_run = uuid.uuid4()
+        counter.on_tool_start({"name": "get_page_source"}, "{}", run_id=tool_run)
+        time.sleep(0.02)
+        counter.on_tool_end("xml", run_id=tool_run)
+
+        failed_run = uuid.uuid4()
+        counter.on_tool_start({"name": "click_element"}, "{}", run_id=failed_run)
+        counter.on_tool_error(RuntimeError("boom"), run_id=failed_run)
+
+        latency = counter.get_latency_breakdown()
+        assert latency["tool_calls"] == 2
+        assert latency["tools"]["get_page_source"] >= 0.02
+        assert counter.tool_history[1]["error"] is True
+
+        # 2回目のクエリには1回目のツール呼び出しを含めない
+        counter.on_llm_start({}, ["prompt"])
+        counter.on_llm_end(usage_response(10, 2))
+        assert counter.get_latency_breakdown(start_index=1)["tool_calls"] == 0
+
+    def test_reset_clears_tool_history(self):
+        counter = TiktokenCountCallback(model="gpt-4.1")
+        run_id = uuid.uuid4()
+        counter.on_tool_start({"name": "is_locked"}, "{}", run_id=run_id)
+        counter.on_tool_end("unlocked", run_id=run_id)
+        counter.reset_counters()
+        assert counter.tool_history == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
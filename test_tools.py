@@ -11,13 +11,18 @@ from appium_tools import (
     find_element,
     click_element,
     get_page_source,
+    get_page_changes,
     take_screenshot,
     scroll_element,
     scroll_to_element,
+    check_screen_changed,
     get_current_app,
     get_text,
     press_keycode,
     double_tap,
+    long_press,
+    pinch,
+    drag_and_drop,
     send_keys,
     activate_app,
     terminate_app,
@@ -179,6 +184,36 @@ async def test_send_keys(driver_session):
         pytest.skip("Search bar title not found")
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["mobile_type", "set_value", "paste"])
+async def test_send_keys_fast_modes(driver_session, mode):
+    """Test send_keys fast input modes (fall back to typing if the field rejects them)."""
+    click_result = click_element.invoke({
+        "by": "id",
+        "value": "com.android.settings:id/search_bar_title"
+    })
+    
+    if "successfully clicked" in click_result.lower():
+        await asyncio.sleep(1)
+        
+        result = send_keys.invoke({
+            "by": "id",
+            "value": "com.google.android.settings.intelligence:id/open_search_view_edit_text",
+            "text": "bluetooth",
+            "mode": mode
+        })
+        assert "successfully sent keys" in result.lower()
+        assert "mode:" in result
+        
+        await asyncio.sleep(1)
+        press_keycode.invoke({"keycode": 4})
+        await asyncio.sleep(0.5)
+        press_keycode.invoke({"keycode": 4})
+        await asyncio.sleep(0.5)
+    else:
+        pytest.skip("Search bar title not found")
+
+
 @pytest.mark.asyncio
 async def test_navigation_flow(driver_session):
     """Test a complete navigation flow."""
@@ -228,6 +263,37 @@ async def test_double_tap(driver_session):
     await asyncio.sleep(0.5)
 
 
+@pytest.mark.asyncio
+async def test_long_press(driver_session):
+    """Test long_press tool."""
+    result = long_press.invoke({"by": "xpath", "value": "//*[@text='Network & internet']", "duration_ms": 800})
+    assert "long pressed" in result.lower() or "not found" in result.lower()
+    await asyncio.sleep(0.5)
+    press_keycode.invoke({"keycode": 4})
+    await asyncio.sleep(0.5)
+
+
+@pytest.mark.asyncio
+async def test_pinch(driver_session):
+    """Test pinch tool."""
+    result = pinch.invoke({"by": "xpath", "value": "//*[@scrollable='true']", "zoom": "out"})
+    assert "pinched out" in result.lower() or "not found" in result.lower()
+    await asyncio.sleep(0.5)
+
+
+@pytest.mark.asyncio
+async def test_drag_and_drop(driver_session):
+    """Test drag_and_drop tool (Settings has no drop targets, so just check it runs)."""
+    result = drag_and_drop.invoke({
+        "by": "xpath",
+        "value": "//*[@text='Apps']",
+        "target_by": "xpath",
+        "target_value": "//*[@text='Network & internet']",
+    })
+    assert "dragged" in result.lower() or "not found" in result.lower()
+    await asyncio.sleep(0.5)
+
+
 @pytest.mark.asyncio
 async def test_scroll_to_element(driver_session):
     """Test scroll_to_element tool."""
@@ -242,6 +308,33 @@ async def test_scroll_to_element(driver_session):
     await asyncio.sleep(0.5)
 
 
+@pytest.mark.asyncio
+async def test_get_page_changes(driver_session):
+    """Test get_page_changes tool returns full source first, then only the delta."""
+    result = get_page_changes.invoke({})
+    assert "page source retrieved successfully" in result.lower()
+    
+    result = get_page_changes.invoke({})
+    assert "no changes" in result.lower() or "page changes" in result.lower()
+
+
+@pytest.mark.asyncio
+async def test_check_screen_changed(driver_session):
+    """Test check_screen_changed tool and click_element(verify_change=True)."""
+    result = check_screen_changed.invoke({})
+    assert "baseline recorded" in result.lower()
+    
+    result = check_screen_changed.invoke({})
+    assert "unchanged" in result.lower() or "changed" in result.lower()
+    
+    click_result = click_element.invoke({"by": "xpath", "value": "//*[@text='Apps']", "verify_change": True})
+    if "clicked" in click_result.lower():
+        assert "screen changed" in click_result.lower() or "did not change" in click_result.lower()
+        await asyncio.sleep(0.5)
+        press_keycode.invoke({"keycode": 4})
+        await asyncio.sleep(0.5)
+
+
 @pytest.mark.asyncio
 async def test_activate_terminate_app(driver_session):
     """Test activate_app and terminate_app tools."""
@@ -272,6 +365,24 @@ async def test_list_apps(driver_session):
     assert "com.android.settings" in result.lower() or "com.google" in result.lower()
 
 
+@pytest.mark.asyncio
+async def test_list_apps_filters(driver_session):
+    """Test list_apps filtering, pagination and version metadata."""
+    result = list_apps.invoke({"name_filter": "settings", "limit": 5, "include_versions": True})
+    if "adb_shell" in result.lower() and "not been enabled" in result.lower():
+        pytest.skip("adb_shell feature not enabled in Appium server")
+    assert "com.android.settings" in result
+    assert "versionName=" in result
+    
+    # Paginated output is bounded by limit
+    page = list_apps.invoke({"limit": 3})
+    assert len(page.strip().split("\n")) <= 5  # header + 3 apps + "more" footer
+    
+    # Invalid regex is reported instead of raising
+    invalid = list_apps.invoke({"name_filter": "[", "use_regex": True})
+    assert "invalid regex" in invalid.lower()
+
+
 @pytest.mark.asyncio
 async def test_get_device_info(driver_session):
     """Test get_device_info tool."""
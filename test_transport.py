@@ -0,0 +1,81 @@
+"""
+Test program for PooledTransport connection reuse
+ローカルのフェイクAppiumサーバーに対して、接続の再利用と統計をテスト
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from appium import webdriver
+from appium.options.android import UiAutomator2Options
+from appium_tools.transport import PooledTransport
+
+
+class FakeAppiumHandler(BaseHTTPRequestHandler):
+    """新規セッション作成・timeouts取得・セッション削除だけに応答するフェイク"""
+    
+    protocol_version = "HTTP/1.1"  # keep-alive を有効にする
+    
+    def _reply(self, value):
+        body = json.dumps({"value": value}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply({"sessionId": "fake-session", "capabilities": {}})
+    
+    def do_GET(self):
+        self._reply({"implicit": 0, "pageLoad": 0, "script": 0})
+    
+    def do_DELETE(self):
+        self._reply(None)
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAppiumHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_connections_reused_across_sessions(fake_server_url):
+    """同じtransportを共有するセッション間でTCP接続が再利用される"""
+    transport = PooledTransport(maxsize=2)
+    
+    for _ in range(3):
+        driver = webdriver.Remote(transport.connection(fake_server_url), options=UiAutomator2Options())
+        for _ in range(5):
+            _ = driver.timeouts
+        driver.quit()
+    
+    stats = transport.get_stats()
+    assert stats["requests"] == 3 * (1 + 5 + 1)  # new session + 5 GETs + quit
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == stats["requests"] - 1
+    transport.close()
+
+
+def test_quit_does_not_close_shared_pool(fake_server_url):
+    """driver.quit()で共有プールの接続が閉じられない"""
+    transport = PooledTransport()
+    first = webdriver.Remote(transport.connection(fake_server_url), options=UiAutomator2Options())
+    second = webdriver.Remote(transport.connection(fake_server_url), options=UiAutomator2Options())
+    first.quit()
+    _ = second.timeouts
+    second.quit()
+    assert transport.get_stats()["connections_opened"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])